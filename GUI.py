@@ -26,10 +26,9 @@
 
 # custom libraries
 import colors_recognition as cam        # recognize cube status via a webcam (by Andrea Favero)
-import Cubotino_moves as cm          # translate a cube solution into CUBOTino robot moves (by Andrea Favero)
-import twophase.solver as sv                  # Kociemba solver library (by Hergbert Kociemba)
-import twophase.face                          # Kociemba solver library (by Hergbert Kociemba)
-import twophase.cubie                         # Kociemba solver library (by Hergbert Kociemba)
+import robot_moves as cm             # translate a cube solution into robot moves (by Andrea Favero)
+import cube_simulator as sim         # facelets permutations of the robot moves
+import solver_server as ss                    # solver server process, loading the Kociemba solver tables once
 print()
 
 # python libraries, normally distributed with python
@@ -41,6 +40,7 @@ import time                          #
 import json                          # Serialize and Deserialize json objects
 import requests                      # HTTP requests library to communicate with nodeMCU
 import os                            # os is imported to ensure the file presence, check/make
+import queue                         # queue with the solutions streamed by the background solver
 
 # python library, to be installed (pyserial)
 import serial.tools.list_ports
@@ -112,6 +112,15 @@ serialData=False               # boolean variable to track when the serial data
 robot_moves=""                 # string variable holding all the robot moves (robot manoeuvres)
 cube_status={}                 # dictionary variable holding the cube status, for GUI update to robot permutations
 left_moves={}                  # dictionary holding the remaining robot moves
+elapsed_time={}                # dictionary holding the estimated elapsed time (ms) once each robot move is completed
+tot_time=0                     # estimated robot time (ms) to execute all the robot moves
+solve_queue=queue.Queue()      # queue with the solutions streamed by the background solver, to the GUI
+solve_cancel=threading.Event() # event to cancel the background solving in progress
+solve_max_length=18            # max face turns of the solutions requested to the solver
+solve_enable_length=16         # max face turns of a solution, to enable the robot button while the solver still runs
+solver_warm=threading.Event()  # event set once the solver warm-up (server start and tables loading) has finished
+solver_status="loading"        # solver status after the warm-up (loading, ready, not available)
+SOLVER_WARMUP_TIME=3600        # max time (s) for the solver warm-up, the tables are generated at the very first start
 
 
 timestamp = dt.datetime.now().strftime('%Y%m%d_%H%M%S')    # timestamp used on logged data and other locations
@@ -353,8 +362,8 @@ def get_definition_string():
 def solve():
     """Connect to Kociemba solver to get the solving maneuver."""
     
-    global cols, sv, b_read_solve, cube_solving_string, cube_defstr
-    global cube_status, robot_moves, tot_moves, previous_move
+    global cols, b_read_solve, cube_solving_string, cube_defstr
+    global cube_status, robot_moves, tot_moves, previous_move, solve_cancel
     
     b_robot["state"] = "disable"         # GUI robot button is disabled at solve() function start
     b_robot["relief"] = "sunken"         # GUI robot button is sunk at solve() function start
@@ -401,43 +410,151 @@ def solve():
         show_text("Invalid facelet configuration.\nWrong or missing colors.")  # feedback to user
         return  # function is terminated
     
-    # Kociemba TwophaseSolver, running locally, is called with max_length=18 or timeout=2s and best found within timeout
-    cube_solving_string = sv.solve(cube_defstr.strip(), 18 , 2)
+    # Kociemba TwophaseSolver, running locally, is called with max_length=18 and adaptive solving time: the cube is solved
+    # from all the 24 orientations in parallel, on a background thread that streams the solutions with lower robot time
+    cancel_solve()                                   # eventual solving in progress (from a previous cube) is cancelled
+    solve_cancel=threading.Event()                   # new cancel event, for this solving
+    worker=threading.Thread(target=solve_worker, args=(cube_defstr.strip(), robot_settings, solve_cancel), daemon=True)
+    worker.start()                                   # background solving is started
+    if solver_warm.is_set():                         # case the solver is ready
+        show_text('Solving...\n')                    # feedback to user
+    else:                                            # case the solver warm-up is still in progress
+        show_text('Solving... (waiting for the solver tables)\n')   # feedback to user
+    gui_f2.after(100, solve_poll, solve_cancel)      # solutions are checked periodically, from the GUI thread
     
-    if cube_defstr=="":                                             # case there is no cube status string
-        show_text("Invalid facelet configuration.\nWrong or missing colors.")  # feedback to user
-    else:                                                           # case there is a cube status string
-        if not gui_scramble_var.get():                              # case the scramble check box is not checked 
-            show_text(f'Cube solution: {cube_solving_string}\n\n')  # solving string is printed on GUI text windows
-        if gui_scramble_var.get():                                  # case the scramble check box is checked
-            s = cube_solving_string                                 # shorter local variable name     
-            s_start = s.find('(')                                   # position of open parenthesys in data
-            s_end = s.find(')')                                     # position of close parenthesys in data
-            manoeuvres = s[s_start+1:s_end-1]                       # cube manoeuvres are sliced from the cube solution
-            show_text(f'Cube manoeuvres: {manoeuvres}\n\n')         # number of manoeuvres is printed on GUI text windows
-            
+    gui_f2.update()                     # GUI f2 part is updated, to release eventual clicks on robot button
+    gui_robot_btn_update()              # updates the cube related buttons status
+    draw_cubotino_center_colors()       # draw the cube center facelets with related colors, at Cubotino sketch
 
-        
-    if not 'Error' in cube_solving_string and len(cube_solving_string)>4:   # case there is a cube to be solved
-        pos=cube_solving_string.find('(')      # position of the "(" character in the string
-        solution=cube_solving_string[:pos]     # string is sliced, by removing the additional info from Kociemba solver
-        solution=solution.replace(" ","")      # empty spaces are removed
-        
-        # robot moves dictionary, and total robot moves, are retrieved from the imported Cubotino_moves script
-        robot_moves_dict, robot_moves, tot_moves = cm.robot_required_moves(solution, "")
-        if not gui_scramble_var.get():                       # case the scramble check box is not checked
-            show_text(f'Robot moves: {robot_moves}\n')       # robot moves string is printed on the text window
-        else:                                                # case the scramble check box is checked
-            show_text(f'Robot moves: As per random cube\n')  # robot moves string is printed on the text window
 
-        for key in range(len(cube_defstr.strip())):          # iteration over the cube status string
-            cube_status[key]=cube_defstr[key]                # dict generation
-        previous_move=0                                      # previous move set to zero
 
-    gui_f2.update()                     # GUI f2 part is updated, to release eventual clicks on robot button
-    b_robot["state"] = "active"         # GUI robot button is activated after solve() function
-    b_robot["relief"] = "raised"        # GUI robot button is raised after solve() function
-    gui_robot_btn_update()              # updates the cube related buttons status
+
+
+
+def solve_worker(cubestring, robot_settings, cancel):
+    """Background thread, solving the cube and translating each improving solution into robot moves.
+       Results are put on the solve_queue, together with the cancel event to recognize the superseded solvings."""
+    
+    def report(solution, robot_time, final):
+        if cancel.is_set():                                 # case the solving has been cancelled
+            return
+        robot_moves_dict, robot_moves, tot_moves = {}, "", 0
+        if not 'Error' in solution and len(solution)>4:     # case there is a cube to be solved
+            pos=solution.find('(')                          # position of the "(" character in the string
+            # robot moves dictionary, and total robot moves, are retrieved from the imported robot_moves script: the
+            # robot translates the solution string on its own (moves_dict), the planner is not used to keep the
+            # progress bar, the remaining time and the cube sketch animation matching the robot movements
+            robot_moves_dict, robot_moves, tot_moves = cm.robot_required_moves(solution[:pos].replace(" ",""), "",
+                                                                               planner=False,
+                                                                               robot_settings=robot_settings)
+        solve_queue.put((cancel, solution, robot_moves_dict, robot_moves, tot_moves, final))
+    
+    while not solver_warm.wait(0.1):                        # case the solver warm-up is still in progress
+        if cancel.is_set():                                 # case the queued solving has been cancelled
+            return
+    ss.solve_anytime(cubestring, report, solve_max_length, None, robot_settings, ss.all_orientations, cancel)   # adaptive time
+
+
+
+
+
+
+def solver_warmup():
+    """Background thread, starting the solver server (that loads, or generates, the solver tables) and connecting to it.
+       Solvings requested meanwhile are queued, as solve_worker waits for the solver_warm event."""
+    
+    global solver_status
+    
+    try:
+        if ss.warmup(wait=SOLVER_WARMUP_TIME):              # solver server is started, when not running yet
+            solver_status = "ready"                         # the solver is ready
+        else:                                               # case the solver server can't be reached
+            solver_status = "not available"                 # solvings will get an error feedback
+    finally:
+        solver_warm.set()                                   # queued solvings can proceed, in any case
+
+
+
+
+
+
+def solver_status_poll():
+    """Updates the solver readiness indicator, until the solver warm-up has finished."""
+    
+    if solver_status == "ready":                            # case the solver is ready
+        gui_solver_label.configure(text="solver: ready", fg="green4")
+    elif solver_status == "not available":                  # case the solver could not be started
+        gui_solver_label.configure(text="solver: not available", fg="red")
+    else:                                                   # case the solver is still loading
+        dots = "." * (1 + int(time.time()) % 3)             # animated dots, as feedback the loading is in progress
+        gui_solver_label.configure(text=f"solver: loading{dots}", fg="gray40")
+    if not solver_warm.is_set():                            # case the warm-up is still in progress
+        root.after(500, solver_status_poll)                 # readiness indicator is updated again later
+
+
+
+
+
+
+def cancel_solve():
+    """Cancels the background solving in progress, i.e. when the cube sketch is changed, or data is sent to the robot."""
+    
+    solve_cancel.set()                  # the background solver stops, and its remaining results are discarded
+
+
+
+
+
+
+def solve_poll(current):
+    """Checks the solutions streamed by the background solver, and updates the GUI: the robot button is enabled as
+       soon as a solution has solve_enable_length face turns or less (solutions up to solve_max_length are streamed),
+       or once the solver has finished. Solver errors never enable the robot button.
+       Argument is the cancel event of the solving to poll: the polling stops once that solving is superseded."""
+    
+    global cube_solving_string, robot_moves, tot_moves, cube_status, previous_move
+    
+    if current is not solve_cancel or current.is_set(): # case the solving has been superseded, or cancelled
+        return
+    
+    final=False                                         # boolean to track the solver end
+    while not solve_queue.empty():                      # iteration over the streamed solutions
+        cancel, solution, robot_moves_dict, moves, moves_amount, final = solve_queue.get()
+        if cancel is not solve_cancel or cancel.is_set():   # case of a superseded, or cancelled, solving
+            final=False
+            continue
+        
+        error=solution[:5]=='Error'                      # case the solver returned an error
+        pos=solution.find('(')                          # position of the "(" character in the string
+        length=int(solution[pos+1:solution.find('f)')]) if pos>=0 and 'f)' in solution else None
+        gui_text_window.delete(1.0, tk.END)             # clears output window
+        if not gui_scramble_var.get():                  # case the scramble check box is not checked
+            show_text(f'Cube status: {cube_defstr}\n')  # cube status string is printed on the text window
+            show_text(f'Cube solution: {solution}\n\n') # solving string is printed on GUI text windows
+            show_text(f'Robot moves: {moves}\n')        # robot moves string is printed on the text window
+        else:                                           # case the scramble check box is checked
+            show_text(f'Cube status: Random\n')         # random cube status is printed on the text window
+            show_text(f'Cube manoeuvres: {solution if error else length}\n\n') # number of manoeuvres (or error) is printed
+            show_text(f'Robot moves: As per random cube\n')   # robot moves string is printed on the text window
+        if not final:                                   # case the solver is still running
+            show_text('\nSolving... (improving the robot time)\n')   # feedback to user
+        
+        if error:                                       # case of solver error, nothing can be sent to the robot
+            cube_solving_string=""                      # no solution for the robot button
+            gui_robot_btn_update()                      # updates the cube related buttons status
+        elif final or (length is not None and length<=solve_enable_length):   # case the solution is good enough for the robot
+            cube_solving_string=solution                # solution is made available to the robot button
+            robot_moves, tot_moves = moves, moves_amount
+            for key in range(len(cube_defstr.strip())): # iteration over the cube status string
+                cube_status[key]=cube_defstr[key]       # dict generation
+            previous_move=0                             # previous move set to zero
+            gui_robot_btn_update()                      # updates the cube related buttons status
+        
+        if final:                                       # case the solver has finished
+            break
+    
+    if not final:                                       # case the solver is still running
+        gui_f2.after(100, solve_poll, current)          # solutions are checked again later
 
 
 
@@ -450,6 +567,7 @@ def clean():
     global cols, cube_solving_string
     
     cube_solving_string=""               # empty string variable to later hold the cube solution
+    cancel_solve()                       # eventual solving in progress is cancelled
     gui_text_window.delete(1.0, tk.END)  # clears the text window
     gui_scramble_var.set(0)
     
@@ -476,6 +594,7 @@ def empty():
     global cols, cube_solving_string
     
     cube_solving_string=""                # empty string variable to later hold the cube solution
+    cancel_solve()                        # eventual solving in progress is cancelled
     gui_text_window.delete(1.0, tk.END)   # clears the text window
     
     gui_scramble_var.set(0)
@@ -502,9 +621,11 @@ def random():
     global gui_read_var, cube_solving_string, cols, gui_buttons_state
     
     cube_solving_string=""                   # cube solving string is set empty
+    cancel_solve()                           # eventual solving in progress is cancelled
     gui_text_window.delete(1.0, tk.END)      # clears the text window
     gui_buttons_state = gui_buttons_for_cube_status("disable")   # GUI buttons (cube-status) are disabled
     
+    import twophase.cubie as cubie           # Kociemba solver library (by Hergbert Kociemba), loaded when needed
     cc = cubie.CubieCube()                   # cube in cubie reppresentation
     cc.randomize()                           # randomized cube in cubie reppresentation 
     fc = cc.to_facelet_cube()                # randomized cube is facelets reppresentation string
@@ -577,6 +698,7 @@ def click(event):
             gui_canvas.itemconfig("current", width=5, fill=curcol, outline="Grey55")
         
         elif idlist[0] not in faceletter_id:                 # case the widget is not one of the six color picking palette
+            cancel_solve()                                   # solving in progress is superseded by the sketch change
             gui_canvas.itemconfig("current", fill=curcol)    # that widget is filled with the "current color"
     
     draw_cubotino_center_colors()         # draw the cube center facelets with related colors, at Cubotino sketch
@@ -609,6 +731,7 @@ def scroll(event):
                 
                 last_col=last_col+delta                     # color number is incremented/decrement by the scroll
                 last_col=last_col%6                         # scroll limited within the range of six
+                cancel_solve()                              # solving in progress is superseded by the sketch change
                 gui_canvas.itemconfig("current", fill=cols[last_col]) # current facelet is filled with scrolled color
 
             if facelet in (5,14,23):            # case the facelet is a URF face center
@@ -664,6 +787,7 @@ def robot_solver():
             if sr[0]!="<" and sr[-1:]!=">":               # case the string isn't contained by '<' and '>' characters
                 sr = "<" + sr +">"                        # starting '<' and ending '>' chars are added
             cube_solving_string_robot = sr                # global variable is updated
+            cancel_solve()                                # the solution sent to the robot is not changed anymore
             
             try:
                 ser.write((sr+"\n").encode())             # attempt to send the solving string to the robot      
@@ -685,10 +809,13 @@ def robot_solver():
 
 
 def left_Cubotino_moves(robot_moves):
-    """ Generates dict with the remaining servo moves, based on the moves string.
+    """ Generates dict with the remaining servo moves, and the estimated elapsed time, based on the moves string.
         This is later used to keep track of the robot solving progress."""
     
-    global tot_moves, left_moves
+    global tot_moves, left_moves, elapsed_time, tot_time
+    
+    # estimated elapsed time per move index, and total time, are retrieved from the robot_moves servos timing model
+    time_per_move, elapsed_time, tot_time = cm.robot_moves_time(robot_moves, robot_settings)
     
     left_moves={}                                       # empty dict to store the left moves 
     remaining_moves=tot_moves                           # initial remaining moves are all the moves
@@ -807,23 +934,17 @@ def gui_robot_btn_update():
 
 def cube_facelets_permutation(cube_status, move_type, direction):
     """Function that updates the cube status, according to the move type the robot does
-       The 'ref' tuples provide the facelet current reference position to be used on the updated position.
+       The 'ref' tuples (from cube_simulator) provide the facelet current reference position to be used on the updated position.
        As example, in case of flip, the resulting facelet 0 is the one currently in position 53 (ref[0])."""
     
     if move_type == 'flip':      # case the robot move is a cube flip (complete cube rotation around L-R horizontal axis) 
-        ref=(53,52,51,50,49,48,47,46,45,11,14,17,10,13,16,9,12,15,0,1,2,3,4,5,6,7,8,             18,19,20,21,22,23,24,25,26,42,39,36,43,40,37,44,41,38,35,34,33,32,31,30,29,28,27)
+        ref=sim.facelets_perm['F1']
     
     elif move_type == 'spin':    # case the robot move is a spin (complete cube rotation around vertical axis)
-        if direction == '1':     # case spin is CW
-            ref=(2,5,8,1,4,7,0,3,6,18,19,20,21,22,23,24,25,26,36,37,38,39,40,41,42,43,44,                33,30,27,34,31,28,35,32,29,45,46,47,48,49,50,51,52,53,9,10,11,12,13,14,15,16,17)
-        elif direction == '3':      # case spin is CCW
-            ref=(6,3,0,7,4,1,8,5,2,45,46,47,48,49,50,51,52,53,9,10,11,12,13,14,15,16,17,                29,32,35,28,31,34,27,30,33,18,19,20,21,22,23,24,25,26,36,37,38,39,40,41,42,43,44)
+        ref=sim.facelets_perm['S'+direction]     # direction '1' is CW, '3' is CCW
     
     elif move_type == 'rotate':  # case the robot move is a rotation (lowest layer rotation versus mid and top ones) 
-        if direction == '1':     # case 1st layer rotation is CW
-            ref=(0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,24,25,26,18,19,20,21,22,23,42,43,44,                33,30,27,34,31,28,35,32,29,36,37,38,39,40,41,51,52,53,45,46,47,48,49,50,15,16,17)
-        elif direction == '3':   # case 1st layer rotation is CCW
-            ref=(0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,51,52,53,18,19,20,21,22,23,15,16,17,                29,32,35,28,31,34,27,30,33,36,37,38,39,40,41,24,25,26,45,46,47,48,49,50,42,43,44)
+        ref=sim.facelets_perm['R'+direction]     # direction '1' is CW, '3' is CCW
     
     new_status={}                # empty dict to generate the cube status, updated according to move_type and direction
     for i in range(54):                    # iteration over the 54 facelets
@@ -841,6 +962,9 @@ def animate_cube_sketch(move_index):
     
     global cube_status, robot_moves, previous_move
     
+    if move_index+1 >= len(robot_moves): # case the move index is out of the robot moves string (i.e. not matching)
+        return                           # function is returned, as there is no robot move to animate
+    
     if move_index >= previous_move or move_index==0:    # case there is a new move (or the first one)
         i=move_index                     # shorther variable name
         if robot_moves[i]=='F':          # case there is a flip on the move string
@@ -938,10 +1062,15 @@ def cube_read_solve():
 
 
 def progress_percent(move_index):
-    """Returns the robot solving progress, in percentage."""
+    """Returns the robot solving progress, in percentage of the estimated robot time."""
     
-    global tot_moves, left_moves
+    global tot_moves, left_moves, elapsed_time, tot_time
     
+    if tot_time>0:                                      # case the robot time has been estimated
+        elapsed=elapsed_time.get(move_index, tot_time)  # moves index out of the estimated moves is considered as completed
+        return str(int(100*elapsed/tot_time))           # returns a string with the integer of the solving percentage
+    if tot_moves==0 or move_index not in left_moves:    # case the move index is not among the estimated moves
+        return "100"                                    # the robot is considered at the end of the solving
     remaining_moves= left_moves[move_index]             # remaining moves are retrived from the left moves dict
     return str(int(100*(1-remaining_moves/tot_moves)))  # returns a string with the integer of the solving percentage
 
@@ -950,6 +1079,19 @@ def progress_percent(move_index):
 
 
 
+def progress_eta(move_index):
+    """Returns the estimated remaining robot time, in seconds, once the move at move_index is completed."""
+    
+    global elapsed_time, tot_time
+    
+    elapsed=elapsed_time.get(move_index, tot_time)      # moves index out of the estimated moves is considered as completed
+    return str(round((tot_time-elapsed)/1000))          # returns a string with the remaining seconds
+
+
+
+
+
+
 def progress_update(received):
     """Function that updates the robot progress bar and the progress label
        Argument is the robot_move string index of the last move.
@@ -958,18 +1100,17 @@ def progress_update(received):
     global gui_prog_label_text, gui_prog_label
     
     if not 'end' in received:                             # case the robot is still running                    
-        move_index=int(received[2:])                      # string part with the progress value
-        percent=progress_percent(move_index)              # percentage is calclated
         try:
+            move_index=int(received[2:])                  # string part with the progress value
+            percent=progress_percent(move_index)          # percentage is calclated
             gui_prog_bar["value"]=percent                 # progress bar is set to the percentage value
-            gui_prog_label_text.set(percent+" %")         # progress label is updated with percentage value and simbol  
+            gui_prog_label_text.set(progress_eta(move_index)+" s")  # progress label is updated with the remaining seconds
             if percent=="100":                            # case the solving percentage has reached 100
                 gui_prog_bar["value"]='0'                 # progress bar is set to zero
                 gui_prog_label_text.set("")               # progress label is set empty
+            animate_cube_sketch(move_index)  # cube facelets sketch updates according to the robot move in execution
         except:
             pass
-    
-        animate_cube_sketch(move_index)  # cube facelets sketch updates according to the robot move in execution
 
     elif 'end' in received:                               # case the robot has been stopped                  
         gui_prog_bar["value"]='0'                         # progress bar is set to zero
@@ -1346,6 +1487,7 @@ def close_window():
     except:
         pass
     serialData = False                             # boolean tracking serial comm conditions is set False
+    cancel_solve()                                 # eventual solving in progress is cancelled
     root.destroy()                                 # GUI is closed
 
 
@@ -1650,6 +1792,10 @@ cb_scramble.configure(font=("Arial", "10"))
 cb_scramble.grid(column=1, row=4, sticky="ew", padx=5, pady=5)
 gui_scramble_var.set(0)
 
+# solver readiness indicator
+gui_solver_label = tk.Label(cube_status_label, text="solver: loading.", font=("Arial", "10"), fg="gray40")
+gui_solver_label.grid(column=0, row=5, columnspan=2, sticky="w", padx=10, pady=0)
+
 
 # robot related buttons
 gui_robot_label = tk.LabelFrame(gui_f2, text="Robot", labelanchor="nw", font=("Arial", "12"))
@@ -1918,6 +2064,8 @@ create_facelet_rects(width)                                 # calls the function
 create_colorpick(width)                                     # calls the function to generate the color-picking palette
 threading.Thread(target=update_ips).start()    # calls the function to generate the cube sketch
 root.protocol("WM_DELETE_WINDOW", close_window)             # the function close_function is called when the windows is closed
+threading.Thread(target=solver_warmup, daemon=True).start()  # solver is loaded in background, once the GUI is built
+root.after(500, solver_status_poll)                         # solver readiness indicator is updated from the GUI thread
 root.mainloop()                                             # tkinter main loop
 
 ########################################################################################################################
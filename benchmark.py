@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+#############################################################################################################
+#
+# Benchmark of the solving pipeline, on a corpus of random cubes:
+#  1) random cube states are generated via twophase CubieCube.randomize (reproducible via the seed)
+#  2) each cube is solved via the Kociemba twophase solver (or via cube_solver, ranking the solutions per robot time)
+#  3) each solution is translated into robot moves via robot_moves.robot_required_moves: the moves_dict translation,
+#     as executed by the robot, or the planner (offline analysis) when requested (--planner)
+#  4) each robot program is verified via cube_simulator, to really solve its cube
+#
+# Throughput and latency percentiles are reported per stage, as well as the distribution of the solution length
+# (face turns) versus the robot moves. It runs headless (no GUI, no webcam, no robot).
+# The solutions cache and the near solved cubes index are not used, unless requested (--use-cache): in that case
+# they are loaded before the timed stages, as the orientations process pool is.
+#
+# Usage (from the repo folder, where the solver tables are): python benchmark.py -n 100 --seed 1
+#
+#############################################################################################################
+"""
+
+import argparse                               # command line arguments
+import random                                 # random is seeded, to generate reproducible cube corpora
+import time                                   # time library, to measure each stage
+import statistics                             # mean values
+import cube_solver as cs                      # solution with the lowest robot time, among the solver candidates
+import twophase.cubie as cubie                # Kociemba solver library (by Hergbert Kociemba)
+import twophase.solver as sv                  # Kociemba solver library (by Hergbert Kociemba)
+import robot_moves as cm                      # translate a cube solution into robot moves
+import cube_simulator as sim                  # verifies the robot moves do solve the cube
+
+
+
+
+
+
+def random_cubes(n, seed):
+    """ Returns a list of n random cube status strings, reproducible via the seed."""
+
+    random.seed(seed)                             # CubieCube.randomize uses the random module
+    cubes = []                                    # list to store the cube status strings
+    for i in range(n):                            # iteration over the amount of cubes
+        cc = cubie.CubieCube()
+        cc.randomize()                            # random cube, all the states have the same probability
+        cubes.append(cc.to_facelet_cube().to_string())
+    return cubes
+
+
+
+
+
+
+def percentile(values, p):
+    """ Returns the p percentile (0 to 100) of a list of values, as per nearest rank method."""
+
+    values = sorted(values)
+    rank = max(1, -(-len(values) * p // 100))     # nearest rank (ceiling), at least the first value
+    return values[int(rank) - 1]
+
+
+
+
+
+
+def stage_report(name, latencies):
+    """ Prints the throughput and the latency percentiles (ms) of a pipeline stage."""
+
+    total = sum(latencies)                        # total time (s) of the stage
+    rate = len(latencies) / total if total > 0 else float('inf')   # cubes per second
+    ms = [1000 * t for t in latencies]            # latencies in ms
+    print(f'{name:<10} {rate:>10.1f} {statistics.mean(ms):>10.1f} {percentile(ms, 50):>10.1f}'
+          f' {percentile(ms, 90):>10.1f} {percentile(ms, 99):>10.1f} {max(ms):>10.1f}')
+
+
+
+
+
+
+def distribution_report(results):
+    """ Prints, per solution length (face turns), the amount of cubes and the robot moves and time statistics."""
+
+    by_length = {}                                # dict with the results per solution length
+    for r in results:                             # iteration over the results
+        by_length.setdefault(r['length'], []).append(r)
+
+    print(f'\n{"turns":>5} {"cubes":>6} {"moves min":>10} {"moves mean":>11} {"moves max":>10} {"moves/turn":>11} {"robot s":>8}')
+    for length in sorted(by_length):              # iteration over the solution lengths
+        rows = by_length[length]
+        moves = [r['robot_moves'] for r in rows]  # robot moves of the cubes with this solution length
+        robot_s = statistics.mean([r['robot_time'] for r in rows]) / 1000
+        ratio = statistics.mean(moves) / length if length > 0 else 0
+        print(f'{length:>5} {len(rows):>6} {min(moves):>10} {statistics.mean(moves):>11.1f} {max(moves):>10}'
+              f' {ratio:>11.2f} {robot_s:>8.1f}')
+
+    turns = sum([r['length'] for r in results])   # total face turns
+    moves = sum([r['robot_moves'] for r in results])   # total robot moves
+    robot_s = statistics.mean([r['robot_time'] for r in results]) / 1000
+    print(f'\nmean face turns: {turns/len(results):.2f}   mean robot moves: {moves/len(results):.2f}'
+          f'   robot moves overhead: {100*(moves/turns-1) if turns else 0:.1f}%   mean robot time: {robot_s:.1f} s')
+
+
+
+
+
+
+def benchmark(n=100, seed=0, max_length=20, timeout=2, planner=False, ranked=False, orientations=None, csv_file=None,
+              use_cache=False):
+    """ Runs the pipeline benchmark on n random cubes, prints the report, and returns the list of results per cube.
+        When ranked is True the solutions are ranked per robot time via cube_solver (eventually from orientations),
+        with the solutions cache and the near solved cubes index only when use_cache is True.
+        The robot moves are the ones executed by the robot (moves_dict), or the planner ones when planner is True."""
+
+    robot_settings = cm.load_robot_settings()     # servos settings from robot_settings.json, or the default ones
+    if ranked and use_cache:                      # case the known solutions are used, loaded before the timing
+        cs.ns.load()
+        cs.sc.load()
+    if ranked and orientations:                   # case of orientations, the process pool is started before the timing
+        cs.start_pool()
+    latencies = {'random':[], 'solve':[], 'translate':[], 'verify':[]}   # latencies (s) per stage
+
+    t = time.perf_counter()
+    cubes = random_cubes(n, seed)                 # random cube status strings
+    latencies['random'] = [(time.perf_counter() - t) / n] * n   # generation time is spread over the cubes
+
+    results = []                                  # list to store the results per cube
+    for cube in cubes:                            # iteration over the cubes
+        t = time.perf_counter()
+        if ranked:                                # case the solutions are ranked per robot time
+            s = cs.solve(cube, max_length, timeout, robot_settings, orientations=orientations, use_cache=use_cache)
+        else:                                     # case the solver is used as it is
+            s = sv.solve(cube, max_length, timeout)
+        latencies['solve'].append(time.perf_counter() - t)
+        solution = s[:s.find('(')].replace(' ', '')   # solution without spaces and without the moves amount
+
+        t = time.perf_counter()
+        robot, moves, robot_tot_moves = cm.robot_required_moves(solution, "", planner, robot_settings)
+        latencies['translate'].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        solved = bool(sim.verify_programs([cube], [moves])[0])   # the robot program is applied to the cube
+        latencies['verify'].append(time.perf_counter() - t)
+
+        results.append({'cube':cube, 'solution':solution, 'length':len(solution)//2, 'robot_moves':robot_tot_moves,
+                        'robot_time':cm.robot_moves_time(moves, robot_settings)[2], 'solved':solved})
+
+    print(f'\ncubes: {n}   seed: {seed}   max_length: {max_length}   timeout: {timeout} s   '
+          f'translation: {"planner" if planner else "moves_dict"}   ranked: {ranked}   orientations: {orientations}   '
+          f'cache: {ranked and use_cache}')
+    print(f'\n{"stage":<10} {"cubes/s":>10} {"mean ms":>10} {"p50 ms":>10} {"p90 ms":>10} {"p99 ms":>10} {"max ms":>10}')
+    for stage, values in latencies.items():       # iteration over the pipeline stages
+        stage_report(stage, values)
+    distribution_report(results)
+    failed = [r for r in results if not r['solved']]   # robot programs not solving their cube
+    print(f'robot programs not solving the cube: {len(failed)}')
+
+    if csv_file:                                  # case the results are saved per cube
+        with open(csv_file, 'w') as f:
+            f.write('cube,solution,turns,robot_moves,robot_time_ms,solved\n')
+            for r in results:
+                f.write(f"{r['cube']},{r['solution']},{r['length']},{r['robot_moves']},{r['robot_time']},{r['solved']}\n")
+
+    return results
+
+
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the cube solving pipeline, on random cubes')
+    parser.add_argument('-n', type=int, default=100, help='amount of random cubes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random cubes corpus')
+    parser.add_argument('--max-length', type=int, default=20, help='solver max_length (face turns)')
+    parser.add_argument('--timeout', type=float, default=2, help='solver timeout (s)')
+    parser.add_argument('--planner', action='store_true', help='translate via the planner instead of moves_dict')
+    parser.add_argument('--ranked', action='store_true', help='rank the solver candidates per robot time')
+    parser.add_argument('--orientations', type=int, default=0, help='orientations solved per cube, when ranked (0 = none)')
+    parser.add_argument('--csv', default=None, help='csv file to save the results per cube')
+    parser.add_argument('--use-cache', action='store_true', help='use the solutions cache and the near solved index')
+    args = parser.parse_args()
+
+    orientations = cs.all_orientations[:args.orientations] if args.orientations else None
+    benchmark(args.n, args.seed, args.max_length, args.timeout, args.planner, args.ranked, orientations, args.csv,
+              args.use_cache)
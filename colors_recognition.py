@@ -24,12 +24,27 @@
 import cv2
 import numpy as np
 from scipy.spatial import distance as dist
+from scipy.optimize import linear_sum_assignment     # min-cost matching of the facelets to the colors
 import math
 import statistics
 import time
 import datetime as dt
 from IPython.display import clear_output            # function to clear the terminal
-import twophase.solver as sv                                 # Kociemba solver
+import solver_server as ss                                   # solver server process, loading the Kociemba solver tables once
+import cube_validator as cv                                  # cube status coherence checks, before calling the solver
+import cube_decoder as cdec                                  # most likely coherent cube status, decoded per corner and edge
+import threading                                             # camera frames are captured on a separated thread
+from collections import deque                                # ring buffer with the latest camera frames
+
+
+# camera capture thread: frames are read continuously, and only the latest ones are kept (no stale frames on the analysis)
+FRAME_BUFFER = 4                  # amount of latest frames kept in the ring buffer
+frames = deque(maxlen=FRAME_BUFFER)                          # ring buffer with the latest (timestamp, frame number, frame)
+frames_cond = threading.Condition()                          # lock on the ring buffer, notifying the new frames
+capturing = threading.Event()                                # flag to keep the capture thread running
+capture_thread = None             # thread reading the camera frames
+last_frame_number = -1            # number of the last frame returned to the analysis
+
 
 try:
     import sys, platform
@@ -60,11 +75,87 @@ def webcam(cam_num, cam_width=640, cam_height=360):
     width = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))         # return the camera reading width 
     height = int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))       # return the camera reading higth 
     
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)                    # driver buffer limited, frames are buffered by the capture thread
+    
     if side==0 and debug:
         print(f'Camera resolution: {width} x {height}\n')
+    start_capture()                                           # frames are read on a separated thread from now on
     time.sleep(0.5)
 #         clear_terminal()
     return camera, width, height
+
+
+
+
+
+
+
+def capture_frames():
+    """ Capture thread: reads the camera frames continuously, and appends them (with timestamp) to the ring buffer"""
+    
+    frame_number = 0
+    while capturing.is_set():
+        ret, frame = camera.read()                 # ret is the boolean if the image array is available, and the image
+        if ret==False:                             # case the frame is not available
+            time.sleep(0.01)
+            continue
+        with frames_cond:
+            frames.append((time.time(), frame_number, frame))
+            frames_cond.notify_all()               # analysis waiting for a new frame is notified
+        frame_number+=1
+
+
+
+
+
+
+
+def start_capture():
+    """ Starts the capture thread, on the camera opened by webcam()"""
+    global capture_thread, last_frame_number
+    
+    stop_capture()                                 # eventual capture thread from a previous run is stopped
+    frames.clear()
+    last_frame_number = -1
+    capturing.set()
+    capture_thread = threading.Thread(target=capture_frames, daemon=True)
+    capture_thread.start()
+
+
+
+
+
+
+
+def stop_capture():
+    """ Stops the capture thread, and waits for its end (the camera can then be released)"""
+    
+    capturing.clear()
+    if capture_thread is not None:
+        capture_thread.join(timeout=2)
+
+
+
+
+
+
+
+def latest_frame(timeout=1):
+    """
+    Returns a copy of the newest captured frame, and its timestamp, from the ring buffer.
+    It doesn't wait when a frame newer than the last returned one is available; otherwise it waits for the next frame,
+    up to timeout (s). The frame is None in case no frames have been captured.
+    The frame is always a copy, as the analysis draws on it while the ring buffer is shared with the capture thread
+    """
+    global last_frame_number
+    
+    with frames_cond:
+        frames_cond.wait_for(lambda: frames and frames[-1][1] != last_frame_number, timeout=timeout)
+        if not frames:                             # case no frames have been captured
+            return None, None
+        timestamp, frame_number, frame = frames[-1]
+    last_frame_number = frame_number
+    return frame.copy(), timestamp                 # the frame in the ring buffer is never handed out
     
 
 
@@ -75,7 +166,8 @@ def webcam(cam_num, cam_width=640, cam_height=360):
 def read_camera():
     """ Returns the camera reading, and dimensions """
 
-    ret, frame = camera.read()                     # ret is the boolean if the image array is available, and the image
+    frame, timestamp = latest_frame()              # freshest frame from the capture thread, and its timestamp
+    ret = frame is not None                        # ret is the boolean if the image array is available
     # frame = cv2.flip(frame, 1)
     if ret==False:
         print("Webcam frame not available: 'ret' variable == False")
@@ -642,100 +734,81 @@ def cube_colors_interpreted(BGR_detected):
     in case the BGR color distance doesn't provide coherent result.
     """
 
-    # Step1: dict with BGR_detected and facelet's position as key
-    #        dict with HSV (detected color) and facelet's position as key
-    BGR_detected_dict={} 
-    HSV_detected={}
-    for i in range(len(BGR_detected)):
-        BGR=BGR_detected[i]
-        BGR_detected_dict[i]=BGR
-        B,G,R=BGR
-        BGR_mean = np.array([[[B,G,R]]], dtype=np.uint8)
-        hsv = cv2.cvtColor( BGR_mean, cv2.COLOR_BGR2HSV)
-        H=hsv[0][0][0]
-        S=hsv[0][0][1]
-        V=hsv[0][0][2]
-        HSV_detected[i]=(H,S,V)
-
-    if debug:
-        print(f'\nBGR_detected: {BGR_detected}')
-        print(f'\nHSV: {HSV_detected}')
+    # Step1: dict with HSV (detected color) and facelet's position as key, and cube color sequence
+    HSV_detected, cube_color_sequence = cube_colors_HSV_sequence(BGR_detected)
 
     # Step2: center's facelets are used as initial reference
     cube_ref_colors = {'white':BGR_detected[4], 'red':BGR_detected[13], 'green':BGR_detected[22],
                        'yellow':BGR_detected[31], 'orange':BGR_detected[40], 'blue':BGR_detected[49]}
     
-    # Step3: dictionary with the color distances from the (initial) references
-    color_distance={}                                             # empty dict to store all the color distances for all the facelets
-    cube_ref_colors_lab={}                                        # empty dictionary to store color refences in Lab color space
-    for color, BGR in cube_ref_colors.items():
-        B,G,R = BGR                                               # BGR values are unpact from the dict
-        cube_ref_colors_lab[color]=tuple(rgb2lab([R,G,B]))        # BGR conversion to lab color space and dict feeding
-            
-    for facelet, color_measured in BGR_detected_dict.items():         
-        B,G,R = color_measured
-        lab_meas = rgb2lab([R,G,B])                               # conversion to lab color space (due CIEDE2000 function)
-        distance=[]                                               # list with the distance from the 6 references, for each facelet
-        for color, lab_ref in cube_ref_colors_lab.items():        # iteration over the 6 reference colors
-            distance.append(CIEDE2000(tuple(lab_meas), lab_ref))  # Euclidean distance toward the 6 reference colors
-        color_distance[facelet]=distance                          
-    
-    
-    # Step4: Ordering the color distance (the min value per each facelet) by increasing values
-    color_distance_copy=color_distance.copy()    # a dict copy is made, to drop items while the analysis progresses
-    color_distance_ordered={}                   # empty dictiony to store the (min) color distance by increasing values
-    for i in range(len(color_distance_copy)):
-        index = color_distance_copy.keys()
-        key_min_dist = min(color_distance_copy,key=lambda key:min(color_distance_copy[key]))
-        color_distance_ordered[key_min_dist] = color_distance_copy[key_min_dist]
-        color_distance_copy.pop(key_min_dist)
-    
-    
-    # Step5: List with facelets position ordered according to the color distance increasing order
+    # Step3: matrix with the color distances from the (initial) references, all the facelets at once
+    ref_colors = list(cube_ref_colors.keys())                     # reference colors, in the order of the distance matrix columns
+    lab_detected = bgr2lab_array(BGR_detected)                    # BGR conversion to lab color space (due CIEDE2000 function)
+    cube_ref_colors_lab = bgr2lab_array([cube_ref_colors[color] for color in ref_colors])  # color refences in Lab color space
+    color_distance = CIEDE2000_matrix(lab_detected, cube_ref_colors_lab)   # 54 x 6 distances toward the 6 reference colors
+    
+    
+    # Step4: List with facelets position ordered by increasing color distance (the min value per each facelet)
     # this is needed to come back later to original kociemba facelets order
-    key_ordered_by_color_distance = [x for x in color_distance_ordered.keys()]
-
-
-    # Step6: Ordering the facelets BGR color values according to color distance from the reference colors
-    BGR_ordered={}
-    for key in color_distance_ordered.keys():
-        BGR_ordered[key]=BGR_detected[key]
+    key_ordered_by_color_distance = np.argsort(color_distance.min(axis=1), kind='stable').tolist()
 
 
-    # Step7: Color interpretation
+    # Step5: Color interpretation, on the facelets ordered by increasing color distance from the reference colors
     cube_status_by_color_distance={}          # dict to store the cube status reppresentation wih the interpreted colors
-    distance={}                               # dict to store the color distance during each facelet check
-#     distance_value=[]                       # list to store the color distance for the selectec color/facelet association
     
-    i=0
-    for value in BGR_ordered.values():            # iteration on the facelet's BGR values ordered by increasing color distance from ref
-        B,G,R =value
-        lab_meas = rgb2lab([R,G,B])                                         # conversion to lab color space (due CIEDE2000 function)
-        for color, lab_ref in cube_ref_colors_lab.items():                  # iteration over the 6 reference colors
-            distance[color]=CIEDE2000(tuple(lab_meas), lab_ref)             # Euclidean distance toward the 6 reference colors
-        color = min(distance, key=distance.get)                             # chosem color is the one with min distance from reference
-  
+    # references are updated at every facelet, this sequential part uses the scalar functions (faster on single colors)
+    cube_ref_colors_lab = [tuple(lab) for lab in cube_ref_colors_lab.tolist()]
+    for i, key in enumerate(key_ordered_by_color_distance):   # iteration on the facelets ordered by increasing color distance from ref
+        B,G,R = BGR_detected[key]
+        lab_meas = tuple(lab_detected[key].tolist())
+        distance = [CIEDE2000(lab_meas, lab_ref) for lab_ref in cube_ref_colors_lab]   # distance toward the 6 (updated) reference colors
+        c = distance.index(min(distance))                                   # chosem color is the one with min distance from reference
+        color = ref_colors[c]
         cube_status_by_color_distance[i]=color                              # dict of cube status wih the interpreted colors  
-#         distance_value.append(distance[min(distance, key=distance.get)])  # list with the color distance of the chosen facelet's color
-        distance.clear()                                                    # distance dict is cleared for the next facelet
         
         B_avg = math.sqrt((B**2+ (cube_ref_colors[color][0])**2)/2)   # average Red color id made from the chosen color and previous reference
         G_avg = math.sqrt((G**2+ (cube_ref_colors[color][1])**2)/2)   # average Green color id made from the chosen color and previous reference
         R_avg = math.sqrt((R**2+ (cube_ref_colors[color][2])**2)/2)   # average Blue color id made from the chosen color and previous reference
 
         cube_ref_colors[color]=(B_avg, G_avg, R_avg)                    # Color reference dict is updated with the new BGR averaged color
-        cube_ref_colors_lab[color]=tuple(rgb2lab([R_avg,G_avg,B_avg]))  # Lab color space reference dict is updated with the new color reference 
-        i+=1
+        cube_ref_colors_lab[c]=tuple(rgb2lab([R_avg,G_avg,B_avg]))      # Lab color space reference is updated with the new color reference 
     
     
-    # Step8: Cube detection status is generated
+    # Step6: Cube detection status is generated
     cube_status={}
     for i in range(54):
         index = key_ordered_by_color_distance.index(i)
         cube_status[i]=cube_status_by_color_distance[index]
     
+    return cube_status, HSV_detected, cube_color_sequence
+
+
+
+
+
+
+
+def cube_colors_HSV_sequence(BGR_detected):
+    """
+    Converts the facelets BGR colors to HSV, and retrieves the cube color sequence (used for a nicer decoration on
+    the interpreted colors) from the HSV values.
+    Returns the dict with HSV (detected color) and facelet's position as key, and the cube color sequence
+    """
+    
+    HSV_detected={}
+    for i in range(len(BGR_detected)):
+        B,G,R=BGR_detected[i]
+        BGR_mean = np.array([[[B,G,R]]], dtype=np.uint8)
+        hsv = cv2.cvtColor( BGR_mean, cv2.COLOR_BGR2HSV)
+        H=hsv[0][0][0]
+        S=hsv[0][0][1]
+        V=hsv[0][0][2]
+        HSV_detected[i]=(H,S,V)
+
+    if debug:
+        print(f'\nBGR_detected: {BGR_detected}')
+        print(f'\nHSV: {HSV_detected}')
     
-    # Step9: Cube color sequence for a nicer decoration on interpreted colors (using the HSV color space)
     VS_value={}                            # dict to store the V-S (Value-Saturation) value of all facelets
     Hue={}                                 # dict to store the Hue value of all facelets
     
@@ -745,12 +818,91 @@ def cube_colors_interpreted(BGR_detected):
         Hue[i]=int(H)                             # Hue, for all the facelets, populates the related dict
         i+=1
     
-    #step 10: function to get the color (sides) order, list of colored center's facelets and white center facelet  
+    # function to get the color (sides) order, list of colored center's facelets and white center facelet  
     cube_color_sequence, HSV_analysis = retrieve_cube_color_order(VS_value, Hue)
     if debug:
         print(f'\nCube_color_sequence: {cube_color_sequence}')
     
-    return cube_status, HSV_detected, cube_color_sequence
+    return HSV_detected, cube_color_sequence
+
+
+
+
+
+
+
+def cube_colors_matched(BGR_detected, iterations=4):
+    """
+    Assigns the colors to the facelets as a minimum-cost matching, over the CIEDE2000 distances from the reference colors:
+    each color gets exactly 9 facelets, and the center facelets keep their own color.
+    Differently from cube_colors_interpreted, the facelets aren't assigned one at the time (drifting references): the
+    assignment is globally optimal, then the references are updated to the (sqr mean) color of their assigned facelets,
+    and the matching is repeated until the assignment doesn't change anymore (max iterations).
+    
+    This function returns the interpreted facelet colors (kociemba order), the dict with HSV (detected color), the cube
+    color sequence, and the confidence margin of each facelet: distance from the closest other color minus the distance
+    from the assigned color (negative when the count constraint forces a facelet on a not closest color)
+    """
+    
+    HSV_detected, cube_color_sequence = cube_colors_HSV_sequence(BGR_detected)
+    
+    ref_colors = ['white', 'red', 'green', 'yellow', 'orange', 'blue']   # reference colors, as per the centers order
+    centers = [4, 13, 22, 31, 40, 49]                                     # center facelets, with fixed color
+    others = np.array([i for i in range(54) if i not in centers])         # facelets to be assigned (8 per color)
+    BGR = np.array(BGR_detected, dtype=np.float64)
+    lab_detected = bgr2lab_array(BGR)                                     # BGR conversion to lab color space
+    ref_BGR = BGR[centers]                                                # center's facelets are used as initial reference
+    
+    assigned = np.empty(54, dtype=np.int64)                               # color index per facelet
+    assigned[centers] = np.arange(6)
+    for i in range(iterations):
+        color_distance = CIEDE2000_matrix(lab_detected, bgr2lab_array(ref_BGR))   # 54 x 6 distances toward the references
+        cost = np.repeat(color_distance[others], 8, axis=1)               # 48 x 48 costs, 8 slots per color
+        rows, slots = linear_sum_assignment(cost)                         # min-cost matching of the facelets to the slots
+        previous = assigned.copy()
+        assigned[others[rows]] = slots // 8
+        if i > 0 and (assigned == previous).all():                        # case the assignment is stable
+            break
+        ref_BGR = np.sqrt(np.array([(BGR[assigned == c]**2).mean(axis=0) for c in range(6)]))   # references from the assigned facelets
+    
+    d_assigned = color_distance[np.arange(54), assigned]                  # distance from the assigned color
+    color_distance[np.arange(54), assigned] = np.inf
+    margins = color_distance.min(axis=1) - d_assigned                     # confidence margin per facelet
+    
+    cube_status = {i: ref_colors[c] for i, c in enumerate(assigned)}
+    if debug:
+        print(f'\nCube status via min-cost matching, lowest margins: {sorted(zip(margins.round(2), range(54)))[:6]}')
+    
+    return cube_status, HSV_detected, cube_color_sequence, margins
+
+
+
+
+
+
+
+def cube_colors_decoded(BGR_detected, cube_status):
+    """
+    Decodes the most likely coherent cube status (each corner and edge scored as a whole piece, see cube_decoder), out
+    of the CIEDE2000 distances from the reference colors; references are the (sqr mean) colors of the facelets assigned
+    to each color on the cube_status argument (i.e. from cube_colors_matched).
+    This function returns the decoded facelet colors (kociemba order), and the decoding cost (sum of the facelets distances)
+    """
+    
+    ref_colors = ['white', 'red', 'green', 'yellow', 'orange', 'blue']   # reference colors, as per the URFDLB faces order
+    BGR = np.array(BGR_detected, dtype=np.float64)
+    assigned = np.array([ref_colors.index(color) for color in cube_status.values()])   # color index per facelet
+    ref_BGR = np.sqrt(np.array([(BGR[assigned == c]**2).mean(axis=0) for c in range(6)]))   # references from the assigned facelets
+    color_distance = CIEDE2000_matrix(bgr2lab_array(BGR), bgr2lab_array(ref_BGR))  # 54 x 6 distances toward the references
+    
+    decoded, cost = cdec.decode(color_distance)
+    if decoded is None:                   # case no coherent cube status has been found
+        return {}, cost
+    cube_status_decoded = {i: ref_colors['URFDLB'.index(face)] for i, face in enumerate(decoded)}
+    if debug:
+        print(f'\nCube status via piece-level decoding: {decoded}, cost: {cost:.1f}')
+    
+    return cube_status_decoded, cost
 
 
 
@@ -1004,14 +1156,13 @@ def cube_colors_interpreted_HSV(BGR_detected, HSV_detected):
             if debug:
                 print(f'\nCube_status_detected_colors: {cube_status_detected}')
                 print(f'\nCube_status_conventional_colors: {cube_status_kociemba}\n')
-                break
             
         elif cube_color_sequence == std_cube_color:
             cube_status_kociemba=cube_status_detected
             if debug:
                 print('\nCube colors and orientation according to kociemba order')
                 print(f'\nCube_status_detected_colors: {cube_status_detected}\n')
-                break
+        break                                     # the analysis is done once, the loop is only left on failures
     
     if HSV_analysis==False:
         cube_status_kociemba={}
@@ -1141,13 +1292,12 @@ def CIEDE2000(Lab_1, Lab_2):
     C1_ = math.sqrt(a1_**2 + b1_**2)
     C2_ = math.sqrt(a2_**2 + b2_**2)
     
+    # hue angles within [0, 2*pi), as per the CIEDE2000 formula (the hue average depends on it)
     if b1_ == 0 and a1_ == 0: h1_ = 0
-    elif a1_ >= 0: h1_ = math.atan2(b1_, a1_)
-    else: h1_ = math.atan2(b1_, a1_) + 2 * math.pi
+    else: h1_ = math.atan2(b1_, a1_) % (2 * math.pi)
     
     if b2_ == 0 and a2_ == 0: h2_ = 0
-    elif a2_ >= 0: h2_ = math.atan2(b2_, a2_)
-    else: h2_ = math.atan2(b2_, a2_) + 2 * math.pi
+    else: h2_ = math.atan2(b2_, a2_) % (2 * math.pi)
 
     dL_ = L2_ - L1_
     dC_ = C2_ - C1_    
@@ -1201,6 +1351,101 @@ def CIEDE2000(Lab_1, Lab_2):
 
 
 
+def bgr2lab_array(BGR):
+    """
+    Converts an array of BGR colors (... x 3, last axis in B,G,R order) in L*a*b colors space, in one NumPy pass
+    Same steps, and roundings, of rgb2lab(); the returned array has the same shape of the input one
+    """ 
+    RGB = np.asarray(BGR, dtype=np.float64)[..., ::-1] / 255      # RGB order, as per rgb2lab()
+    RGB = np.where(RGB > 0.04045, ((RGB + 0.055) / 1.055) ** 2.4, RGB / 12.92) * 100
+    M = np.array([[0.4124, 0.3576, 0.1805],
+                  [0.2126, 0.7152, 0.0722],
+                  [0.0193, 0.1192, 0.9505]])
+    XYZ = np.round(RGB @ M.T, 4)
+
+    # Observer= 2°, Illuminant= D65
+    XYZ = XYZ / np.array([95.047, 100.0, 108.883])                # ref_X, ref_Y, ref_Z
+    XYZ = np.where(XYZ > 0.008856, XYZ ** 0.3333333333333333, (7.787 * XYZ) + (16 / 116))
+    
+    Lab = np.empty_like(XYZ)
+    Lab[..., 0] = (116 * XYZ[..., 1]) - 16
+    Lab[..., 1] = 500 * (XYZ[..., 0] - XYZ[..., 1])
+    Lab[..., 2] = 200 * (XYZ[..., 1] - XYZ[..., 2])
+    return np.round(Lab, 4)
+
+
+
+
+
+
+
+def CIEDE2000_matrix(Lab_1, Lab_2):
+    """
+    Calculates the CIEDE2000 color distances between two arrays of CIE L*a*b* colors (N x 3 and M x 3), in one NumPy pass
+    Same steps of CIEDE2000(); it returns the N x M matrix of the distances
+    """
+    
+    C_25_7 = 6103515625 # 25**7
+
+    Lab_1 = np.asarray(Lab_1, dtype=np.float64).reshape(-1, 1, 3)
+    Lab_2 = np.asarray(Lab_2, dtype=np.float64).reshape(1, -1, 3)
+    L1, a1, b1 = Lab_1[..., 0], Lab_1[..., 1], Lab_1[..., 2]
+    L2, a2, b2 = Lab_2[..., 0], Lab_2[..., 1], Lab_2[..., 2]
+    C1 = np.sqrt(a1**2 + b1**2)
+    C2 = np.sqrt(a2**2 + b2**2)
+    C_ave = (C1 + C2) / 2
+    G = 0.5 * (1 - np.sqrt(C_ave**7 / (C_ave**7 + C_25_7)))
+    
+    a1_, a2_ = (1 + G) * a1, (1 + G) * a2
+    C1_ = np.sqrt(a1_**2 + b1**2)
+    C2_ = np.sqrt(a2_**2 + b2**2)
+    
+    # hue angles within [0, 2*pi), as per the CIEDE2000 formula (the hue average depends on it)
+    h1_ = np.where((b1 == 0) & (a1_ == 0), 0, np.arctan2(b1, a1_) % (2 * np.pi))
+    h2_ = np.where((b2 == 0) & (a2_ == 0), 0, np.arctan2(b2, a2_) % (2 * np.pi))
+
+    dL_ = L2 - L1
+    dC_ = C2_ - C1_    
+    C1C2 = C1_ * C2_
+    dh_ = h2_ - h1_
+    dh_ = np.where(dh_ > np.pi, dh_ - 2 * np.pi, np.where(dh_ < -np.pi, dh_ + 2 * np.pi, dh_))
+    dh_ = np.where(C1C2 == 0, 0, dh_)
+    dH_ = 2 * np.sqrt(C1C2) * np.sin(dh_ / 2)
+    
+    L_ave = (L1 + L2) / 2
+    C_ave = (C1_ + C2_) / 2
+    
+    _dh = np.abs(h1_ - h2_)
+    _sh = h1_ + h2_
+    h_ave = np.where(_dh <= np.pi, _sh / 2, np.where(_sh < 2 * np.pi, _sh / 2 + np.pi, _sh / 2 - np.pi))
+    h_ave = np.where(C1C2 != 0, h_ave, _sh)
+    
+    T = 1 - 0.17 * np.cos(h_ave - np.pi / 6) + 0.24 * np.cos(2 * h_ave) + 0.32 * np.cos(3 * h_ave + np.pi / 30) - 0.2 * np.cos(4 * h_ave - 63 * np.pi / 180)
+    
+    h_ave_deg = h_ave * 180 / np.pi
+    h_ave_deg = np.where(h_ave_deg < 0, h_ave_deg + 360, np.where(h_ave_deg > 360, h_ave_deg - 360, h_ave_deg))
+    dTheta = 30 * np.exp(-(((h_ave_deg - 275) / 25)**2))
+    
+    R_C = 2 * np.sqrt(C_ave**7 / (C_ave**7 + C_25_7))  
+    S_C = 1 + 0.045 * C_ave
+    S_H = 1 + 0.015 * C_ave * T
+    
+    Lm50s = (L_ave - 50)**2
+    S_L = 1 + 0.015 * Lm50s / np.sqrt(20 + Lm50s)
+    R_T = -np.sin(dTheta * np.pi / 90) * R_C
+
+    f_L = dL_ / S_L       # k_L, k_C, k_H = 1, 1, 1
+    f_C = dC_ / S_C
+    f_H = dH_ / S_H
+    
+    return np.sqrt(f_L**2 + f_C**2 + f_H**2 + R_T * f_C * f_H)
+
+
+
+
+
+
+
 def decoration(deco_info):
     """
     Plot the cube's status made by a collage of images taken along the facelets color detection
@@ -1312,17 +1557,41 @@ def cube_solution(cube_string):
     Calls the Hegbert Kociemba solver, and returns the solution's moves
     from: https://github.com/hkociemba/RubiksCube-TwophaseSolver 
     (Solve Rubik's Cube in less than 20 moves on average with Python)
+    The cube is solved from all the 24 orientations, and the solution with the lowest robot time is returned
     The returned string is slightly manipulated to have the moves amount at the start
     """    
-    s = sv.solve(cube_string, 20, 2)  # solves with a maximum of 20 moves and a timeout of 2 seconds for example
-    solution = s[:s.find('(')]        # solution capture the sequence of manouvre
+    winner, solution, solution_Text = cube_solution_first([cube_string])
+    return solution, solution_Text
+
+
+
+
+
+
+
+def cube_solution_first(cube_strings):
+    """
+    Solves concurrently the candidate cube status strings (different colors interpretations of the same cube), 
+    and returns the index of the preferred candidate getting a solution, with the solution as per cube_solution().
+    Candidates are preferred as per their order (the earlier interpretations first, i.e. BGR before HSV), whatever
+    the solving times.
+    Incoherent candidates are rejected without calling the solver; the other ones are sent together to the
+    solver server, and the pending candidates are cancelled once the winner is known.
+    In case none of the candidates is solved, the index is the one of the last candidate.
+    """
+    defects = cv.check(cube_strings)  # incoherent cube status (i.e. wrong colors interpretation) is rejected without solving
+    valid = [i for i, defect in enumerate(defects) if not defect]   # candidates sent to the solver
+    if not valid:                     # case all the candidates are incoherent
+        return len(cube_strings)-1, 'Error: ' + defects[-1], 'Error'
+    
+    winner, s = ss.solve_first([cube_strings[i] for i in valid], 20, None, orientations=ss.all_orientations)  # max 20 moves, adaptive solving time, all orientations
+    if winner is None:                # case none of the candidates got a solution
+        return len(cube_strings)-1, s, 'Error'
     
+    solution = s[:s.find('(')]        # solution capture the sequence of manouvre
     # solution_text places the amount of moves first, and the solution (sequence of manouvere) afterward
     solution_Text = s[s.find('(')+1:s.find(')')-1]+' moves  '+ s[:s.find('(')] 
-    if solution[:5] =='Error':        # solution could start with "Error" in case of incoherent cusbe string sent to the solver
-        solution_Text = 'Error'       # in that case a short error string is returned
-    
-    return solution, solution_Text
+    return valid[winner], solution, solution_Text
 
 
 
@@ -1371,43 +1640,50 @@ def average_color(image, x, y):
      The average is calculated as the square root of the sum of the squares for the BGR colors
      region centered at (x, y) meant as the square center, with 2*side as quare side lenght in pixels.
      The function return a tuple with the averaged BGR colors
-     Pixel by pixel iteration doesn't sound efficient, yet for the small aarea I couldn't notice a time increment
+     """
+    
+    return average_colors(image, [(x, y)])[0]
+
+
+
+
+
+
+
+def average_colors(image, centers, half_side=None):
+    """
+     Averages the pixels within square defined areas on an image, for all the (x, y) centers at once (i.e. the 9 facelets
+     of a face), as the square root of the mean of the squares for the BGR colors (see average_color)
+     Each square has 2*half_side as side lenght in pixels; half_side is the square edge used for sketching the cube, when
+     not provided. Larger squares don't add Python work, as all the pixels are gathered and summed in one NumPy pass
+     The function returns a list with a tuple of averaged BGR colors per center
      """
     global edge
     # square edge, used for sketching the cube, is used as (half) side of the square to calculate the averaged color
     
-    blue=float(0)
-    green=float(0)
-    red=float(0)
-    
-    #Iterate through pixels of a bounding box having 2*edge as square side length in pixels
-    for i in range(2*edge):         # foor loop used to iterate the colums on the image square 
-        j=i-edge                    # iterator j is "shifted" by half of the square of pixels to analyse
-        for i in range(2*edge):     # for loops to iterate trhough the rows of th eimage square
-            bgr=image[y+j,x-edge+i]      # gbr of a singele pixel
-            b,g,r = bgr                  # bgr components
-            b=int(b)                     # from uint8 to integer
-            g=int(g)                     # from uint8 to integer
-            r=int(r)                     # from uint8 to integer
-            
-            #Sum the squares of components
-            blue=blue+b*b                # progressive sum of the square values for the blue component
-            green=green+g*g              # progressive sum of the square values for the green component
-            red=red+r*r                  # progressive sum of the square values for the red component
-    num=4*edge*edge                      # amount of pixels in the image square under analysis    
+    if half_side is None:
+        half_side = edge
+    xy = np.array(centers, dtype=np.int64).reshape(-1, 2)      # centers coordinates
+    offsets = np.arange(-half_side, half_side)                # pixels offsets from the square centers
+    rows = xy[:, 1, None] + offsets                           # rows of each square
+    cols = xy[:, 0, None] + offsets                           # columns of each square
+    pixels = image[rows[:, :, None], cols[:, None, :]].astype(np.int64)   # N x 2*half_side x 2*half_side x 3 pixels
+    sums = (pixels * pixels).sum(axis=(1, 2))                 # sum of the square values per BGR component, per square
+    num = 4*half_side*half_side                               # amount of pixels in each image square under analysis
     
     # for debug purpose it is drawn the contour of the used area where the facelet's color is averaged 
     if debug:
-        tl=(x-edge, y-edge)                  # top left coordinate 
-        tr=(x+edge, y-edge)                  # top right coordinate 
-        br=(x+edge, y+edge)                  # bottom left coordinate 
-        bl=(x-edge, y+edge)                  # bottom left coordinate 
-        pts=np.array([tl, tr, br, bl])       # array of coordinates
-        contour = [pts]                      # list is made with the array of coordinates
-        cv2.drawContours(frame, contour, -1, (230, 230, 230), 2)  # a white polyline is drawn on the contour (2 px thickness)
+        for x, y in xy:
+            tl=(x-half_side, y-half_side)        # top left coordinate 
+            tr=(x+half_side, y-half_side)        # top right coordinate 
+            br=(x+half_side, y+half_side)        # bottom left coordinate 
+            bl=(x-half_side, y+half_side)        # bottom left coordinate 
+            pts=np.array([tl, tr, br, bl])       # array of coordinates
+            contour = [pts]                      # list is made with the array of coordinates
+            cv2.drawContours(frame, contour, -1, (230, 230, 230), 2)  # a white polyline is drawn on the contour (2 px thickness)
     
     #Return the sqrt of the mean of squared B, G, and R sums 
-    return (int(math.sqrt(blue/num)), int(math.sqrt(green/num)), int(math.sqrt(red/num)))
+    return [tuple(int(c) for c in bgr) for bgr in np.sqrt(sums / num)]
 
 
 
@@ -1428,7 +1704,9 @@ def read_color(facelets, candidates, BGR_mean, H_mean, wait=20, index=0):
         imgplot = plt.imshow(img)                       # frame's image is converted to RGB and plotted via matplotlib 
         plt.show()                                      # frame's image is converted to RGB and plotted via matplotlib 
     
-    for facelet in facelets:                              # iteration over the 9 facelets just detedcted
+    bgr_means_sq = average_colors(frame, [(facelet['cx'], facelet['cy']) for facelet in facelets])  # colors averaged with sqr sum os squares
+    
+    for facelet, bgr_mean_sq in zip(facelets, bgr_means_sq):   # iteration over the 9 facelets just detedcted
         contour = facelet.get('contour')                  # contour of the facelet under analysis
         candidates.append(contour)                        # new contour is added to the candidates list
         mask = np.zeros(frame.shape[:2], dtype="uint8")   # mask of zeros is made for the frame shape dimension
@@ -1438,7 +1716,6 @@ def read_color(facelets, candidates, BGR_mean, H_mean, wait=20, index=0):
         roi = cv2.bitwise_and(frame, frame, mask=mask)    # ROI is used to shortly display one facelet at the time
         
         cm_point=facelet['cx'],facelet['cy']                              # contour center coordinate
-        bgr_mean_sq = average_color(frame, facelet['cx'], facelet['cy'])  # color is averaged with sqr sum os squares
         BGR_mean.append(bgr_mean_sq)                          # Initially used a simpler mean to average the facelet color
         b,g,r = bgr_mean_sq                                   # BGR (avg) components are retrieved
         BGR_mean_sq = np.array([[[b,g,r]]], dtype=np.uint8)   # BGR are positioned in cv2 array form
@@ -1713,6 +1990,7 @@ def close_camera():
     It's important to close the camera, if the script runs again
     """
     
+    stop_capture()                      # capture thread is stopped before releasing the camera
     try:
         camera.release()                # if the program gets stuk it's because the camera remained open from previour run
     except:
@@ -1734,7 +2012,7 @@ def start_up(cam_num, cam_width, cam_height, cam_crop_at_right, cam_facelets):
     """
     
     # global variables
-    global font, fontScale, fontColor, lineType, camera, width, height, sv, quitting
+    global font, fontScale, fontColor, lineType, camera, width, height, quitting
     global sides, side, BGR_mean, H_mean, kociemba_facelets_BGR_mean, edge, offset, faces, w, h, background_h
     global clear_output, first_cycle, plt, k_kernel, d_iterations, e_iterations, facelets_in_width, crop_at_right
 
@@ -1885,28 +2163,33 @@ def cubeAF():
 
 
                     if side == 6:   # last cube's face is acquired   
-                        cube_status, HSV_detected, cube_color_sequence = cube_colors_interpreted(kociemba_facelets_BGR_mean)  # cube string status with colors detected 
-                        cube_status_string = cube_string(cube_status)                 # cube string for the solver
-                        solution, solution_Text = cube_solution(cube_status_string)   # Kociemba solver is called to have the solution string
-                        color_detection_winner='BGR'                                  # variable used to log which method gave the solution
+                        # colors are first assigned via min-cost matching (9 facelets per color); in case of incoherent cube status
+                        # the most likely coherent cube is decoded (piece-level decoding); only in case that fails too, the other
+                        # colors interpretations (BGR color distance, and HSV) are solved concurrently, the first solved one wins
+                        cube_status, HSV_detected, cube_color_sequence, margins = cube_colors_matched(kociemba_facelets_BGR_mean)  # cube string status with colors detected 
+                        candidates=[('matching', cube_status, cube_color_sequence)]    # (method, cube status, cube color sequence)
+                        if cv.check(cube_string(cube_status)):                         # case the matched colors give an incoherent cube status
+                            cube_status, decoding_cost = cube_colors_decoded(kociemba_facelets_BGR_mean, cube_status)  # most likely coherent cube status
+                            candidates=[('decoding', cube_status, cube_color_sequence)]
+                        if not cube_status:                                            # case the decoding didn't find a coherent cube status
+                            cube_status, HSV_detected, cube_color_sequence = cube_colors_interpreted(kociemba_facelets_BGR_mean)  # cube string status with colors detected 
+                            candidates.append(('BGR', cube_status, cube_color_sequence))
+                            cube_status, cube_status_HSV, cube_color_sequence = cube_colors_interpreted_HSV(kociemba_facelets_BGR_mean,
+                                                                                HSV_detected)  # cube string status with colors detected 
+                            candidates.append(('HSV', cube_status, cube_color_sequence))
+                        cube_strings = [cube_string(candidate[1]) for candidate in candidates]   # cube strings for the solver
                         if debug:
-                            print(f'\nCube status (via BGR color distance): {cube_status_string}\n')
-
+                            for method, cube_status_string in zip(candidates, cube_strings):
+                                print(f'\nCube status (via {method[0]}): {cube_status_string}')
+                        
+                        winner, solution, solution_Text = cube_solution_first(cube_strings)   # Kociemba solver is called on all the candidates
+                        color_detection_winner, cube_status, cube_color_sequence = candidates[winner]   # variables used to log which method gave the solution
+                        cube_status_string = cube_strings[winner]
 
-                        if solution_Text == 'Error':      # if colors interpretation on BGR color distance fail an attempt is made on HSV
+                        if solution_Text == 'Error':      # in case color detection fail on all the interpretations
+                            color_detection_winner='Error'           # the winner approach goes to error, for log purpose
                             if debug:
                                 print(f'Solver return: {solution}\n')
-                            cube_status, cube_status_HSV, cube_color_sequence = cube_colors_interpreted_HSV(kociemba_facelets_BGR_mean,
-                                                                                HSV_detected)  # cube string status with colors detected 
-                            cube_status_string = cube_string(cube_status)             # cube string for the solver
-                            solution, solution_Text = cube_solution(cube_status_string)   # Kociemba solver is called to have the solution string
-                            color_detection_winner='HSV'                                  # variable used to log which method give the solution
-                            if solution_Text == 'Error':                 # in case color color detection fail also with HSV approach
-                                color_detection_winner='Error'           # the winner approach goes to error, for log purpose
-                            else: 
-                                if debug:
-                                    print(f'\nCube status (via HSV color distance): {cube_status_string}')           # nice information to print at terminal, sometime useful to copy
-                                    print(f'\nCube solution: {solution_Text}')          # nice information to print at terminal, sometime useful to copy 
 
 
                         elif solution_Text != '0 moves  ':                 # case of interest, the cube isn't already solved
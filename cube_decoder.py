@@ -0,0 +1,165 @@
+"""
+#############################################################################################################
+#
+# Piece-level decoder: returns the most likely coherent cube status, out of the color distances of each facelet.
+# Facelets are not decoded one by one: each corner (facelets triple) and edge (facelets pair) position is scored
+# against the 8 corners, with their 3 twists, and the 12 edges, with their 2 flips, as per the Kociemba facelets
+# layout (see cube_validator). The cube with the lowest total distance is searched among those satisfying all the
+# cube constraints (each piece once, twist sum multiple of 3, even flip sum, same corners and edges permutation parity):
+#  - corners: all the 8! permutations are scored at once, the twist constraint is solved exactly (dynamic programming)
+#    on the best permutations per parity
+#  - edges: the optimal permutation (min-cost matching), its neighbours (single swaps, and the best matchings without
+#    each of the optimal pieces positions) are scored, the flip constraint is solved exactly on each of them
+# Centers are fixed, the cube status string has the URFDLB faces order.
+#
+#############################################################################################################
+"""
+
+import itertools                              # permutations of the corners
+import numpy as np
+from scipy.optimize import linear_sum_assignment   # min-cost matching of the edges to the edge positions
+import twophase.defs as defs                  # Kociemba solver library (by Hergbert Kociemba), for the cubies colors
+import robot_moves as cm                      # face letters, in URFDLB order
+import cube_validator as cv                   # facelets of the corners and edges, permutation parity
+
+
+# Global variables
+corner_candidates = 24                        # corner permutations, per parity, evaluated with the twist constraint
+forbidden = 1e9                               # cost of a forbidden piece position (matching)
+
+# colors shown on the corner facelets (8 corners x 3 twists x 3 facelets), and on the edge facelets (12 x 2 x 2)
+corner_colors = np.array([[[int(c[(k - o) % 3]) for k in range(3)] for o in range(3)] for c in defs.cornerColor])
+edge_colors = np.array([[[int(c[(k + o) % 2]) for k in range(2)] for o in range(2)] for c in defs.edgeColor])
+
+corner_perms = np.array(list(itertools.permutations(range(8))))   # all the 8! corners permutations
+corner_parity = cv.permutation_parity(corner_perms, cv.pairs_8)  # parity of each corners permutation
+swaps = list(itertools.combinations(range(12), 2))               # edge positions pairs, to swap two edges
+
+
+
+
+
+
+def pieces_cost(distance):
+    """ Returns the cost of each corner, per twist, on each corner position (8 x 8 x 3), and the cost of each edge,
+        per flip, on each edge position (12 x 12 x 2), as sum of the facelets distances from the shown colors."""
+
+    corners = distance[cv.corner_facelets[:, None, None, :], corner_colors[None]].sum(axis=3)
+    edges = distance[cv.edge_facelets[:, None, None, :], edge_colors[None]].sum(axis=3)
+    return corners, edges
+
+
+
+
+
+
+def best_twists(costs):
+    """ Returns the twists (K x 8), with sum multiple of 3, minimizing the total cost of K corners permutations, and
+        the total costs; costs is the K x 8 x 3 array with the cost per position and twist (dynamic programming)."""
+
+    k = len(costs)
+    total = np.full((k, 3), np.inf)               # min cost per twist sum (mod 3), over the positions so far
+    total[:, 0] = 0
+    choice = np.zeros((8, k, 3), dtype=np.int64)  # twist chosen per position and twist sum, to retrieve the twists
+    for p in range(8):                            # iteration over the corner positions
+        options = np.stack([np.roll(total, o, axis=1) + costs[:, p, o, None] for o in range(3)])   # 3 x K x 3
+        choice[p] = options.argmin(axis=0)
+        total = options.min(axis=0)
+    twists = np.zeros((k, 8), dtype=np.int64)
+    s = np.zeros(k, dtype=np.int64)               # twist sum, from the last position backwards
+    for p in range(7, -1, -1):
+        twists[:, p] = choice[p, np.arange(k), s]
+        s = (s - twists[:, p]) % 3
+    return twists, total[:, 0]
+
+
+
+
+
+
+def best_flips(costs):
+    """ Returns the flips (12), with even sum, minimizing the total cost of an edges permutation, and the total cost;
+        costs is the 12 x 2 array with the cost per position and flip."""
+
+    flips = costs.argmin(axis=1)
+    total = costs.min(axis=1).sum()
+    if flips.sum() % 2:                           # case of odd flips sum, the cheapest flip change is made
+        delta = np.abs(costs[:, 1] - costs[:, 0])
+        p = int(delta.argmin())
+        flips[p] = 1 - flips[p]
+        total += delta[p]
+    return flips, total
+
+
+
+
+
+
+def corners_decode(corners):
+    """ Returns, per permutation parity, the best (cost, corners permutation, twists) for the corners costs."""
+
+    totals = corners.min(axis=2)[np.arange(8), corner_perms].sum(axis=1)   # cost per permutation, with free twists
+    best = []
+    for parity in range(2):                       # iteration over the permutations parity
+        idx = np.flatnonzero(corner_parity == parity)
+        idx = idx[np.argsort(totals[idx])[:corner_candidates]]   # best permutations of this parity
+        perms = corner_perms[idx]
+        twists, costs = best_twists(corners[np.arange(8), perms])   # K x 8 x 3 costs, per permutation
+        i = int(costs.argmin())
+        best.append((costs[i], perms[i], twists[i]))
+    return best
+
+
+
+
+
+
+def edges_decode(edges):
+    """ Returns, per permutation parity, the best (cost, edges permutation, flips) found for the edges costs."""
+
+    edge_min = edges.min(axis=2)                  # cost per edge position and edge, with free flips
+    rows, perm = linear_sum_assignment(edge_min)  # optimal edges permutation
+    candidates = [perm]
+    for p in range(12):                           # best matchings without each of the optimal positions
+        cost = edge_min.copy()
+        cost[p, perm[p]] = forbidden
+        candidates.append(linear_sum_assignment(cost)[1])
+    for a, b in swaps:                            # optimal permutation, with two edges swapped
+        swapped = perm.copy()
+        swapped[[a, b]] = swapped[[b, a]]
+        candidates.append(swapped)
+
+    candidates = np.array(candidates)
+    parities = cv.permutation_parity(candidates, cv.pairs_12)
+    best = [(np.inf, None, None), (np.inf, None, None)]
+    for candidate, parity in zip(candidates, parities):   # iteration over the candidate permutations
+        flips, cost = best_flips(edges[np.arange(12), candidate])
+        if cost < best[parity][0]:
+            best[parity] = (cost, candidate, flips)
+    return best
+
+
+
+
+
+
+def decode(distance):
+    """ Returns the most likely coherent cube status string, and its cost, out of the 54 x 6 array with the distance
+        of each facelet from each face color (URFDLB order). Cost is the sum of the facelets distances from the colors
+        of the returned cube status."""
+
+    corners, edges = pieces_cost(np.asarray(distance, dtype=np.float64))
+    best_corners, best_edges = corners_decode(corners), edges_decode(edges)
+    costs = [best_corners[parity][0] + best_edges[parity][0] for parity in range(2)]
+    parity = int(np.argmin(costs))                # corners and edges permutations with the same parity
+    if not np.isfinite(costs[parity]):            # case no coherent cube has been found
+        return None, None
+    cp, co = best_corners[parity][1:]             # corners permutation and twists
+    ep, eo = best_edges[parity][1:]               # edges permutation and flips
+
+    status = np.zeros(54, dtype=np.int64)
+    status[4::9] = np.arange(6)                   # centers are fixed
+    status[cv.corner_facelets] = corner_colors[cp, co]
+    status[cv.edge_facelets] = edge_colors[ep, eo]
+    centers_cost = np.asarray(distance)[4::9].diagonal().sum()   # distance of the centers from their own color
+    return ''.join([cm.faces[c] for c in status]), float(costs[parity] + centers_cost)
@@ -0,0 +1,150 @@
+"""
+#############################################################################################################
+#
+# Cube simulator for the robot moves (F flips, S spins, R bottom layer rotations)
+# Cube states are 54 facelets strings, as per the Kociemba solver (URFDLB faces order), handled in batches
+# as a N x 54 uint8 NumPy array.
+# Each robot move is a facelets permutation: the permutations of a full robot moves string are composed once,
+# so that applying the whole string to a batch of cube states is a single gather.
+#
+#############################################################################################################
+"""
+
+import threading                              # lock, as the permutations are composed by multiple threads
+import numpy as np
+import robot_moves as cm                      # flips and spins reaching the 24 cube orientations
+
+
+# Global variables
+
+# Facelets permutation per robot move: the resulting facelet i is the one currently in position ref[i]
+# (as example, in case of flip, the resulting facelet 0 is the one currently in position 53)
+facelets_perm = {
+    'F1':(53,52,51,50,49,48,47,46,45,11,14,17,10,13,16,9,12,15,0,1,2,3,4,5,6,7,8,
+          18,19,20,21,22,23,24,25,26,42,39,36,43,40,37,44,41,38,35,34,33,32,31,30,29,28,27),   # flip
+    'S1':(2,5,8,1,4,7,0,3,6,18,19,20,21,22,23,24,25,26,36,37,38,39,40,41,42,43,44,
+          33,30,27,34,31,28,35,32,29,45,46,47,48,49,50,51,52,53,9,10,11,12,13,14,15,16,17),    # spin CW
+    'S3':(6,3,0,7,4,1,8,5,2,45,46,47,48,49,50,51,52,53,9,10,11,12,13,14,15,16,17,
+          29,32,35,28,31,34,27,30,33,18,19,20,21,22,23,24,25,26,36,37,38,39,40,41,42,43,44),   # spin CCW
+    'R1':(0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,24,25,26,18,19,20,21,22,23,42,43,44,
+          33,30,27,34,31,28,35,32,29,36,37,38,39,40,41,51,52,53,45,46,47,48,49,50,15,16,17),   # 1st layer rotation CW
+    'R3':(0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,51,52,53,18,19,20,21,22,23,15,16,17,
+          29,32,35,28,31,34,27,30,33,36,37,38,39,40,41,24,25,26,45,46,47,48,49,50,42,43,44)    # 1st layer rotation CCW
+    }
+
+perm_arrays = {move: np.array(ref) for move, ref in facelets_perm.items()}   # permutations as NumPy arrays
+perm_cache = {}          # dict with the composed permutation (NumPy array) per robot moves string
+max_cached = 4096        # max amount of cached permutations, the cache is emptied once reached
+cache_lock = threading.Lock()   # lock to access the permutations cache
+
+
+
+
+
+
+def move_permutation(moves):
+    """ Returns the facelets permutation (NumPy array) of a robot moves string (i.e. 'F2R1S3'), by composing the
+        permutation of each single move. Permutations are cached per moves string (read-only arrays, shared by the
+        callers), the cache can be used by multiple threads."""
+
+    with cache_lock:
+        perm = perm_cache.get(moves)
+    if perm is not None:                             # case the moves string has been already composed
+        return perm
+
+    perm = np.arange(54)                             # identity permutation
+    for i in range(0, len(moves), 2):                # iteration over the robot moves, with steps = 2
+        if moves[i] == 'F':                          # case of flips
+            ref, repeats = perm_arrays['F1'], int(moves[i+1])
+        else:                                        # case of spin or layer rotation
+            ref, repeats = perm_arrays[moves[i:i+2]], 1
+        for j in range(repeats):                     # iteration over the amount of flips
+            perm = perm[ref]                         # state[perm][ref] is state[perm[ref]]
+
+    perm.flags.writeable = False                     # the cached permutation is shared, it can't be changed
+    with cache_lock:
+        if len(perm_cache) >= max_cached:            # case the cache is full
+            perm_cache.clear()
+        perm_cache[moves] = perm
+    return perm
+
+
+
+
+
+
+def to_array(cubestrings):
+    """ Returns the N x 54 uint8 array of a list of cube status strings (54 facelets each)."""
+
+    data = ''.join(cubestrings).encode('ascii')      # all the facelets letters, as bytes
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 54).copy()
+
+
+
+
+
+
+def to_strings(states):
+    """ Returns the list of cube status strings of a N x 54 uint8 array."""
+
+    return [row.tobytes().decode('ascii') for row in states]
+
+
+
+
+
+
+def apply_moves(states, moves):
+    """ Applies the same robot moves string to a batch of cube states (N x 54 array), with a single gather."""
+
+    return states[:, move_permutation(moves)]
+
+
+
+
+
+
+def apply_batch(states, moves_list):
+    """ Applies a robot moves string per cube state (N x 54 array, with N moves strings), with a single gather."""
+
+    perms = np.stack([move_permutation(moves) for moves in moves_list])   # N x 54 permutations
+    return np.take_along_axis(states, perms, axis=1)
+
+
+
+
+
+
+def is_solved(states):
+    """ Returns a boolean array telling, per cube state (N x 54 array), if all the facelets have the color of their
+        face center."""
+
+    faces = states.reshape(-1, 6, 9)                 # facelets per face
+    return np.all(faces == faces[:, :, 4:5], axis=(1, 2))
+
+
+
+
+
+
+def verify_programs(cubestrings, moves_list):
+    """ Applies the robot moves strings to the related cube status strings, and returns a boolean array telling
+        which robot programs really solve their cube."""
+
+    return is_solved(apply_batch(to_array(cubestrings), moves_list))
+
+
+
+
+
+
+def reoriented_cubestring(cubestring, orientation):
+    """ Returns the cube status string as seen once the cube is placed in orientation (index of robot_moves.orientations).
+        The facelets are moved via the flips and spins reaching the orientation, and relabelled as per the new
+        center facelets, so that the string is a valid input for the solver."""
+
+    perm = move_permutation(cm.orient_moves[orientation])   # flips and spins reaching the orientation
+    state = ''.join([cubestring[r] for r in perm])
+
+    relabel = {state[9*f+4]: cm.faces[f] for f in range(6)}   # center facelets define the face letters
+    return ''.join([relabel.get(c, c) for c in state])
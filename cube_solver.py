@@ -0,0 +1,461 @@
+"""
+#############################################################################################################
+#
+# The Kociemba solver returns the shortest solution (face turns) found within the timeout, yet on this robot
+# the face turns are not the right metric: the solution time depends on the flips, spins and layer rotations
+# needed to bring each face to the bottom.
+# This script collects several candidate solutions from the twophase solver, within the same time budget,
+# translates each of them into robot moves and returns the one with the lowest predicted robot time.
+#
+# The returned string has the same format of the twophase solver (i.e. 'U1 R2 F3 (3f)'), therefore it can
+# be used in place of twophase.solver.solve()
+#
+# Optionally the cube is also solved as seen from other orientations (up to 24), in a process pool: the same
+# physical cube gets different solutions per orientation, and all of them are mapped back to the cube
+# orientation as it is placed on the robot, where they are ranked: no reorientation is needed on the robot.
+# The pool is started once (see start_pool), i.e. by the solver server, and shared by the requests.
+#
+# When no timeout is given, the solving time is adaptive: the search continues as long as the robot time saved
+# by the recent solutions is expected to exceed the extra solving time (the robot waits for the solver), as per
+# the budget settings (solver_budget.json, or the default ones).
+#
+#############################################################################################################
+"""
+
+import threading as thr                       # the twophase solver runs six search threads in parallel
+import time                                   # time library, for the solver timeout
+import os                                     # os is imported to get the amount of CPUs
+import multiprocessing as mp                  # processes to solve the cube orientations in parallel
+import concurrent.futures as cf               # pool of processes to solve the cube orientations in parallel
+import solver_tables as st                    # solver tables generated in parallel when missing, and memory mapped
+st.map_tables()                               # before the twophase solver import, that would generate them serially
+import twophase.solver as sv                  # Kociemba solver library (by Hergbert Kociemba)
+import twophase.face as face                  # Kociemba solver library (by Hergbert Kociemba)
+import twophase.cubie as cubie                # Kociemba solver library (by Hergbert Kociemba)
+import robot_moves as cm                      # translate a cube solution into robot moves
+import cube_simulator as sim                  # facelets permutations of the robot moves
+import solution_cache as sc                   # persistent cache of the solutions, symmetric cubes share the entries
+import near_solved as ns                      # optimal solutions of the cubes near the solved one, via an index
+import cube_validator as cv                   # cube status coherence checks, before calling the solver
+import solver_budget as sb                    # adaptive solving time, as per the robot time saved by the solutions
+
+
+# Global variables
+max_candidates = 12      # max amount of candidate solutions (the shortest ones) estimated via the moves_dict
+rank_best = 4            # max amount of candidate solutions (the fastest ones) rewritten as per the robot
+all_orientations = tuple(range(24))   # indexes of the 24 cube orientations (as per robot_moves.orientations)
+search_share = 0.7       # share of the time per orientation for the solver search, the rest is for the ranking
+rank_reserve = 0.15      # time (s) kept for the ranking of the last candidates, at the end of a single orientation solving
+pool = None              # process pool solving the cube orientations, started once by start_pool()
+pool_workers = 0         # amount of processes in the pool
+pool_lock = thr.Lock()   # lock to start the pool once
+
+
+
+
+
+
+def start_search(cubestring, timeout, terminated):
+    """ Starts the twophase solver search threads (3 cube rotations, and the inverse cube), each of them with its own
+        list of solutions: every time a thread finds a shorter solution it is stored, and the search continues
+        until the timeout, or until the terminated event is set.
+        The function returns the list of threads and the list of solutions lists (one per thread), or the error
+        string from the solver in case of invalid cube string."""
+
+    fc = face.FaceCube()
+    s = fc.from_string(cubestring)                # facelet cube from the cube status string
+    if s != cubie.CUBE_OK:                        # case the cube status string is not valid
+        return s                                  # error string from the solver is returned
+    cc = fc.to_cubie_cube()
+    s = cc.verify()                               # cube coherence is verified
+    if s != cubie.CUBE_OK:                        # case the cube is not valid
+        return s                                  # error string from the solver is returned
+
+    # threads to start, as per twophase.solver.solve(), in case of cube symmetries
+    syms = cc.symmetries()
+    if len(list({16, 20, 24, 28} & set(syms))) > 0:   # case of rotational symmetry along a long diagonal
+        tr = [0, 3]                               # only one direction and the inverse are searched
+    else:
+        tr = range(6)                             # 3 directions and the inverse cube are searched
+    if len(list(set(range(48, 96)) & set(syms))) > 0: # case of antisymmetry, the inverse cube is not searched
+        tr = list(filter(lambda x: x < 3, tr))
+
+    threads = []                                  # list of the search threads
+    solutions = []                                # list of solutions lists, one per thread
+    s_time = time.monotonic()                     # search start time
+    for i in tr:                                  # iteration over the cube rotations and inversion
+        solutions.append([])                      # each thread has its own solutions list
+        # ret_length is set to zero: the search is only terminated by the timeout (or by the terminated event)
+        th = sv.SolverThread(cc, i % 3, i // 3, 0, timeout, s_time, solutions[-1], terminated, [999])
+        threads.append(th)
+        th.start()
+    return threads, solutions
+
+
+
+
+
+
+def new_candidates(solutions, found):
+    """ Returns the solutions (as strings, i.e. 'U1R2F3') not yet in the found set, that is updated."""
+
+    candidates = []                               # list of the new solutions
+    for thread_solutions in solutions:            # iteration over the solutions lists
+        for man in list(thread_solutions):        # iteration over the solutions found by the thread (so far)
+            candidate = ''.join([m.name for m in man])
+            if candidate not in found:            # case the solution is not yet in the set
+                found.add(candidate)
+                candidates.append(candidate)
+    return candidates
+
+
+
+
+
+
+def solver_candidates(cubestring, timeout=2):
+    """ Runs the twophase solver search threads until the timeout, and returns all the found solutions as list of
+        strings (i.e. 'U1R2F3'), or the error string from the solver in case of invalid cube string."""
+
+    search = start_search(cubestring, timeout, thr.Event())
+    if isinstance(search, str):                   # case the solver returned an error
+        return search
+    threads, solutions = search
+    for th in threads:
+        th.join()                                 # wait until all threads have finished
+    return new_candidates(solutions, set())
+
+
+
+
+
+
+def known_solution(cubestring, max_length, robot_settings, use_cache=True):
+    """ Returns the solution (i.e. 'U1R2F3') of the cube when it is known without solving: the optimal one for cubes
+        near the solved one, or the cached one for cubes (or symmetric cubes) solved before, rewritten as per the
+        robot in both the cases. Otherwise None.
+        When use_cache is False, None is returned (the cube is solved anyhow)."""
+
+    if not use_cache:                             # case the known solutions are not used (i.e. benchmarks, tests)
+        return None
+    solution = ns.lookup(cubestring)              # optimal solution, in case the cube is near the solved one
+    if solution is None:                          # case the cube is not near the solved one
+        solution = sc.lookup(cubestring, max_length)   # solution of the same (or a symmetric) cube, solved before
+    if solution is not None:                      # case the solution is known
+        # commuting moves reordered as per the robot: the solution of a symmetric cube is mapped move by move, and
+        # the best order of the commuting moves depends on the faces they are mapped to
+        solution = cm.rewrite_solution(solution, robot_settings)[0]
+    return solution
+
+
+
+
+
+
+def format_solution(solution):
+    """ Returns the solution (i.e. 'U1R2F3') as per twophase solver format, i.e. 'U1 R2 F3 (3f)'."""
+
+    s = ''                                        # solution string as per twophase solver format
+    for i in range(0, len(solution), 2):          # iteration over the solver moves
+        s += solution[i:i+2] + ' '
+    return s + '(' + str(len(solution) // 2) + 'f)'
+
+
+
+
+
+
+def estimated_time(solution, robot_settings):
+    """ Returns the robot time (ms) of the solution as executed by the robot (the moves_dict translation): a fast
+        estimate (about 0.1 ms), used to select the candidates worth the rewrite as per the robot (a few ms)."""
+
+    return cm.executed_time(solution, robot_settings)
+
+
+
+
+
+
+def rank_candidates(candidates, max_length, robot_settings, deadline=None):
+    """ Translates the candidate solutions into robot moves, and returns the solution with the lowest robot time,
+        among those having max_length face turns or less (the shortest ones in case there are none).
+        The shortest candidates are pre-ranked via the robot time of the moves executed by the robot, only the best
+        rank_best of them are rewritten as per the robot (commuting moves on opposite faces reordered) and ranked,
+        with the same robot time.
+        Once the deadline (time.time() value) is passed, the remaining candidates are skipped (one is ranked anyhow).
+        The function returns the best solution and its robot time (ms)."""
+
+    candidates = sorted(candidates, key=len)      # shortest solutions first
+    shortest = len(candidates[0])                 # length of the shortest solution
+    candidates = [c for c in candidates if len(c) <= max(2*max_length, shortest)][:max_candidates]
+    candidates = sorted(candidates, key=lambda c: estimated_time(c, robot_settings))[:rank_best]
+
+    best, best_time = None, None                  # solution with the lowest robot time
+    for candidate in candidates:                  # iteration over the candidate solutions, best estimated first
+        if best is not None and deadline is not None and time.time() >= deadline:   # case of no time left
+            break
+        candidate, robot_time = cm.rewrite_solution(candidate, robot_settings)   # predicted robot time (ms)
+        if best_time is None or robot_time < best_time:   # case of a faster solution on the robot
+            best, best_time = candidate, robot_time
+    return best, best_time
+
+
+
+
+
+
+def pool_warmup(i):
+    """ Returns the process id of the pool worker: the task makes the worker import this module (and the solver
+        tables), before the first cube is solved."""
+
+    return os.getpid()
+
+
+
+
+
+
+def start_pool(workers=None):
+    """ Starts the process pool solving the cube orientations, once, and returns it once the workers are ready.
+        Processes are started via forkserver where available, otherwise via spawn: forking a threaded process (i.e. the
+        solver server) isn't safe. Each worker imports this module, the solver tables are memory mapped (see
+        solver_tables), therefore shared via the page cache rather than loaded per worker."""
+
+    global pool, pool_workers
+
+    with pool_lock:
+        if pool is None:                          # case the pool has not been started yet
+            workers = workers or os.cpu_count() or 1   # one worker per CPU
+            method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+            pool = cf.ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(method))
+            pool_workers = workers
+            list(pool.map(pool_warmup, range(workers)))   # waits for the workers to be ready
+    return pool
+
+
+
+
+
+
+def orientation_solve(args):
+    """ Solves the cube as seen from one orientation, and returns the best solution (mapped back to the cube as placed
+        on the robot) with its robot time, or the solver error string. Used as process pool task.
+        The orientation gets slot seconds from its start, and not beyond the deadline (time.time() value) of the whole
+        solving: search_share of that time is for the solver search, the rest for the candidates ranking.
+        None is returned when the task starts after the deadline (i.e. the orientation is skipped); the orientation
+        is always solved when deadline is None."""
+
+    cubestring, orientation, max_length, slot, deadline, robot_settings = args
+    if deadline is not None and time.time() >= deadline:   # case of no time left for this orientation
+        return None
+    end = time.time() + slot if deadline is None else min(time.time() + slot, deadline)   # time to solve it by
+    search_time = max(end - time.time(), 0) * search_share   # the search stops once a solution is found, at least
+    candidates = solver_candidates(sim.reoriented_cubestring(cubestring, orientation), search_time)
+    if isinstance(candidates, str):               # case the solver returned an error
+        return candidates
+    candidates = [cm.original_frame(c, orientation) for c in candidates]
+    return rank_candidates(candidates, max_length, robot_settings, end)
+
+
+
+
+
+
+def orientation_tasks(cubestring, orientations, max_length, timeout, robot_settings):
+    """ Returns the orientation_solve() arguments per orientation: the timeout is split among the rounds of solving
+        (with all the pool workers busy), the deadline being the solving start plus the timeout. The first orientation
+        has no deadline, therefore a solution is found anyhow (i.e. when the pool is busy with other requests)."""
+
+    rounds = -(-len(orientations) // pool_workers)   # rounds of solving, with all the workers busy
+    deadline = time.time() + timeout              # the whole solving, ranking included, ends by the deadline
+    return [(cubestring, o, max_length, timeout/rounds, deadline if i else None, robot_settings)
+            for i, o in enumerate(orientations)]
+
+
+
+
+
+
+def orientations_solve(cubestring, max_length=20, timeout=2, robot_settings=None, orientations=all_orientations):
+    """ Solves the cube from each of the orientations (indexes of robot_moves.orientations) in the process pool, and
+        returns the solution with the lowest robot time and its robot time (ms). The solutions are mapped back to the
+        cube as placed on the robot, and ranked there by the robot time of the moves the robot executes: the robot
+        doesn't need to reorient the cube, whatever the orientation the solution has been found from.
+        The timeout is split among the orientations, each one searching and ranking its candidates within its share:
+        the solving ends about by the timeout, yet each orientation gets a fraction of the time of a single solving.
+        In case of solver error, the error string and None are returned.
+        The pool is started on the first call, when not started yet (see start_pool)."""
+
+    if robot_settings is None:                    # case the servos settings are not provided
+        robot_settings = cm.load_robot_settings() # servos settings from robot_settings.json, or the default ones
+
+    pool = start_pool()                           # pool shared by the requests, started once
+    tasks = orientation_tasks(cubestring, list(orientations), max_length, timeout, robot_settings)
+
+    best, best_time = None, None                  # solution with the lowest robot time
+    for result in pool.map(orientation_solve, tasks):   # iteration over the orientations results
+        if result is None:                        # case the orientation has been skipped, for the deadline
+            continue
+        if isinstance(result, str):               # case the solver returned an error
+            return result, None
+        if best_time is None or result[1] < best_time:   # case of a faster solution on the robot
+            best, best_time = result
+    return best, best_time
+
+
+
+
+
+
+def solve(cubestring, max_length=20, timeout=2, robot_settings=None, robot_rank=True, orientations=None, use_cache=True):
+    """ Solves the cube, and returns the solution with the lowest predicted robot time, among those having max_length
+        face turns or less (the shortest one in case there are none).
+        When orientations (i.e. all_orientations) are provided, the cube is solved from each of them in parallel.
+        The returned string has the twophase solver format, i.e. 'U1 R2 F3 (3f)'.
+        The robot time is predicted via the robot_moves timing model, with robot_settings (loaded from the
+        robot_settings.json file when not provided).
+        When robot_rank is False, the twophase solver is called as it is (shortest solution).
+        When use_cache is False, the solutions cache and the near solved cubes index are neither read nor updated."""
+
+    if not robot_rank:                            # case the solutions ranking is not requested
+        return sv.solve(cubestring, max_length, timeout if timeout is not None else sb.default_budget["MAX_TIME"])
+
+    if timeout is None:                           # case of adaptive solving time
+        result = []                               # final solution, from the anytime solver
+        solve_anytime(cubestring, lambda solution, robot_time, final: result.append(solution) if final else None,
+                      max_length, None, robot_settings, orientations, use_cache=use_cache)
+        return result[-1]
+
+    defect = cv.check(cubestring)                 # incoherent cube status, rejected without solving
+    if defect:
+        return 'Error: ' + defect
+    if robot_settings is None:                    # case the servos settings are not provided
+        robot_settings = cm.load_robot_settings() # servos settings from robot_settings.json, or the default ones
+
+    known = known_solution(cubestring, max_length, robot_settings, use_cache)   # near solved, or solved before
+    if known is not None:                         # case the solution is already known
+        return format_solution(known)
+
+    if orientations:                              # case the cube is solved from multiple orientations
+        best, best_time = orientations_solve(cubestring, max_length, timeout, robot_settings, orientations)
+        if best_time is None:                     # case the solver returned an error
+            return best
+    else:                                         # case the cube is solved as placed on the robot
+        deadline = time.time() + timeout          # the solving, ranking included, ends by the deadline
+        candidates = solver_candidates(cubestring, timeout * search_share)   # solutions found by the twophase solver
+        if isinstance(candidates, str):           # case the solver returned an error
+            return candidates
+        best, best_time = rank_candidates(candidates, max_length, robot_settings, deadline)
+
+    if use_cache:                                 # case the cache is in use
+        sc.store(cubestring, best)                # solution is cached
+    return format_solution(best)
+
+
+
+
+
+
+def solve_anytime(cubestring, report, max_length=20, timeout=2, robot_settings=None, orientations=None, cancel=None,
+                  use_cache=True):
+    """ Solves the cube as solve() does, while streaming the improving solutions: report(solution, robot_time, final)
+        is called every time a solution with lower robot time is found (solution as per twophase solver format,
+        robot_time in ms), and a last time with final=True. In case of solver error, report(error, None, True) is called.
+        The solving is interrupted, without the final report, once the cancel event (threading.Event) is set.
+        When timeout is None the solving time is adaptive, as per the budget settings (see solver_budget.budget_stop).
+        The candidates ranking is part of the solving time: the search stops rank_reserve before the timeout, and the
+        ranking stops at the timeout (once a solution is ranked).
+        When use_cache is False, the solutions cache and the near solved cubes index are neither read nor updated.
+        Meant to run on a background thread (i.e. the GUI), the report function is called from that thread."""
+
+    defect = cv.check(cubestring)                 # incoherent cube status, rejected without solving
+    if defect:
+        report('Error: ' + defect, None, True)
+        return
+    if robot_settings is None:                    # case the servos settings are not provided
+        robot_settings = cm.load_robot_settings() # servos settings from robot_settings.json, or the default ones
+    if cancel is None:                            # case the cancel event is not provided
+        cancel = thr.Event()
+    best, best_time = None, None                  # solution with the lowest robot time so far
+    budget = sb.load_budget_settings() if timeout is None else None   # adaptive solving time settings
+    if budget is not None:                        # case of adaptive solving time
+        timeout = budget["MAX_TIME"]              # the solver runs until the budget stops it, or the max time
+    history = []                                  # (elapsed time, robot time) of the improving solutions
+    stop = None                                   # reason the adaptive budget stopped the solving
+    t_start = time.time()
+    deadline = t_start + timeout                  # the solving, ranking included, ends by the deadline
+
+    known = known_solution(cubestring, max_length, robot_settings, use_cache)   # near solved, or solved before
+    if known is not None:                         # case the solution is already known
+        robot, moves, robot_tot_moves = cm.robot_required_moves(known, "", robot_settings=robot_settings)
+        report(format_solution(known), cm.robot_moves_time(moves, robot_settings)[2], True)
+        return
+
+    if orientations:                              # case the cube is solved from multiple orientations
+        orientations = list(orientations)
+        pool = start_pool()                       # pool shared by the requests, started once
+        pending = {pool.submit(orientation_solve, task)
+                   for task in orientation_tasks(cubestring, orientations, max_length, timeout, robot_settings)}
+        while pending and not cancel.is_set():   # case there are orientations still to be solved
+            done, pending = cf.wait(pending, timeout=0.05, return_when=cf.FIRST_COMPLETED)
+            for future in done:                   # iteration over the solved orientations
+                result = future.result()
+                if result is None:                # case the orientation has been skipped, for the deadline
+                    continue
+                if isinstance(result, str):       # case the solver returned an error
+                    for future in pending:        # the orientations not started yet are cancelled
+                        future.cancel()
+                    report(result, None, True)
+                    return
+                if best_time is None or result[1] < best_time:   # case of a faster solution on the robot
+                    best, best_time = result
+                    history.append((time.time() - t_start, best_time))
+                    report(format_solution(best), best_time, False)
+            if budget is not None:                # case of adaptive solving time
+                stop = sb.budget_stop(history, time.time() - t_start, budget)
+                if stop and best is not None:     # case the budget stops the solving, with a solution
+                    break
+        for future in pending:                    # the orientations not started yet are cancelled
+            future.cancel()
+
+    else:                                         # case the cube is solved as placed on the robot
+        terminated = thr.Event()                  # event to terminate the solver threads
+        search = start_search(cubestring, max(timeout - rank_reserve, 0), terminated)
+        if isinstance(search, str):               # case the solver returned an error
+            report(search, None, True)
+            return
+        threads, solutions = search
+        found = set()                             # solutions already ranked
+        while any([th.is_alive() for th in threads]):   # case the solver threads are still searching
+            if cancel.is_set():                   # case the solving has been cancelled
+                terminated.set()
+                break
+            time.sleep(0.05)
+            candidates = new_candidates(solutions, found)
+            if candidates:                        # case of new solutions
+                solution, robot_time = rank_candidates(candidates, max_length, robot_settings, deadline)
+                if best_time is None or robot_time < best_time:   # case of a faster solution on the robot
+                    best, best_time = solution, robot_time
+                    history.append((time.time() - t_start, best_time))
+                    report(format_solution(best), best_time, False)
+            if budget is not None:                # case of adaptive solving time
+                stop = sb.budget_stop(history, time.time() - t_start, budget)
+                if stop and best is not None:     # case the budget stops the solving, with a solution
+                    terminated.set()
+                    break
+        for th in threads:
+            th.join()                             # wait until all threads have finished
+        candidates = new_candidates(solutions, found)   # solutions found after the last check
+        if candidates:                            # case of new solutions
+            solution, robot_time = rank_candidates(candidates, max_length, robot_settings, deadline)
+            if best_time is None or robot_time < best_time:   # case of a faster solution on the robot
+                best, best_time = solution, robot_time
+
+    if budget is not None and budget["LOG"]:      # case the budget decisions are logged
+        steps = ', '.join([f'{t:.2f}s:{rt/1000:.1f}s' for t, rt in history])   # solving time : robot time
+        print(f'solver budget: stopped at {time.time()-t_start:.2f} s ({stop or "search completed"}), '
+              f'robot time per solving time: {steps}')
+    if not cancel.is_set():                       # case the solving has not been cancelled
+        if use_cache:                             # case the cache is in use
+            sc.store(cubestring, best)            # solution is cached
+        report(format_solution(best), best_time, True)
@@ -0,0 +1,128 @@
+"""
+#############################################################################################################
+#
+# Cube status validator: checks a cube status string (54 facelets, URFDLB faces order as per the Kociemba solver)
+# for the coherence of a real cube, before calling the solver.
+# Cube states are handled in batches as a N x 54 uint8 NumPy array (see cube_simulator), all the checks are
+# vectorized: invalid candidates (i.e. wrong colors interpretation) are rejected without any solver round trip.
+#
+# Checks, in order (the first failing one is the reported defect):
+#  - facelets: 54 facelets, each one among the face letters URFDLB
+#  - colors: 9 facelets per color
+#  - centers: center facelets as per the face they belong to (U center on U face, etc)
+#  - corners: each corner has an existing colors triple, and each of the 8 corners is present once
+#  - edges: each edge has an existing colors pair, and each of the 12 edges is present once
+#  - twist: corners orientation sum must be multiple of 3
+#  - flip: edges orientation sum must be even
+#  - parity: corners and edges permutations must have the same parity
+#
+#############################################################################################################
+"""
+
+import numpy as np
+import twophase.defs as defs                  # Kociemba solver library (by Hergbert Kociemba), for the cubies facelets
+import robot_moves as cm                      # face letters, in URFDLB order
+import cube_simulator as sim                  # cube status strings to NumPy array
+
+
+# Global variables
+defects = ('',                                # defect code 0, valid cube status
+           'facelets not among URFDLB letters',
+           'not 9 facelets per color',
+           'wrong center facelets',
+           'invalid corner colors',
+           'invalid edge colors',
+           'corners twisted (orientation sum not multiple of 3)',
+           'edges flipped (orientation sum not even)',
+           'corners and edges permutation parity mismatch')
+
+# facelets position of each corner (8 x 3) and edge (12 x 2), first facelet on the U or D face (F or B face for the
+# middle layer edges)
+corner_facelets = np.array([[int(f) for f in c] for c in defs.cornerFacelet])
+edge_facelets = np.array([[int(f) for f in e] for e in defs.edgeFacelet])
+
+# face value (0 to 5) per facelet letter, 6 for any other character
+facelet_value = np.full(256, 6, dtype=np.uint8)
+facelet_value[np.frombuffer(cm.faces.encode('ascii'), dtype=np.uint8)] = np.arange(6, dtype=np.uint8)
+
+# corner and orientation per colors triple (code 36*c0 + 6*c1 + c2), -1 for the not existing ones; orientation is the
+# position, within the triple, of the U or D color
+corner_table = np.full((216, 2), -1, dtype=np.int8)
+for j, colors in enumerate(defs.cornerColor):
+    for o in range(3):                            # iteration over the corner orientations
+        c = [int(colors[(k - o) % 3]) for k in range(3)]   # colors as read on the corner facelets, when twisted by o
+        corner_table[36*c[0] + 6*c[1] + c[2]] = (j, o)
+
+# edge and orientation per colors pair (code 6*c0 + c1), -1 for the not existing ones
+edge_table = np.full((36, 2), -1, dtype=np.int8)
+for j, colors in enumerate(defs.edgeColor):
+    for o in range(2):                            # iteration over the edge orientations
+        c = [int(colors[(k + o) % 2]) for k in range(2)]   # colors as read on the edge facelets, when flipped by o
+        edge_table[6*c[0] + c[1]] = (j, o)
+
+pairs_8 = np.triu(np.ones((8, 8), dtype=bool), 1)     # i < j pairs, to count the permutation inversions
+pairs_12 = np.triu(np.ones((12, 12), dtype=bool), 1)
+
+
+
+
+
+
+def permutation_parity(perm, pairs):
+    """ Returns the parity (0 or 1) of each permutation of a N x n array, via the amount of inversions."""
+
+    inversions = (perm[:, :, None] > perm[:, None, :]) & pairs   # perm[i] > perm[j] with i < j
+    return inversions.sum(axis=(1, 2)) % 2
+
+
+
+
+
+
+def check_states(states):
+    """ Returns the defect code (index of the defects tuple, 0 when valid) of each cube state of a N x 54 uint8 array
+        of facelets letters. Each cube state gets the code of its first failing check."""
+
+    code = np.zeros(len(states), dtype=np.uint8)
+
+    def fail(mask, defect):                       # assigns the defect to the cube states without a previous one
+        code[(code == 0) & mask] = defect
+
+    values = facelet_value[states]                # face value per facelet
+    fail((values == 6).any(axis=1), 1)
+    counts = np.stack([(values == f).sum(axis=1) for f in range(6)], axis=1)
+    fail((counts != 9).any(axis=1), 2)
+    fail((values[:, 4::9] != np.arange(6)).any(axis=1), 3)
+    values = np.minimum(values, 5)                # other characters are already reported, the tables stay in range
+
+    c = values[:, corner_facelets].astype(np.int32)            # N x 8 x 3 corner colors
+    corners = corner_table[36*c[:, :, 0] + 6*c[:, :, 1] + c[:, :, 2]]   # N x 8 x 2 corner and orientation
+    present = np.zeros((len(states), 9), dtype=bool)           # last column collects the not existing corners
+    present[np.arange(len(states))[:, None], corners[:, :, 0]] = True
+    fail((corners[:, :, 0] < 0).any(axis=1) | ~present[:, :8].all(axis=1), 4)
+
+    e = values[:, edge_facelets].astype(np.int32)              # N x 12 x 2 edge colors
+    edges = edge_table[6*e[:, :, 0] + e[:, :, 1]]              # N x 12 x 2 edge and orientation
+    present = np.zeros((len(states), 13), dtype=bool)          # last column collects the not existing edges
+    present[np.arange(len(states))[:, None], edges[:, :, 0]] = True
+    fail((edges[:, :, 0] < 0).any(axis=1) | ~present[:, :12].all(axis=1), 5)
+
+    fail(corners[:, :, 1].sum(axis=1) % 3 != 0, 6)
+    fail(edges[:, :, 1].sum(axis=1) % 2 != 0, 7)
+    fail(permutation_parity(corners[:, :, 0], pairs_8) != permutation_parity(edges[:, :, 0], pairs_12), 8)
+    return code
+
+
+
+
+
+
+def check(cubestrings):
+    """ Returns the defect description of each cube status string of a list ('' when valid), or of a single cube
+        status string when a string is provided."""
+
+    if isinstance(cubestrings, str):              # case of a single cube status string
+        return check([cubestrings])[0]
+    valid_length = [len(s) == 54 and s.isascii() for s in cubestrings]
+    states = sim.to_array([s if ok else '.' * 54 for s, ok in zip(cubestrings, valid_length)])
+    return [defects[c] for c in check_states(states)]
@@ -0,0 +1,220 @@
+"""
+#############################################################################################################
+#
+# Near-solved cubes fast path: index of all the cube states within max_depth face turns from the solved cube,
+# with their optimal solution (the twophase solver returns near-optimal solutions, after the full search setup).
+#
+# The index is generated once via a breadth first search, on batches of cube states (NumPy arrays of facelets),
+# skipping the moves sequences that can't be optimal (same face twice, or opposite faces in both orders).
+# It is stored in the tables folder as two sorted NumPy files, memory mapped at lookup:
+#  - near_solved_keys.npy: 64 bits hash of each cube state (facelets)
+#  - near_solved_moves.npy: solution of each cube state, 5 bits per face turn (first move in the lowest bits), ended
+#    by a NO_MOVE field (64 bits per solution, up to MAX_DEPTH face turns plus the end field)
+# Found solutions are verified on the cube state, cube states not in the index fall through to the solver.
+#
+# Index generation: python near_solved.py --depth 6 (depth 5 is ~0.6M states, depth 6 is ~8M states, ~1 GB to build)
+#
+#############################################################################################################
+"""
+
+import argparse                               # command line arguments
+import os                                     # os is imported to ensure the file presence
+import time                                   # time library, to report the index generation time
+import numpy as np
+import twophase.defs as defs                  # Kociemba solver library (by Hergbert Kociemba), for the tables folder
+import robot_moves as cm                      # robot moves per solver move, and orientations
+import cube_simulator as sim                  # facelets permutations of the robot moves
+
+
+# Global variables
+max_depth = 5                                 # max face turns of the indexed cube states (up to MAX_DEPTH)
+MAX_DEPTH = 11                                # max face turns of a packed solution, 12 fields of 5 bits fit 64 bits
+KEYS_FILE = 'near_solved_keys.npy'            # index file with the sorted cube states hashes
+MOVES_FILE = 'near_solved_moves.npy'          # index file with the solutions, in the same order of the keys
+NO_MOVE = 31                                  # 5 bits field value for no move (solution end)
+NO_MOVES = np.uint64(2**(5*(MAX_DEPTH+1)) - 1)   # packed solution with only NO_MOVE fields (solved cube)
+chunk = 50000                                 # cube states expanded per batch, while generating the index
+
+keys = None                                   # memory mapped hashes of the indexed cube states
+solutions = None                              # memory mapped solutions of the indexed cube states
+
+
+# Facelets permutation of the 18 solver moves (U1, U2, U3, R1, ... B3): the robot moves for the solver move, followed
+# by the flips and spins bringing the cube back to the initial orientation
+face_turn_perms = np.array([sim.move_permutation(cm.robot_move_table[0][m][0])[
+                            np.argsort(sim.move_permutation(cm.orient_moves[cm.robot_move_table[0][m][1]]))]
+                            for m in range(18)])
+inverse_move = np.array([3*(m//3) + 2 - m%3 for m in range(18)])   # solver move reverting each solver move
+
+facelet_value = np.zeros(256, dtype=np.uint64)           # 3 bits value per facelet letter
+facelet_value[np.frombuffer(cm.faces.encode('ascii'), dtype=np.uint8)] = np.arange(6, dtype=np.uint64)
+facelet_shifts = np.arange(18, dtype=np.uint64) * np.uint64(3)   # facelets packed by 18 per 64 bits word
+
+
+
+
+
+
+def mix(h):
+    """ Returns the splitmix64 finalizer of an array of 64 bits values (good bits diffusion, for hashing)."""
+
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+
+
+
+
+
+def state_keys(states):
+    """ Returns the 64 bits hash of each cube state (N x 54 array of facelets letters): the 54 facelets are packed
+        into three 64 bits words (3 bits per facelet), mixed together."""
+
+    values = facelet_value[states].reshape(-1, 3, 18)    # 3 bits value per facelet, 18 facelets per word
+    words = np.bitwise_or.reduce(values << facelet_shifts, axis=2)
+    h = mix(words[:, 0])
+    h = mix(h ^ words[:, 1])
+    return mix(h ^ words[:, 2])
+
+
+
+
+
+
+def encode(solution):
+    """ Returns the packed solution (5 bits per move, first move lowest, NO_MOVE fields after the last move) of a
+        solution string (i.e. 'U1R2F3'), up to MAX_DEPTH face turns."""
+
+    moves = [cm.solver_move_index[solution[i:i+2]] for i in range(0, len(solution), 2)]
+    if len(moves) > MAX_DEPTH:                    # case the solution doesn't fit the packed format
+        raise ValueError(f'solutions up to {MAX_DEPTH} face turns can be packed, not {len(moves)}')
+    packed = int(NO_MOVES)
+    for m in reversed(moves):                     # iteration from the last move, the first one ends in the lowest bits
+        packed = ((packed << 5) | m) & int(NO_MOVES)
+    return np.uint64(packed)
+
+
+
+
+
+
+def decode(packed):
+    """ Returns the solution string (i.e. 'U1R2F3') of a packed solution (5 bits per move, first move lowest)."""
+
+    s = ''
+    packed = int(packed)
+    for i in range(MAX_DEPTH):                    # a packed solution has at most MAX_DEPTH moves
+        if packed & 31 == NO_MOVE:                # case of solution end
+            break
+        s += cm.solver_moves[packed & 31]
+        packed >>= 5
+    return s
+
+
+
+
+
+
+def build_index(depth=max_depth, folder=defs.FOLDER):
+    """ Generates the index of the cube states within depth face turns from the solved cube, via a breadth first
+        search on batches of cube states, and saves it to the tables folder."""
+
+    if not 0 <= depth <= MAX_DEPTH:               # case the solutions don't fit the packed format
+        raise ValueError(f'near solved index depth must be between 0 and {MAX_DEPTH}, not {depth}')
+    t_start = time.time()
+    solved = sim.to_array([''.join([f * 9 for f in cm.faces])])
+    frontier = (solved, np.array([-1]), np.array([NO_MOVES]))       # states, last move, solutions
+    all_keys, all_moves = [state_keys(solved)], [frontier[2]]   # index, per depth
+    seen = all_keys[0]                            # sorted hashes of the cube states already reached
+
+    faces = np.arange(18) // 3                    # face of each solver move
+    for d in range(1, depth + 1):                 # iteration over the depths
+        new_states, new_keys, new_moves = [], [], []
+        states, last, packed = frontier
+        for i in range(0, len(states), chunk):    # iteration over the batches of cube states
+            s, l, p = states[i:i+chunk], last[i:i+chunk], packed[i:i+chunk]
+            lf = np.where(l >= 0, l // 3, -9)     # face of the last move (-9 at the solved cube)
+            for m in range(18):                   # iteration over the solver moves
+                keep = (lf != faces[m]) & ~((lf == (faces[m] + 3) % 6) & (faces[m] < lf))   # not redundant sequences
+                if not keep.any():
+                    continue
+                child = s[keep][:, face_turn_perms[m]]
+                new_states.append(child if d < depth else None)
+                new_keys.append(state_keys(child))
+                new_moves.append(((p[keep] << np.uint64(5)) | np.uint64(inverse_move[m])) & NO_MOVES)
+        keys_d = np.concatenate(new_keys)
+        moves_d = np.concatenate(new_moves)
+        keys_d, first = np.unique(keys_d, return_index=True)   # duplicated cube states are removed
+        moves_d = moves_d[first]
+        new = ~np.isin(keys_d, seen, assume_unique=True)       # cube states not reached at lower depths
+        if d < depth:                             # case the states are expanded at the next depth
+            states_d = np.concatenate(new_states)[first][new]
+            last_d = inverse_move[moves_d[new] & np.uint64(31)]   # last move is the inverse of the solution first move
+            frontier = (states_d, last_d, moves_d[new])
+        all_keys.append(keys_d[new])
+        all_moves.append(moves_d[new])
+        seen = np.union1d(seen, keys_d[new])
+        print(f'near solved index, depth {d}: {new.sum()} cube states ({time.time()-t_start:.1f} s)')
+
+    keys_all = np.concatenate(all_keys)
+    order = np.argsort(keys_all)                  # index is sorted per hash, for binary search
+    np.save(os.path.join(folder, KEYS_FILE), keys_all[order])
+    np.save(os.path.join(folder, MOVES_FILE), np.concatenate(all_moves)[order])
+
+
+
+
+
+
+def load(folder=defs.FOLDER):
+    """ Memory maps the index files, once; the index is generated when missing (depth as per max_depth)."""
+
+    global keys, solutions
+
+    if keys is not None:                          # case the index is already loaded
+        return
+    if not (os.path.isfile(os.path.join(folder, KEYS_FILE)) and os.path.isfile(os.path.join(folder, MOVES_FILE))):
+        build_index(max_depth, folder)            # case of first run, or index deleted
+    keys = np.load(os.path.join(folder, KEYS_FILE), mmap_mode='r')
+    solutions = np.load(os.path.join(folder, MOVES_FILE), mmap_mode='r')
+    if solutions.dtype != np.uint64:              # case of index from a previous format (32 bits solutions)
+        build_index(max_depth, folder)
+        keys = np.load(os.path.join(folder, KEYS_FILE), mmap_mode='r')
+        solutions = np.load(os.path.join(folder, MOVES_FILE), mmap_mode='r')
+
+
+
+
+
+
+def lookup(cubestring):
+    """ Returns the optimal solution (i.e. 'U1R2F3') of the cube status string in case it is within the indexed depth
+        from the solved cube, otherwise None. The solution is verified on the cube before being returned."""
+
+    if len(cubestring) != 54 or not set(cubestring) <= set(cm.faces):   # case of invalid cube status string
+        return None
+    load()
+    state = sim.to_array([cubestring])
+    key = state_keys(state)[0]
+    i = int(np.searchsorted(keys, key))
+    if i == len(keys) or keys[i] != key:          # case the cube state is not in the index
+        return None
+
+    solution = decode(solutions[i])
+    for j in range(0, len(solution), 2):          # iteration over the solution moves
+        state = state[:, face_turn_perms[cm.solver_move_index[solution[j:j+2]]]]
+    if not sim.is_solved(state)[0]:               # case of hash collision with another cube state
+        return None
+    return solution
+
+
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates the index of the cube states near the solved one')
+    parser.add_argument('--depth', type=int, default=max_depth, help='max face turns from the solved cube (6 is ~8M states)')
+    args = parser.parse_args()
+    build_index(args.depth)
@@ -19,12 +19,23 @@
 # 5) Example 'F1R1S3' means: 1x cube Flip, 1x (90deg) CW rotation of the 1st (Down) layer, 1x (90deg) CCW cube Spin 
 #
 #
+# The robot receives the solver string (the serial protocol and the firmware are unchanged), and it translates each
+# solver move via the moves_dict sequences: the moves_dict translation is therefore the executed program, and it is the
+# default one. The planner (cost-optimal robot moves) is opt-in, for offline analysis only
+#
+#
 # Note: If the cube status has been entered manually, or detected via a webcam apart from the robot,
 # the cube should be positioned with the Front face facing the viewer, and Upper facing upward
 #
 #############################################################################################################
 """
 
+import heapq        # priority queue, used by the planner to search the cheapest robot moves
+import json         # robot_settings.json, with the servos timing, is a json file
+import os           # os is imported to get the amount of CPUs
+import collections  # queue of the translations in progress, on batch mode
+import concurrent.futures as cf   # pool of processes, to translate large lists of solutions
+
 # Global variables
 
 # Below dict has all the possible robot movements, related to the cube solver string
@@ -36,254 +47,623 @@ moves_dict = {'U1':'F2R1S3', 'U2':'F2R1S3R1S3', 'U3':'F2S1R3',
               'R1':'S3F1R1', 'R2':'S3F1R1S3R1', 'R3':'S1F3R3'}
 
 
-# Cube orientation at the start, later updated after every cube movement on the robot
-h_faces={'L':'L','F':'F','R':'R'}   # dict with faces around the bottom/upper positioned faces
-v_faces={'D':'D','F':'F','U':'U'}   # dict with faces around the left/right positioned faces
-"""     
-v_faces{}   _______       
-           |       |
-           | ['U'] |
-           |_______|     h_faces{}  _______ _______ _______ 
-           |       |               |       |       |       |
-           | ['F'] |               | ['L'] | ['F'] | ['R'] |
-           |_______|               |_______|_______|_______|
-           |       |
-           | ['D'] |
-           |_______|    
+# Peephole rewrite rules for the robot moves, as single robot movements: the moves on the left are replaced by the
+# ones on the right (empty when cancelled). All the rules keep the cube holder position of the following moves.
+peephole_rules = (
+    (('S1','S3'), ()),                # a CW spin followed by a CCW spin cancel each other out
+    (('S3','S1'), ()),                # a CCW spin followed by a CW spin cancel each other out
+    (('R1','R3'), ()),                # a CW layer rotation followed by a CCW rotation cancel each other out
+    (('R3','R1'), ()),                # a CCW layer rotation followed by a CW rotation cancel each other out
+    (('F1','F1','F1','F1'), ()),      # four flips bring the cube back to the same orientation
+    )
+peephole_index = {}                   # dict with the rules grouped by their last robot movement, for a faster matching
+for lhs, rhs in peephole_rules:
+    peephole_index.setdefault(lhs[-1], []).append((lhs, rhs))
+
+
+# Default servos timing (ms), used when the robot_settings.json file is not available
+# Only the timing is needed to estimate the robot execution time; the keys are the ones the robot firmware waits for
+# (machine_server.ino): FLIP_TO_CLOSE after a flip, FLIP_OPEN after opening or closing the top cover, ROTATE after a
+# cube holder rotation (spin or layer rotation), RELEASE after the cube holder is back home
+ROBOT_SETTINGS_FILE = "robot_settings.json"
+default_settings = {"TOP_COVER": {"TIME": {"FLIP_TO_CLOSE": 500, "FLIP_OPEN": 400}},
+                    "CUBE_HOLDER": {"TIME": {"ROTATE": 600, "RELEASE": 100}}}
 
-by knowing 5 faces, the 6th (B face) is also known ;-)
-""" 
 
+# Whole cube movements as faces permutation, with faces positions ordered as per URFDLB notation (0=U, 1=R, 2=F, 3=D, 4=L, 5=B)
+# The new face at position i is the one previously at position perm[i]
+flip_perm =    (5,1,0,2,4,3)    # Flip: Front face goes to Bottom, Upper to Front, Back to Upper, Bottom to Back
+spinCW_perm =  (0,2,4,3,5,1)    # Spin CW (S1): Front face goes to Right, Left to Front, Back to Left, Right to Back
+spinCCW_perm = (0,5,1,3,2,4)    # Spin CCW (S3): Front face goes to Left, Right to Front, Back to Right, Left to Back
 
 
+# Cube orientations (24) encoded as small integers, with the transition and face-remap tables, built once at import
+faces = 'URFDLB'                                         # faces order as per URFDLB notation
+solver_moves = tuple(f+t for f in faces for t in '123')  # the 18 face moves from the solver (U1, U2, U3, R1, ... B3)
+solver_move_index = {m:i for i, m in enumerate(solver_moves)}   # index of each solver face move
+orientations = []        # faces located at URFDLB positions, per orientation (0 = 'URFDLB' is the starting orientation)
+flip_table = ()          # orientation after a flip, per orientation
+spinCW_table = ()        # orientation after a CW spin (S1), per orientation
+spinCCW_table = ()       # orientation after a CCW spin (S3), per orientation
+bottom_face = ()         # face located at the bottom (the one the robot can rotate), per orientation
+face_side_table = ()     # side where each face (URFDLB order) is located, per orientation
+robot_move_table = ()    # (robot moves, orientation afterward) for each of the 18 solver face moves, per orientation
+orient_moves = ()        # shortest flips and spins sequence (i.e. 'F1S1') from the starting orientation, per orientation
 
 
-def starting_cube_orientation():
-    """ Defines the starting cube orientation, that has to be recalled in case the robot is operated multiple times in a single session."""
+
+
+
+
+def split_moves(moves):
+    """ Returns the list of single robot movements from a robot moves string (i.e. 'F2R1S3' becomes ['F1','F1','R1','S3'])."""
     
-    global h_faces,v_faces 
+    tokens=[]                                        # list to store the single robot movements
+    for i in range(0, len(moves), 2):                # iteration over the robot moves, with steps = 2
+        if moves[i]=='F':                            # case there is a cube flip on robot movements
+            tokens+=['F1']*int(moves[i+1])           # multiple flips are split into single flips
+        else:                                        # case there is a spin or a layer rotation
+            tokens.append(moves[i:i+2])
+    return tokens
+
+
+
+
+
+
+def tokens_time(tokens, cover, robot_settings):
+    """ Returns the servos time (ms) of a list of single robot movements, starting from the top cover position."""
     
-    # Cube orientation at the start, later updated after every cube movement on the robot
-    h_faces={'L':'L','F':'F','R':'R'}   # dict with faces around the bottom/upper positioned faces
-    v_faces={'D':'D','F':'F','U':'U'}   # dict with faces around the left/right positioned faces
+    ms=0                                             # servos time counter
+    for token in tokens:                             # iteration over the robot movements
+        t, cover = move_time(token, cover, robot_settings)
+        ms+=t
+    return ms
 
 
 
 
 
 
+def peephole_pass(tokens, robot_settings):
+    """ Applies the peephole_rules in a single linear pass over the robot movements, via a stack: once a rule is applied
+        the stack top is checked again, therefore cancellations appearing after an earlier rewrite are also applied.
+        A rule is applied only when the servos time of the rewritten moves, followed by the next move, is lower.
+        The function returns the new list of robot movements, and a boolean telling if any rule has been applied."""
+    
+    stack=[]                                         # stack of (robot movement, top cover position before the movement)
+    cover='open'                                     # the top cover is open when the robot starts solving
+    changed=False                                    # boolean to track if optimizations are made
+    for i, token in enumerate(tokens):               # iteration over the robot movements
+        stack.append((token, cover))
+        cover=move_time(token, cover, robot_settings)[1]   # top cover position after the movement
+        following=tokens[i+1:i+2]                    # next robot movement, affecting the time via the top cover position
+        
+        applied=True                                 # boolean to keep checking the stack top after a rewrite
+        while applied:
+            applied=False
+            if not stack:                            # case all the moves have been cancelled
+                break
+            for lhs, rhs in peephole_index.get(stack[-1][0], ()):   # iteration over the rules ending with the stack top
+                n=len(lhs)
+                if len(stack)<n or tuple([t for t, c in stack[-n:]])!=lhs:   # case the rule doesn't match the stack top
+                    continue
+                start=stack[-n][1]                   # top cover position before the moves to be rewritten
+                if tokens_time(list(rhs)+following, start, robot_settings) >= tokens_time(list(lhs)+following, start, robot_settings):
+                    continue                         # case the rewrite isn't cheaper, as per servos timing
+                del stack[-n:]                       # moves to be rewritten are removed
+                cover=start
+                for t in rhs:                        # replacing moves are added
+                    stack.append((t, cover))
+                    cover=move_time(t, cover, robot_settings)[1]
+                changed=applied=True
+                break
+    
+    return [t for t, c in stack], changed
+
 
-def opp_face(face):
-    """ This function returns the opposite face of the one in argument."""
+
+
+
+
+def optimize_moves(moves, robot_settings=None):
+    """ Removes unnecessary moves, to reduce solving moves and time, as per peephole_rules: i.e. a spin CW followed by
+        a spin CCW, a layer rotation CW followed by a CCW one, four flips.
+        Passes are repeated until no more rules can be applied."""
+    
+    if robot_settings is None:                       # case the servos settings are not provided
+        robot_settings=default_settings              # default servos timing is used
     
-    if face == 'F': return 'B'
-    elif face == 'B': return 'F'
-    elif face == 'U': return 'D'
-    elif face == 'D': return 'U'
-    elif face == 'R': return 'L'
-    elif face == 'L': return 'R'
-    else:
-        return 'Error'
+    tokens=split_moves(moves)                        # single robot movements
+    changed=True
+    while changed:                                   # passes are repeated until no more optimizations are made
+        tokens, changed = peephole_pass(tokens, robot_settings)
+    return join_moves(tokens)                        # the new string of robot moves is returned
 
 
 
 
 
 
-def flip_effect(h_faces,v_faces):
-    """ Returns the cube faces orientation after a single Flip action; Only v_faces are affected
-        It applies a face shift of these faces, and updates the F face on the h_faces dict."""
+def count_moves(moves):
+    """Counts the total amount of robot movements."""
+
+    robot_tot_moves = 0               # counter for all the robot movements
+    for i in range(len(moves)):       # iterates over the string of robot movements
+        if moves[i] == 'F':           # case there is a cube flip on robot movements
+            flips=int(moves[i+1])     # retrieves how many flips
+            robot_tot_moves+=flips    # increases the total amount of robot movements
+
+        elif moves[i] == 'R':         # case there is a layer rotation on robot movements
+            robot_tot_moves+=1        # increases by 1 (cannot be more) the total amount of robot movements
+        
+        elif moves[i] == 'S':         # case there is a cube spin on robot movements
+            robot_tot_moves+=1        # increases by 1 (cannot be more) the total amount of robot movements
     
-    v_faces['D']=v_faces['F']
-    v_faces['F']=v_faces['U']
-    v_faces['U']=opp_face(v_faces['D'])
-    h_faces['F']=v_faces['F']
+    return robot_tot_moves            # total amount of robot moves is returned
 
 
 
 
 
 
-def spinCCW_effect(h_faces,v_faces):
-    """ Returns the cube faces orientation after a single CCW spin action; Only h_faces are affected
-        It applies a face shiftof these faces, and updates the F face on the v_faces dict."""
+def load_robot_settings(fname=ROBOT_SETTINGS_FILE):
+    """ Returns the servos settings from the robot_settings.json file, or the default timing in case of missing file."""
     
-    h_faces['L']=h_faces['F']
-    h_faces['F']=h_faces['R']
-    h_faces['R']=opp_face(h_faces['L'])
-    v_faces['F']=h_faces['F']
-       
+    try:
+        with open(fname, "r") as f:                  # open the servos settings json file in read mode
+            return json.load(f)                      # returns JSON object as a dictionary
+    except:                                          # case the file is missing or not readable
+        return default_settings                      # default servos timing is returned
+
 
 
 
 
 
-def spinCW_effect(h_faces,v_faces):
-    """ Returns the cube faces orientation after a single CW spin action; Only h_faces are affected
-        It applies a face shiftof these faces, and updates the F face on the v_faces dict."""
+def cover_time(robot_settings, start, end):
+    """ Returns the time (ms) for the top cover to move from start to end position ('open', 'close' or 'flip'), as
+        per the robot firmware delays: FLIP_TO_CLOSE for a flip, FLIP_OPEN to open or close the top cover."""
     
-    h_faces['R']=h_faces['F']
-    h_faces['F']=h_faces['L']
-    h_faces['L']=opp_face(h_faces['R'])
-    v_faces['F']=h_faces['F']
+    t=robot_settings["TOP_COVER"]["TIME"]            # top cover servo timing
+    if start==end:                                   # case the top cover is already at the end position
+        return 0
+    elif end=='flip':                                # case the top cover is raised to flip position (flip command)
+        return t["FLIP_TO_CLOSE"]
+    else:                                            # case the top cover is opened or closed (open, close commands)
+        return t["FLIP_OPEN"]
 
 
 
 
 
 
-def cube_orient_update(movement):
-    """ This function traks the cube orientation based on the applied movements by the robot.
-        Arguments is the applied robot movement.
-        The function uses the cube orientation global variables  "h_faces" and "v_faces"."""
-        
-    global h_faces,v_faces
+def move_time(move, cover, robot_settings):
+    """ Returns the servos time (ms) of a robot move (i.e. 'F2', 'S3', 'R1'), and the top cover position afterward.
+        The cube is flipped by raising the top cover to flip position, spins need the top cover open, and the
+        layer rotations need the top cover closed on the 2nd and 3rd layer (followed by the holder back home).
+        Spins and layer rotations take the ROTATE time, the cube holder back home the RELEASE time."""
     
-    for i in range(len(movement)):                 # iterates over the string of robot movements
-        if movement[i] == 'F':                     # case there is a cube flip on robot movements
-            repeats=int(movement[i+1])             # retrieves how many flips
-            for j in range(repeats):               # iterates over the amount of flip
-                flip_effect(h_faces,v_faces)       # re-order the cube orientation on the robot due to the flip
-        
-        elif movement[i] == 'S':                   # case there is a cube spin on robot movements
-            repeats=int(movement[i+1])             # retrieves how many spin
-            if repeats=='3':                       # case the spin is CCW
-                spinCCW_effect(h_faces,v_faces)    # re-order the cube orientation on the robot due to the CCW spin
-            else:                                  # case the spin is CW
-                for j in range(repeats):           # iterates over the amount of spin
-                    spinCW_effect(h_faces,v_faces) # re-order the cube orientation on the robot due to the CW spin             
+    t=robot_settings["CUBE_HOLDER"]["TIME"]          # cube holder servo timing
+    if move[0]=='F':                                 # case the move is a (multiple) flip
+        ms=0                                         # servos time for the flips
+        for i in range(int(move[1])):                # iteration over the amount of flips
+            if cover=='flip':                        # case the top cover is still at flip position from previous flip
+                ms+=cover_time(robot_settings, 'flip', 'open')   # top cover goes back to open before flipping again
+                cover='open'
+            ms+=cover_time(robot_settings, cover, 'flip')        # top cover raised to flip position
+            cover='flip'
+        return ms, cover
+    elif move[0]=='S':                               # case the move is a cube spin
+        return cover_time(robot_settings, cover, 'open')+t["ROTATE"], 'open'
+    else:                                            # case the move is a layer rotation
+        return cover_time(robot_settings, cover, 'close')+t["ROTATE"]+t["RELEASE"], 'close'
+
+
+
+
+
+
+def robot_moves_time(moves, robot_settings=None):
+    """ Estimates the robot execution time of a robot moves string, based on the servos timing.
+        The function returns a dict with the time (ms) per move, a dict with the elapsed time (ms) once each move
+        is completed, both with the moves string index as key, and the total time (ms)."""
+    
+    if robot_settings is None:                       # case the servos settings are not provided
+        robot_settings=default_settings              # default servos timing is used
+    
+    moves=moves.strip().replace(" ", "")             # eventual empty spaces are removed from the string
+    time_per_move={}                                 # dict to store the time per move
+    elapsed_time={}                                  # dict to store the elapsed time once the move is completed
+    elapsed=0                                        # elapsed time counter
+    cover='open'                                     # the top cover is open when the robot starts solving
+    for i in range(0, len(moves), 2):                # iteration over the moves, with steps = 2
+        ms, cover = move_time(moves[i:i+2], cover, robot_settings)   # time and top cover position after the move
+        elapsed+=ms                                  # elapsed time is increased
+        time_per_move[i]=ms                          # time of the move is associated to the move index key
+        elapsed_time[i]=elapsed                      # elapsed time is associated to the move index key
+    
+    return time_per_move, elapsed_time, elapsed
+
+
+
+
 
 
+def orient_permute(orientation, perm):
+    """ Returns the cube orientation after a whole cube movement (flip or spin).
+        The cube orientation is a string with the faces located at URFDLB positions, i.e. 'URFDLB' at the start."""
+    
+    return ''.join([orientation[i] for i in perm])   # faces are re-ordered as per the movement permutation
+
+
+
+
+
+
+def orient_apply(orientation, moves):
+    """ Returns the orientation index after applying a robot moves string (i.e. 'F2R1S3') from orientation index.
+        Layer rotations don't change the cube orientation."""
+    
+    for i in range(0, len(moves), 2):                # iteration over the robot moves, with steps = 2
+        if moves[i]=='F':                            # case there is a cube flip on robot movements
+            for j in range(int(moves[i+1])):         # iterates over the amount of flips
+                orientation=flip_table[orientation]
+        elif moves[i:i+2]=='S1':                     # case there is a CW cube spin on robot movements
+            orientation=spinCW_table[orientation]
+        elif moves[i:i+2]=='S3':                     # case there is a CCW cube spin on robot movements
+            orientation=spinCCW_table[orientation]
+    return orientation
+
 
 
 
 
-def adapt_move(move):
-    """ This function adapts the robot move after verifying on wich side the related face is located.
-        The solver considers the cube orientation to don't change, but on the robot it does.
-        This function will then swap the face name, instead to move the cube back on the original position
-        The function returns a dict with all the robot moves and the total amount."""
+
+def build_orientation_tables():
+    """ Generates the 24 cube orientations reachable by flips and spins, and the tables with the orientation changes
+        and the faces location, per orientation. Tables are built once, and kept as global variables."""
     
-    global h_faces,v_faces
+    global orientations, flip_table, spinCW_table, spinCCW_table, bottom_face, face_side_table, robot_move_table
+    global orient_moves
     
-    face_to_turn = move[0]                        # face to be turned according to the solver 
-    rotations = move[1]                           # rotations (string) to be applied according to the solver 
+    if orientations:                                 # case the tables have been already built
+        return
     
-    cube_orientation=h_faces.copy()               # generating a single cube orientation dict with h_faces
-    cube_orientation.update(v_faces)              # generating a single cube orientation dict with h_faces and v_faces
+    index={'URFDLB':0}                               # dict with the orientation index per orientation string
+    found=['URFDLB']                                 # list of orientations, the starting one first
+    paths=[[]]                                       # list of the movements reaching each orientation
+    for orientation, path in zip(found, paths):      # breadth first search, the lists grow while iterating
+        for token, perm in (('F1', flip_perm), ('S1', spinCW_perm), ('S3', spinCCW_perm)):   # whole cube movements
+            new_orientation=orient_permute(orientation, perm)
+            if new_orientation not in index:         # case of a new orientation
+                index[new_orientation]=len(found)
+                found.append(new_orientation)
+                paths.append(path+[token])
     
-    solution_in_dict = True                       # boolean for easier code reading... 80% chances the face is in dict...
+    orientations=found
+    flip_table=tuple(index[orient_permute(o, flip_perm)] for o in orientations)
+    spinCW_table=tuple(index[orient_permute(o, spinCW_perm)] for o in orientations)
+    spinCCW_table=tuple(index[orient_permute(o, spinCCW_perm)] for o in orientations)
+    bottom_face=tuple(o[3] for o in orientations)
+    orient_moves=tuple(join_moves(path) for path in paths)
+    face_side_table=tuple(tuple(faces[o.index(f)] for f in faces) for o in orientations)
     
-    for side, face in cube_orientation.items():   # iteration over the current cube orientation dict (5 sides)
-        if face == face_to_turn:                  # case the face to be turned is in the dictionary value
-            return side+rotations                 # the dictionary key is returned, as the effective face location
-        else:                                     # case the face to be turned is not in the dictionary value
-            solution_in_dict = False              # boolean variable is changed to False
+    table=[]                                         # list to store the robot moves per orientation
+    for o in range(len(orientations)):               # iteration over the orientations
+        row=[]                                       # list to store the robot moves per solver face move
+        for move in solver_moves:                    # iteration over the 18 face moves
+            side=face_side_table[o][faces.index(move[0])]   # side where the face to be turned is located
+            robot_seq=moves_dict[side+move[1]]       # robot movement sequence is retrieved
+            row.append((robot_seq, orient_apply(o, robot_seq)))
+        table.append(tuple(row))
+    robot_move_table=tuple(table)
+
+
+
+
+
+
+def join_moves(tokens):
+    """ Returns the robot moves string from a list of single robot movements, by merging the consecutive flips
+        (i.e. ['F1','F1','R1','S3'] becomes 'F2R1S3')."""
     
-    if solution_in_dict == False:                 # case the face to be turned is not in the dictionary value
-        return 'B'+rotations                      # the face to be turned must be the 6th one, the B side
+    moves=''                                         # empty string to store the robot moves
+    flips=0                                          # counter for consecutive flips
+    for token in tokens:                             # iteration over the single robot movements
+        if token=='F1':                              # case the movement is a flip
+            flips+=1                                 # consecutive flips counter is increased
+            continue                                 # flips are written once the sequence of flips ends
+        if flips>0:                                  # case there are flips to be written
+            moves+='F'+str(flips)                    # flips are merged into a single robot move
+            flips=0                                  # consecutive flips counter is reset
+        moves+=token                                 # spin or rotation is added to the robot moves
+    if flips>0:                                      # case the tokens end with flips
+        moves+='F'+str(flips)                        # flips are merged into a single robot move
+    return moves
 
 
 
 
 
 
-def optimize_moves(moves):
-    """Removes unnecessary moves that would cancel each other out, to reduce solving moves and time
-    These movements are for instance a spin CW followed by a spin CCW, or viceversa."""
+def plan_block(frontier, move, robot_settings):
+    """ Searches the cheapest robot movements applying one move from the solver, starting from any of the frontier states.
+        A state is made by the cube orientation index, the cube holder position (-1=CCW, 0=home, 1=CW) and the top cover
+        position: flips and spins can bring any face to the bottom, where the layer is rotated until the quarter turns
+        required by the solver.
+        Argument frontier is a dict with state as key, and the (servo time, list of (solver move, robot moves)) to
+        reach it as value. The function returns a dict, of same structure, with the states reached after the move."""
+    
+    face_to_turn = move[0]                           # face to be turned according to the solver
+    target = int(move[1])%4                          # CW quarter turns required to the face (3 means one CCW turn)
+    
+    heap=[]                                          # priority queue of the states to be expanded, cheapest first
+    best={}                                          # dict with the cheapest servo time found so far per state
+    parent={}                                        # dict with the previous state and the movement leading to the state
+    for (orientation, holder, cover), (cost, _) in frontier.items():   # iteration over the starting states
+        state=(orientation, holder, cover, 0)        # no quarter turns applied yet on the face to be turned
+        best[state]=cost                             # servo time to reach the starting state
+        parent[state]=None                           # starting states have no previous state
+        heapq.heappush(heap, (cost, len(best), state))
     
-    optimization = False                 # boolean to track if optimizations are made
-    to_optmize=[]                        # empty list to be populated with string index where optimization is possible
-    str_length=len(moves)                # length of the robot move string
-    idx=0                                # index variable, of optimizable move string locations, to populate the list
-    for i in range(0,str_length,2):      # for loop of with steps = 2
+    reached={}                                       # dict to store the states reached after applying the move
+    while heap:                                      # Dijkstra search over the robot movements
+        cost, _, state = heapq.heappop(heap)         # cheapest state not yet expanded
+        if cost > best[state]:                       # case the state has been already reached with lower servo time
+            continue                                 # outdated queue entry is skipped
+        orientation, holder, cover, turns = state    # state components
         
-        if moves[idx:idx+2]=='S1' and moves[idx+2:idx+4] =='S3':  # case S1 is folloved by S3
-#                 print(f'S1 followed by S3 at index {idx}')
-            optimization = True          # boolean to track optimization is set true
-            to_optmize.append(idx)       # list is populated with the index 
-            idx+=4                       # string index is increased by four, to skip the 2nd (already included) move  
-
-        elif moves[idx:idx+2]=='S3'and moves[idx+2:idx+4] =='S1': # case S3 is folloved by S1
-#                 print(f'S3 followed by S1 at index {idx}')
-            optimization = True          # boolean to track optimization is set true
-            to_optmize.append(idx)       # list is populated with the index 
-            idx+=4                       # string index is increased by four, to skip the 2nd (already included) move  
-
-        idx+=2                           # index variable is increased by two, to analayse next move
-        if idx>=str_length+2:            # case the index variable reaches the string end 
-            break                        # for loop is interrupted
-
-    if optimization == False:            # case the moves string had no need to be optimized
-        return moves                     # original moves are returned
-
-    else:                                # case the moves string has the need to be optimized
-        to_remove=[]                     # empty list to be populated with all indididual characters to be removed from the moves
-        for i in to_optmize:                        # iteration over the list of moves to be optimized
-            to_remove.append((i, i+1, i+2, i+3))    # list is populated with the 4 caracters of the 2 moves
+        if turns==target and parent[state] is not None:   # case the face has been turned as required by the solver
+            tokens=[]                                # list to store the robot movements for this move
+            while parent[state] is not None:         # back tracking till the starting state
+                state, token = parent[state]         # previous state and movement leading to the current state
+                tokens.append(token)                 # movement is added to the list
+            start_cost, start_moves = frontier[state[:3]]    # robot moves to reach the starting state
+            reached[(orientation, holder, cover)]=(cost, start_moves+[(move, join_moves(tokens[::-1]))])
+            continue                                 # the move is applied, no need to expand further this state
         
-        new_moves=''                                # empty string to hold the new robot moves 
-        remove = [item for sublist in to_remove for item in sublist] # list of characters is flattened
-        for i in range(str_length):                 # iteration over all the characters of original moves
-            if i not in remove:                     # case the index is not included in the list of those to be skipped
-                new_moves+=moves[i]                 # the character is added to the new string of moves 
+        options=[('F1', flip_table[orientation], holder, turns)]                  # flip is always possible
+        if holder<1:                                 # case the cube holder can still rotate CW
+            options.append(('S1', spinCW_table[orientation], holder+1, turns))
+        if holder>-1:                                # case the cube holder can still rotate CCW
+            options.append(('S3', spinCCW_table[orientation], holder-1, turns))
+        if bottom_face[orientation]==face_to_turn:   # case the face to be turned is at the bottom
+            if holder<1:                             # case the cube holder can still rotate CW
+                options.append(('R1', orientation, holder+1, (turns+1)%4))
+            if holder>-1:                            # case the cube holder can still rotate CCW
+                options.append(('R3', orientation, holder-1, (turns+3)%4))
         
-        return new_moves                            # the new string of robot moves is returned
+        for token, new_orientation, new_holder, new_turns in options:
+            servo_time, new_cover = move_time(token, cover, robot_settings)   # servos time and top cover position
+            new_state=(new_orientation, new_holder, new_cover, new_turns)
+            new_cost=cost+servo_time                 # servo time to reach the new state
+            if new_state not in best or new_cost < best[new_state]:   # case of a cheaper way to reach the new state
+                best[new_state]=new_cost
+                parent[new_state]=((orientation, holder, cover, turns), token)
+                heapq.heappush(heap, (new_cost, len(best)+len(heap), new_state))
+    
+    return reached
 
 
 
 
 
 
-def count_moves(moves):
-    """Counts the total amount of robot movements."""
+def plan_solution(solution, robot_settings, orientation=0, commute=False):
+    """ Searches the robot movements with the lowest total servos time for the solver moves, from the cube orientation
+        index at the start (0 = as per the solver); at the end the cube holder is brought back home.
+        When commute is True, adjacent moves on opposite faces (i.e. U1D2), that commute, are planned in both orders:
+        per robot state the cheapest order is kept, therefore the solution is rewritten as per the robot.
+        The function returns the servos time (ms) and the list of (solver move, robot moves) per solver move."""
+    
+    solution=solution.strip().replace(" ", "")     # eventual empty spaces are removed from the string
+    blocks = [solution[i:i+2] for i in range(0, len(solution), 2)]   # blocks of movements (i.e. U2R1L3 are 3 blocks)
+    
+    frontier={(orientation, 0, 'open'): (0, [])}   # starting state: cube orientation, holder home, cover open
+    i=0                                            # index of the block to be planned
+    while i < len(blocks):                         # iteration over blocks of movements
+        if commute and i+1 < len(blocks) and faces.index(blocks[i+1][0])%3 == faces.index(blocks[i][0])%3:
+            # case of moves on opposite faces, both the orders are planned
+            a, b = blocks[i], blocks[i+1]
+            frontier_ab=plan_block(plan_block(frontier, a, robot_settings), b, robot_settings)
+            frontier_ba=plan_block(plan_block(frontier, b, robot_settings), a, robot_settings)
+            for state, (cost, moves) in frontier_ba.items():   # iteration over the states reached via the 2nd order
+                if state not in frontier_ab or cost < frontier_ab[state][0]:   # case of cheaper order for the state
+                    frontier_ab[state]=(cost, moves)
+            frontier=frontier_ab
+            i+=2
+        else:                                      # case of moves not commuting with the next one
+            frontier=plan_block(frontier, blocks[i], robot_settings)
+            i+=1
+    
+    best_cost, best_moves = None, []               # cheapest robot moves, once the cube holder is back home
+    for (orientation, holder, cover), (cost, moves) in frontier.items():   # iteration over the states reached at the end
+        if holder!=0:                              # case the cube holder is not at home position
+            spin = 'S3' if holder==1 else 'S1'     # spin direction to bring the cube holder home
+            cost, moves = cost+move_time(spin, cover, robot_settings)[0], moves[:-1]+[(moves[-1][0], moves[-1][1]+spin)]
+        if best_cost is None or cost < best_cost:  # case of cheaper robot moves
+            best_cost, best_moves = cost, moves
+    return best_cost, best_moves
 
-    robot_tot_moves = 0               # counter for all the robot movements
-    for i in range(len(moves)):       # iterates over the string of robot movements
-        if moves[i] == 'F':           # case there is a cube flip on robot movements
-            flips=int(moves[i+1])     # retrieves how many flips
-            robot_tot_moves+=flips    # increases the total amount of robot movements
 
-        elif moves[i] == 'R':         # case there is a layer rotation on robot movements
-            robot_tot_moves+=1        # increases by 1 (cannot be more) the total amount of robot movements
-        
-        elif moves[i] == 'S':         # case there is a cube spin on robot movements
-            robot_tot_moves+=1        # increases by 1 (cannot be more) the total amount of robot movements
+
+
+
+
+def robot_planned_moves(solution, robot_settings=None, orientation=0):
+    """ Cost-optimal translation of the Kociemba solver string into robot movements.
+        Differently from the moves_dict approach, the face to be turned isn't reached via a fixed sequence: all the
+        24 cube orientations, the cube holder and the top cover positions, are searched to find the robot moves with
+        the lowest total servos time (as per robot_settings). At the end the cube holder is brought back home.
+        Argument orientation is the cube orientation index at the start (0 = as per the solver).
+        The function returns a dict with the robot moves per solver move, and the string with all the robot moves."""
     
-    return robot_tot_moves            # total amount of robot moves is returned
+    if robot_settings is None:                     # case the servos settings are not provided
+        robot_settings=default_settings            # default servos timing is used
+    
+    cost, blocks = plan_solution(solution, robot_settings, orientation)
+    robot={block:seq for block, (move, seq) in enumerate(blocks)}   # dict with the robot moves per solver move
+    return robot, ''.join([seq for move, seq in blocks])   # returns the dict with the robot moves and the string with all the moves
+
+
+
+
+
+
+def rewrite_solution(solution, robot_settings=None, orientation=0):
+    """ Rewrites the Kociemba solver string by reordering the adjacent moves on opposite faces (they commute, and the
+        cube status is the same), as per the lowest robot time of the moves the robot executes (see executed_time).
+        Each pair of commuting moves is swapped when that lowers the robot time, passes are repeated until no swap
+        helps: the rewritten solution is never slower than the original one.
+        The function returns the rewritten solution (i.e. 'D2U1R3') and its robot time (ms)."""
+    
+    solution=solution.strip().replace(" ", "")     # eventual empty spaces are removed from the string
+    blocks = [solution[i:i+2] for i in range(0, len(solution), 2)]   # blocks of movements (i.e. U2R1L3 are 3 blocks)
+    pairs=[]                                       # index of the first move, per pair of commuting moves
+    i=0
+    while i+1 < len(blocks):                       # iteration over the blocks, pairs are not overlapping
+        if faces.index(blocks[i+1][0])%3 == faces.index(blocks[i][0])%3:   # case of moves on opposite faces
+            pairs.append(i)
+            i+=2
+        else:
+            i+=1
+    
+    best_time = executed_time(solution, robot_settings, orientation)   # robot time of the solution as it is
+    swapped=True
+    while swapped:                                 # passes are repeated until no swap lowers the robot time
+        swapped=False
+        for i in pairs:                            # iteration over the pairs of commuting moves
+            blocks[i], blocks[i+1] = blocks[i+1], blocks[i]
+            robot_time = executed_time(''.join(blocks), robot_settings, orientation)
+            if robot_time < best_time:             # case the swapped order is faster on the robot
+                best_time, swapped = robot_time, True
+            else:                                  # case the swapped order isn't faster, the order is restored
+                blocks[i], blocks[i+1] = blocks[i+1], blocks[i]
+    return ''.join(blocks), best_time
 
 
 
 
 
 
-def robot_required_moves(solution, solution_Text):
-    """ This function splits the cube manouvre from Kociemba solver string, and generates a dict with all the robot movements."""
+def table_moves(solution, orientation=0):
+    """ Table driven translation of the Kociemba solver string into robot movements, as per moves_dict.
+        The face to be turned is located via the face-remap table, and the cube orientation is tracked as index,
+        starting from orientation (0 = as per the solver).
+        The function returns a list with the robot moves per solver move, and the cube orientation at the end."""
     
-    global h_faces,v_faces
+    robot_seqs=[]                                     # list to store the robot moves per solver move
+    for i in range(0, len(solution), 2):              # iteration over the solver moves, with steps = 2
+        robot_seq, orientation = robot_move_table[orientation][solver_move_index[solution[i:i+2]]]
+        robot_seqs.append(robot_seq)
+    return robot_seqs, orientation
+
+
+
+
+
+
+def original_frame(solution, orientation):
+    """ Maps a solution found for the cube in orientation, back to the faces of the cube as placed on the robot.
+        A face turn keeps its direction, only the face letter changes (i.e. 'U1R2' could become 'F1R2')."""
+
+    faces_at = orientations[orientation]          # faces located at URFDLB positions, for the orientation
+    return ''.join([faces_at[faces.index(solution[i])]+solution[i+1] for i in range(0, len(solution), 2)])
+
+
+
+
+
+
+def robot_required_moves(solution, solution_Text, planner=False, robot_settings=None, orientation=0):
+    """ This function splits the cube manouvre from Kociemba solver string, and generates a dict with all the robot movements.
+        By default the moves_dict is used, as the robot does when it receives the solver string; with planner=True the
+        robot moves are searched by the planner (lowest servos time, as per robot_settings), for offline analysis only.
+        The cube orientation at the start is an argument (index, 0 = as per the solver) and no global variable is
+        changed, therefore the function can be called concurrently (threads or processes)."""
     
     solution=solution.strip()                     # eventual empty spaces are removed from the string
     solution=solution.replace(" ", "")            # eventual empty spaces are removed from the string
-    starting_cube_orientation()                   # Cube orientation at the start, later updated after every cube movement on the robot
     robot={}                                      # empty dict to store all the robot moves
     moves=''                                      # empty string to store all the robot moves
     robot_tot_moves = 0                           # counter for all the robot movements
     
-    if solution_Text != 'Error':                  # case the solver did not return an error
-        blocks = int(round(len(solution)/2,0))    # total amount of blocks of movements (i.e. U2R1L3 are 3 blocks: U2, R1 and L1)
+    if solution_Text != 'Error' and planner:      # case the solver did not return an error, and the planner is used
+        robot, moves = robot_planned_moves(solution, robot_settings, orientation)   # robot moves with the lowest servos time
+        robot_tot_moves = count_moves(moves)      # counter for the total amount of robot movements
+    
+    elif solution_Text != 'Error':                # case the solver did not return an error
+        robot_seqs, end_orientation = table_moves(solution, orientation)   # robot movement sequences, as per cube orientation
+        robot=dict(enumerate(robot_seqs))         # robot movements dict, with the solver block as key
+        moves=''.join(robot_seqs)                 # robot movements string
         
-        # cube orientation and robot movement sequence selection
-        for block in range(blocks):               # iteration over blocks of movements
-            move=solution[:2]                     # move to be applied on this block, according to the solver
-            solution=solution[2:]                 # remaining movements from the solver are updated
-            adapted_move=adapt_move(move)         # the move from solver is adapted considering the real cube orientation
-            robot_seq=moves_dict[adapted_move]    # robot movement sequence is retrieved
-            robot[block]=robot_seq                # robot movements dict is updated
-            moves+=robot_seq                      # robot movements string is updated
-            cube_orient_update(robot_seq)         # cube orientation updated after the robot move from this block
-                           
-        moves=optimize_moves(moves)               # removes unnecessary moves (that would cancel each other out)
+        moves=optimize_moves(moves, robot_settings)   # removes unnecessary moves (that would cancel each other out)
         robot_tot_moves = count_moves(moves)      # counter for the total amount of robot movements
         
     return robot, moves, robot_tot_moves  # returns a dict with all the robot moves, string with all the moves and total robot movements
 
+
+
+
+
+
+def executed_time(solution, robot_settings=None, orientation=0):
+    """ Returns the robot time (ms) of the solution as executed by the robot: the moves_dict translation (the robot
+        translates the solver string on its own), with the unnecessary moves removed."""
+    
+    moves = robot_required_moves(solution, "", False, robot_settings, orientation)[1]
+    return robot_moves_time(moves, robot_settings)[2]
+
+
+
+
+
+
+def translate_solutions(solutions, planner, robot_settings):
+    """ Translates a list of solutions into robot moves, and returns a list of tuples with the solution, the robot moves
+        string, the total robot movements and the robot time (ms). Used as process pool task by translate_batch()."""
+    
+    results=[]                                       # list to store the translation results
+    for solution in solutions:                       # iteration over the solutions
+        robot, moves, robot_tot_moves = robot_required_moves(solution, "", planner, robot_settings)
+        results.append((solution, moves, robot_tot_moves, robot_moves_time(moves, robot_settings)[2]))
+    return results
+
+
+
+
+
+
+def translate_batch(solutions, planner=False, robot_settings=None, workers=None, chunksize=64):
+    """ Translates an iterable of Kociemba solutions into robot moves, across a pool of processes.
+        The results, as per translate_solutions(), are yielded in the same order of the solutions while the pool
+        keeps working, therefore large corpora can be processed without waiting for (or storing) all the results.
+        Solutions are sent to the pool in chunks, with a limited amount of chunks in progress."""
+    
+    if robot_settings is None:                       # case the servos settings are not provided
+        robot_settings=default_settings              # default servos timing is used
+    if workers is None:                              # case the amount of workers is not provided
+        workers=os.cpu_count() or 1                  # one worker per CPU
+    
+    with cf.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending=collections.deque()                  # chunks in progress, in the solutions order
+        chunk=[]                                     # list of the solutions for the next chunk
+        for solution in solutions:                   # iteration over the solutions
+            chunk.append(solution)
+            if len(chunk)==chunksize:                # case the chunk is complete
+                pending.append(pool.submit(translate_solutions, chunk, planner, robot_settings))
+                chunk=[]
+                if len(pending)>=2*workers:          # case enough chunks are in progress
+                    yield from pending.popleft().result()   # results of the oldest chunk are yielded
+        if chunk:                                    # case of remaining solutions
+            pending.append(pool.submit(translate_solutions, chunk, planner, robot_settings))
+        while pending:                               # results of the chunks still in progress
+            yield from pending.popleft().result()
+
+
+
+
+
+
+build_orientation_tables()    # orientation tables are built once, at import
@@ -0,0 +1,193 @@
+"""
+#############################################################################################################
+#
+# Persistent cache of the cube solutions, on disk (solutions_cache.json).
+# Cube states are stored in canonical form: the cube status string is transformed by each of the 48 cube
+# symmetries (24 whole cube rotations, with and without mirroring), and relabelled as per the new center facelets
+# (the facelets colors don't matter, only the face they belong to); the lowest of the 48 strings is the key.
+# Symmetry equivalent cubes (i.e. the same scramble applied from another side) share the same cache entry: the
+# cached solution is mapped back, move by move, to the cube as it is placed on the robot.
+#
+# Entries are kept in least recently used order, and the oldest ones are evicted once max_entries is reached.
+# The cache file is saved every save_every stored solutions, and at exit.
+#
+#############################################################################################################
+"""
+
+import json                                   # cache file
+import os                                     # os is imported to ensure the file presence, and to replace it
+import threading                              # lock, as the solver server handles requests on multiple threads
+import atexit                                 # the cache is saved at exit
+from collections import OrderedDict           # entries in least recently used order
+import numpy as np
+import robot_moves as cm                      # flips and spins reaching the 24 cube orientations
+import cube_simulator as sim                  # facelets permutations of the robot moves
+
+
+# Global variables
+CACHE_FILE = 'solutions_cache.json'           # cache file name
+max_entries = 5000                            # max amount of cached solutions, the least recently used are evicted
+save_every = 20                               # stored solutions between the cache file saves
+
+cache = None                                  # OrderedDict with the canonical solution per canonical cube string
+cache_lock = threading.Lock()                 # lock to access the cache
+unsaved = 0                                   # stored solutions not yet saved to file
+faces_codes = np.frombuffer(cm.faces.encode('ascii'), dtype=np.uint8)   # ascii codes of the face letters
+
+
+# Facelets permutation of the mirroring by the plane between L and R faces: the resulting facelet i is the one
+# currently in position mirror_perm[i], rows are kept and columns are reversed (L and R faces are swapped)
+mirror_face = (0, 4, 2, 3, 1, 5)              # face taking the facelets of each face (URFDLB order)
+mirror_perm = np.array([9*mirror_face[f] + 3*r + 2-c for f in range(6) for r in range(3) for c in range(3)])
+
+# Facelets permutation of the 48 cube symmetries: 24 rotations (flips and spins reaching each cube orientation),
+# and the same rotations applied to the mirrored cube
+rotation_perms = [sim.move_permutation(cm.orient_moves[o]) for o in range(len(cm.orientations))]
+symmetry_perms = np.array(rotation_perms + [mirror_perm[p] for p in rotation_perms])
+mirrored = [False] * len(rotation_perms) + [True] * len(rotation_perms)   # mirroring symmetries
+
+# face of the original cube, per face of the transformed cube, per symmetry (face turns are mapped via this table)
+symmetry_faces = [[int(p[9*f+4]) // 9 for f in range(6)] for p in symmetry_perms]
+
+
+
+
+
+
+def canonical(cubestring):
+    """ Returns the canonical form of a cube status string (lowest string among the 48 symmetric ones, relabelled
+        as per their center facelets), and the index of the symmetry transforming the cube into it."""
+
+    states = sim.to_array([cubestring])[0][symmetry_perms]   # 48 x 54 transformed facelets
+    relabel = np.zeros((len(states), 256), dtype=np.uint8)   # face letter per facelet letter, per symmetry
+    relabel[np.arange(len(states))[:, None], states[:, 4::9]] = faces_codes   # center facelets define the faces
+    states = np.take_along_axis(relabel, states, axis=1)     # relabelled transformed states
+    strings = sim.to_strings(states)
+    key = min(strings)
+    return key, strings.index(key)
+
+
+
+
+
+
+def map_solution(solution, symmetry, to_canonical):
+    """ Maps a solution (i.e. 'U1R2F3') between the cube and its transformed one via the symmetry: face turns are
+        moved to the corresponding faces, and their direction is reversed in case of mirroring."""
+
+    faces = symmetry_faces[symmetry]              # original face per transformed face
+    if to_canonical:                              # case the solution is mapped to the transformed cube
+        faces = [faces.index(f) for f in range(6)]
+    s = ''
+    for i in range(0, len(solution), 2):          # iteration over the solver moves
+        turns = int(solution[i+1])
+        if mirrored[symmetry]:                    # case of mirroring, clockwise turns become counterclockwise
+            turns = 4 - turns
+        s += cm.faces[faces[cm.faces.index(solution[i])]] + str(turns)
+    return s
+
+
+
+
+
+
+def load(fname=CACHE_FILE):
+    """ Loads the cache from file, once; in case of missing or unreadable file the cache starts empty."""
+
+    global cache
+
+    if cache is not None:                         # case the cache is already loaded
+        return
+    cache = OrderedDict()
+    if os.path.isfile(fname):                     # case the cache file exists
+        try:
+            with open(fname, 'r') as f:
+                cache.update(json.load(f))        # entries are saved from the least recently used one
+        except (OSError, ValueError):             # case the cache file can't be read
+            print(f'solutions cache {fname} could not be read, the cache starts empty')
+
+
+
+
+
+
+def save(fname=CACHE_FILE):
+    """ Saves the cache to file, via a temporary file replacing the previous one."""
+
+    global unsaved
+
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, fname)
+    unsaved = 0
+
+
+
+
+
+
+def flush(fname=CACHE_FILE):
+    """ Saves the cache to file, in case of stored solutions not yet saved (called at exit)."""
+
+    with cache_lock:
+        if cache is not None and unsaved:         # case of solutions not yet saved
+            try:
+                save(fname)
+            except OSError:                       # case the cache file can't be written
+                print(f'solutions cache {fname} could not be saved')
+
+
+
+
+
+
+def lookup(cubestring, max_length=20):
+    """ Returns the cached solution (i.e. 'U1R2F3') for the cube status string, mapped to the cube as given, or None
+        in case the cube is not cached or its cached solution has more than max_length face turns."""
+
+    if len(cubestring) != 54:                     # case of invalid cube status string
+        return None
+    key, symmetry = canonical(cubestring)
+    with cache_lock:
+        load()
+        solution = cache.get(key)
+        if solution is None or len(solution) // 2 > max_length:   # case of cache miss
+            return None
+        cache.move_to_end(key)                    # entry becomes the most recently used one
+    return map_solution(solution, symmetry, False)
+
+
+
+
+
+
+def store(cubestring, solution):
+    """ Stores the solution (i.e. 'U1R2F3') of the cube status string, the least recently used entries are evicted
+        when max_entries is exceeded. The cache is saved to file every save_every stored solutions (see flush)."""
+
+    global unsaved
+
+    if len(cubestring) != 54 or not solution:     # case of invalid cube status string, or no solution
+        return
+    key, symmetry = canonical(cubestring)
+    with cache_lock:
+        load()
+        cache[key] = map_solution(solution, symmetry, True)
+        cache.move_to_end(key)                    # entry becomes the most recently used one
+        while len(cache) > max_entries:           # case the cache is full
+            cache.popitem(last=False)             # the least recently used entry is evicted
+        unsaved += 1
+        if unsaved < save_every:                  # case the cache file is saved later
+            return
+        try:
+            save()
+        except OSError:                           # case the cache file can't be written
+            print(f'solutions cache {CACHE_FILE} could not be saved')
+
+
+
+
+
+
+atexit.register(flush)                        # solutions not yet saved are saved at exit
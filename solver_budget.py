@@ -0,0 +1,63 @@
+"""
+#############################################################################################################
+#
+# Adaptive solving time for the cube solver (cube_solver.solve_anytime with no timeout).
+# The robot waits for the solver, therefore solving longer only pays when the robot time saved by the next
+# solutions exceeds the extra solving time: the saving measured over the last time window, decayed, is used as
+# the expected saving over the next window.
+# The robot times are the ones of the moves executed by the robot (see robot_moves.executed_time).
+# Settings are in solver_budget.json, completed with the default ones; the budget decisions are printed (LOG).
+#
+#############################################################################################################
+"""
+
+import json                                   # solver budget settings file
+
+
+# Global variables
+BUDGET_SETTINGS_FILE = "solver_budget.json"   # file with the adaptive solving time settings
+default_budget = {"MIN_TIME": 0.5,       # min solving time (s), before the budget is evaluated
+                  "MAX_TIME": 8,         # max solving time (s)
+                  "WINDOW": 1.0,         # time window (s) used to measure the robot time saved by the recent solutions
+                  "DECAY": 0.5,          # expected saving in the next window, as fraction of the saving in the last one
+                  "LOG": True}           # solver budget decisions are printed
+
+
+
+
+
+def load_budget_settings(fname=BUDGET_SETTINGS_FILE):
+    """ Returns the adaptive solving time settings from the solver_budget.json file, completed with the default ones."""
+    
+    budget = dict(default_budget)
+    try:
+        with open(fname, "r") as f:                  # open the budget settings json file in read mode
+            budget.update(json.load(f))              # settings in the file replace the default ones
+    except:                                          # case the file is missing or not readable
+        pass                                         # default budget settings are used
+    return budget
+
+
+
+
+
+
+def budget_stop(history, elapsed, budget):
+    """ Decides whether the solving should stop, as per the robot time saved by the solutions found in the last time
+        window: the saving expected in the next window (decayed) is compared with the window duration, as the robot
+        waits for the solver. History is the list of (elapsed time in s, robot time in ms) of the improving solutions.
+        Returns the reason to stop, or None when the solving should continue."""
+    
+    if elapsed >= budget["MAX_TIME"]:                # case the max solving time is reached
+        return f'max time {budget["MAX_TIME"]} s'
+    if not history or elapsed < budget["MIN_TIME"]:  # case of no solutions yet, or min solving time not reached
+        return None
+    window = budget["WINDOW"]
+    before = [rt for t, rt in history if t <= elapsed - window]   # robot times found before the last window
+    if not before:                                   # case the first solution is more recent than the window
+        return None
+    saved = before[-1] - history[-1][1]              # robot time (ms) saved within the last window
+    expected = saved * budget["DECAY"]               # robot time (ms) expected to be saved within the next window
+    if expected < 1000 * window:                     # case the saving doesn't pay the extra solving time
+        return f'expected saving {expected:.0f} ms < {1000*window:.0f} ms of solving'
+    return None
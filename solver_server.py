@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+#############################################################################################################
+#
+# Solver server: a long-lived process loading the Kociemba solver tables once, and solving the cubes requested
+# by the clients (GUI, webcam colors recognition, or any other front end) over a local socket.
+#
+# Server: python solver_server.py (from the repo folder, where the solver tables are)
+# Clients: solve() and solve_anytime() have the same arguments of the cube_solver functions; the server is started
+# by the first client, in case it is not running yet.
+# solve_first() solves several candidate cube status strings concurrently, the first solved one wins.
+#
+# Requests are pipelined: a client can send more requests without waiting for the replies, each request is solved
+# on its own thread, and replies are matched to the requests via their id.
+# Request:  (request id, cube status string, max_length, timeout, robot_settings, orientations, stream)
+# Reply:    (request id, solution string, robot time in ms, final), solution is None when the request is cancelled
+# Cancel:   ('cancel', request id)
+# Server and clients authenticate via a random key, generated once per user on a file readable by the user only.
+#
+#############################################################################################################
+"""
+
+import threading                              # threads to read the messages, and to solve the requests
+import queue                                  # queue with the replies, per request
+import itertools                              # counter for the request ids
+import time                                   # time library, to wait for the server start
+import os                                     # os is imported to get the script folder
+import sys                                    # sys is imported to get the python interpreter, to start the server
+import subprocess                             # the server is started as a separated process
+import tempfile                               # temporary file, to write the authentication key
+from multiprocessing.connection import Listener, Client   # local socket, exchanging python objects
+from multiprocessing import AuthenticationError   # wrong authentication key, between server and client
+import robot_moves as cm                      # the 24 cube orientations
+
+
+# Global variables
+SERVER_ADDRESS = ('localhost', 6011)          # local address of the solver server
+KEY_FILE = os.path.join(os.path.expanduser('~'), '.darksnake_solver.key')   # authentication key, per user
+KEY_LENGTH = 32                               # bytes of the authentication key
+SERVER_START_TIME = 120                       # max time (s) to wait for the server to load the solver tables
+all_orientations = tuple(range(len(cm.orientations)))   # indexes of the 24 cube orientations
+connection_errors = (OSError, EOFError, AuthenticationError)   # errors of a server that can't be reached
+
+client_conn = None                            # connection of this client to the server
+client_lock = threading.Lock()                # lock to open the connection and to send the requests
+replies = {}                                  # dict with the queue of the replies, per request id
+request_ids = itertools.count()               # counter for the request ids
+
+
+
+
+
+
+def auth_key(fname=None):
+    """ Returns the authentication key between server and clients. The key is randomly generated on the first call,
+        and saved on a file with read/write permissions for the user only (the file is written completely before
+        being linked, therefore server and clients always read the same key)."""
+
+    fname = KEY_FILE if fname is None else fname
+    if not os.path.exists(fname):             # case the key has not been generated yet
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname))   # file with user only permissions (0600)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(KEY_LENGTH))
+            os.chmod(tmp, 0o600)
+            os.link(tmp, fname)               # atomic, it fails when the key file has been made meanwhile
+        except FileExistsError:               # case another process has generated the key meanwhile
+            pass
+        finally:
+            os.remove(tmp)
+    with open(fname, 'rb') as f:
+        return f.read()
+
+
+
+
+
+
+# ##################################### server #########################################################################
+
+def handle_request(conn, send_lock, request, cancels):
+    """ Solves a request, sending back the solutions: only the final one, or also the improving ones when the
+        request has stream=True. A reply with solution None is sent in case the request is cancelled.
+        The cancel event of the request is removed from the cancels dict once the request is completed."""
+
+    import cube_solver as cs                  # already imported (and the tables loaded) by serve()
+
+    req_id, cubestring, max_length, timeout, robot_settings, orientations, stream = request
+    cancel = cancels[req_id]
+
+    def report(solution, robot_time, final):
+        if stream or final:                   # case the solution has to be sent to the client
+            with send_lock:
+                conn.send((req_id, solution, robot_time, final))
+
+    try:
+        cs.solve_anytime(cubestring, report, max_length, timeout, robot_settings, orientations, cancel)
+    except Exception as e:                    # case of unexpected errors, the client gets an error string
+        report(f'Error: {e}', None, True)
+    finally:
+        cancels.pop(req_id, None)             # completed requests can't be cancelled anymore
+    if cancel.is_set():                       # case the request has been cancelled
+        try:
+            with send_lock:
+                conn.send((req_id, None, None, True))
+        except OSError:                       # case the client has disconnected
+            pass
+
+
+
+
+
+
+def handle_client(conn):
+    """ Reads the messages from a client, and starts a thread per solve request."""
+
+    send_lock = threading.Lock()              # replies are sent by multiple threads
+    cancels = {}                              # dict with the cancel event per request id
+    while True:
+        try:
+            msg = conn.recv()                 # request, or cancel, from the client
+        except (EOFError, OSError):           # case the client has disconnected
+            break
+        if msg[0] == 'cancel':                # case of a cancel message
+            cancel = cancels.get(msg[1])      # None once the request is completed
+            if cancel is not None:
+                cancel.set()
+        else:                                 # case of a solve request
+            cancels[msg[0]] = threading.Event()
+            threading.Thread(target=handle_request, args=(conn, send_lock, msg, cancels), daemon=True).start()
+    for cancel in list(cancels.values()):     # requests of the disconnected client are cancelled
+        cancel.set()
+
+
+
+
+
+
+def serve(address=SERVER_ADDRESS):
+    """ Loads the solver tables once, starts the orientations process pool once, and serves the clients: a thread
+        per client."""
+
+    import cube_solver as cs                  # the twophase solver tables are loaded here, once
+    cs.ns.load()                              # near solved cubes index is loaded (or generated), once
+    cs.start_pool()                           # processes solving the cube orientations, shared by the requests
+
+    listener = Listener(address, authkey=auth_key())
+    print(f'solver server ready on {address}')
+    while True:
+        conn = listener.accept()              # new client
+        threading.Thread(target=handle_client, args=(conn,), daemon=True).start()
+
+
+
+
+
+
+# ##################################### client #########################################################################
+
+def start_server():
+    """ Starts the solver server as a separated process, from the repo folder (where the solver tables are)."""
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    subprocess.Popen([sys.executable, os.path.join(folder, 'solver_server.py')], cwd=folder)
+
+
+
+
+
+
+def read_replies(conn):
+    """ Reads the replies from the server (client thread), and puts them on the queue of their request."""
+
+    global client_conn
+
+    while True:
+        try:
+            req_id, solution, robot_time, final = conn.recv()
+        except (EOFError, OSError):           # case the server is not reachable anymore
+            with client_lock:
+                client_conn = None
+            for q in list(replies.values()):  # pending requests are terminated
+                q.put(('Error: solver server not available', None, True))
+            replies.clear()
+            break
+        q = replies.get(req_id)
+        if q is not None:                     # case the request is still pending
+            q.put((solution, robot_time, final))
+            if final:                         # case of the last reply for the request
+                replies.pop(req_id, None)
+
+
+
+
+
+
+def connect(address=SERVER_ADDRESS, wait=SERVER_START_TIME):
+    """ Returns the connection to the solver server; the server is started, and waited for, when not running.
+        In case the server can't be reached one of connection_errors is raised (AuthenticationError in case the
+        server has another key, EOFError in case the server closes the connection)."""
+
+    global client_conn
+
+    with client_lock:
+        if client_conn is not None:           # case the connection is already open
+            return client_conn
+        try:
+            conn = Client(address, authkey=auth_key())
+        except ConnectionRefusedError:        # case the server is not running
+            start_server()
+            deadline = time.monotonic() + wait
+            while True:
+                time.sleep(0.5)
+                try:
+                    conn = Client(address, authkey=auth_key())
+                    break
+                except (ConnectionRefusedError, EOFError):   # case the server is still starting
+                    if time.monotonic() > deadline:   # case the server did not start in time
+                        raise
+        client_conn = conn
+        threading.Thread(target=read_replies, args=(conn,), daemon=True).start()
+        return conn
+
+
+
+
+
+
+def warmup(address=SERVER_ADDRESS, wait=SERVER_START_TIME):
+    """ Starts the solver server (that loads, or generates, the solver tables) when not running, and connects to it.
+        Returns True when the server is reachable, False otherwise (the solvings will get an error string)."""
+
+    try:
+        connect(address, wait)                # solver server is started, when not running yet
+        return True
+    except connection_errors:                 # case the server can't be reached
+        return False
+
+
+
+
+
+
+def submit(cubestring, max_length=20, timeout=2, robot_settings=None, orientations=None, stream=False):
+    """ Sends a solve request to the server, without waiting for the solution, and returns the request id with the
+        queue of its replies. The queue is made before sending the request, as the replies are removed from the
+        replies dict once the final one is received."""
+
+    conn = connect()
+    req_id = next(request_ids)
+    q = queue.Queue()                         # queue for the replies to this request
+    replies[req_id] = q
+    try:
+        with client_lock:
+            conn.send((req_id, cubestring, max_length, timeout, robot_settings, orientations, stream))
+    except connection_errors:                 # case the server is not reachable anymore
+        replies.pop(req_id, None)
+        raise
+    return req_id, q
+
+
+
+
+
+
+def cancel_request(req_id):
+    """ Cancels a request sent to the server."""
+
+    with client_lock:
+        if client_conn is not None:
+            client_conn.send(('cancel', req_id))
+
+
+
+
+
+
+def solve(cubestring, max_length=20, timeout=2, robot_settings=None, orientations=None):
+    """ Solves the cube via the solver server, and returns the solution with the lowest robot time (twophase solver
+        format, i.e. 'U1 R2 F3 (3f)'), as per cube_solver.solve()."""
+
+    try:
+        req_id, q = submit(cubestring, max_length, timeout, robot_settings, orientations)
+    except connection_errors:                 # case the server can't be reached
+        return 'Error: solver server not available'
+    while True:
+        solution, robot_time, final = q.get()
+        if final:                             # case of the final solution
+            return solution if solution is not None else 'Error: request cancelled'
+
+
+
+
+
+
+def solve_first(cubestrings, max_length=20, timeout=2, robot_settings=None, orientations=None):
+    """ Solves concurrently a list of candidate cube status strings (i.e. different colors interpretations of the same
+        cube) via the solver server, and returns the index of the preferred candidate getting a solution, with its
+        solution (as per solve). Candidates are preferred as per their order in the list: a candidate wins once it is
+        solved and all the previous ones could not be solved, therefore the result doesn't depend on the solving
+        times. Requests of the other candidates are cancelled once the winner is known.
+        In case no candidate gets a solution, the index is None and the solution is the last error string."""
+
+    queues = {}                               # queue of the replies, per candidate index
+    requests = {}                             # request id, per candidate index
+    try:
+        for i, cubestring in enumerate(cubestrings):
+            if cubestring in cubestrings[:i]: # case of a candidate identical to a previous one, solved once
+                continue
+            requests[i], queues[i] = submit(cubestring, max_length, timeout, robot_settings, orientations)
+    except connection_errors:                 # case the server can't be reached
+        return None, 'Error: solver server not available'
+
+    results = {}                              # final reply, per candidate index
+    error = 'Error: no candidates to solve'
+    while True:
+        for i, q in list(queues.items()):     # iteration over the pending candidates
+            try:
+                solution, robot_time, final = q.get_nowait()
+            except queue.Empty:               # case there is no solution yet for this candidate
+                continue
+            if final:                         # case of the final reply for this candidate
+                del queues[i]
+                results[i] = solution if solution is not None else 'Error: request cancelled'
+        for i in sorted(requests):            # iteration over the candidates, in order of preference
+            if i not in results:              # case a preferred candidate is still being solved
+                break
+            if results[i][:5] != 'Error':     # case of the preferred candidate getting a solution
+                for j in queues:              # the other candidates are cancelled
+                    cancel_request(requests[j])
+                return i, results[i]
+            error = results[i]                # the candidate could not be solved, the next one is considered
+        if not queues:                        # case all the candidates have been solved (or not)
+            return None, error
+        time.sleep(0.02)
+
+
+
+
+
+
+def solve_anytime(cubestring, report, max_length=20, timeout=2, robot_settings=None, orientations=None, cancel=None):
+    """ Solves the cube via the solver server, streaming the improving solutions to report(solution, robot_time, final)
+        as per cube_solver.solve_anytime(). The request is cancelled once the cancel event is set."""
+
+    try:
+        req_id, q = submit(cubestring, max_length, timeout, robot_settings, orientations, stream=True)
+    except connection_errors:                 # case the server can't be reached
+        report('Error: solver server not available', None, True)
+        return
+    while True:
+        try:
+            solution, robot_time, final = q.get(timeout=0.05)
+        except queue.Empty:                   # case there are no new solutions
+            if cancel is not None and cancel.is_set():   # case the request has been cancelled
+                cancel_request(req_id)
+                return
+            continue
+        if solution is None:                  # case the request has been cancelled
+            return
+        if cancel is None or not cancel.is_set():
+            report(solution, robot_time, final)
+        if final:                             # case of the final solution
+            return
+
+
+
+
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,446 @@
+"""
+#############################################################################################################
+#
+# Memory mapped twophase solver tables.
+# The twophase library reads its tables (move, symmetry and pruning tables) into private arrays, in every process
+# importing the solver. Here each table file is mapped read-only (mmap), and the twophase module globals are pointed
+# to the mapped tables: all the solver processes share a single physical copy of the tables (the OS page cache).
+# The tables are mapped while the twophase modules are imported: the modules with tables are executed with their own
+# import function, giving them an array module whose empty arrays map the table file on fromfile(), therefore the
+# tables are never read into private arrays. Nothing changes for the other modules (sys.modules['array'] included).
+#
+# The tables are validated once via a checksum index (tables_index.json, in the tables folder), with the size,
+# modification time and sha256 of each table file: the checksums are computed only when the index is missing, or
+# when a table file has changed since the index was written.
+#
+# Missing tables (first run on a new station) are generated in parallel processes: the twophase modules create their
+# tables at import time, therefore each job imports the twophase module in a fresh process, from a private folder
+# having the tables it depends on (hard links) and placeholders for the tables it doesn't need to generate.
+# The generated tables are checked (size, and checksum when indexed) and then moved (atomic replace) into the tables
+# folder. Private folders left by interrupted jobs (tmp_<pid>_*) are removed by the next generation.
+# Tables can be generated in advance via: python solver_tables.py
+#
+#############################################################################################################
+"""
+
+import mmap                                   # tables are mapped read-only
+import array                                  # twophase arrays, replaced by the mapped tables
+import types                                  # array module used by the twophase modules, while importing them
+import builtins                               # import function of the twophase modules, replaced while importing them
+import threading                              # lock, as the tables are mapped once per process
+import hashlib                                # sha256 checksums of the tables
+import json                                   # checksum index file
+import os                                     # os is imported to ensure the file presence, and to get size and time
+import sys                                    # sys is imported to get the loaded twophase modules
+import shutil                                 # private folders of the table generation jobs are removed
+import tempfile                               # private folders of the table generation jobs
+import importlib                              # twophase modules are imported by the table generation jobs
+import importlib.util                         # twophase modules with tables are imported with their own import function
+import subprocess                             # each table generation job runs in a fresh python process
+import time                                   # time library, to report the table generation progress
+import concurrent.futures as cf               # pool of threads, each one waiting for a table generation process
+import twophase.defs as defs                  # Kociemba solver library (by Hergbert Kociemba), for the tables folder
+
+
+# Global variables
+INDEX_FILE = 'tables_index.json'              # checksum index file name, in the tables folder
+STALE_TIME = 86400                            # age (s) of a private job folder considered stale, when pids can't be checked
+
+# (twophase module, global variable, table file name) of each table, the modules in their import dependency order
+tables = (('twophase.moves', 'twist_move', 'move_twist'),
+          ('twophase.moves', 'flip_move', 'move_flip'),
+          ('twophase.moves', 'slice_sorted_move', 'move_slice_sorted'),
+          ('twophase.moves', 'u_edges_move', 'move_u_edges'),
+          ('twophase.moves', 'd_edges_move', 'move_d_edges'),
+          ('twophase.moves', 'ud_edges_move', 'move_ud_edges'),
+          ('twophase.moves', 'corners_move', 'move_corners'),
+          ('twophase.symmetries', 'twist_conj', 'conj_twist'),
+          ('twophase.symmetries', 'ud_edges_conj', 'conj_ud_edges'),
+          ('twophase.symmetries', 'flipslice_classidx', 'fs_classidx'),
+          ('twophase.symmetries', 'flipslice_sym', 'fs_sym'),
+          ('twophase.symmetries', 'flipslice_rep', 'fs_rep'),
+          ('twophase.symmetries', 'corner_classidx', 'co_classidx'),
+          ('twophase.symmetries', 'corner_sym', 'co_sym'),
+          ('twophase.symmetries', 'corner_rep', 'co_rep'),
+          ('twophase.pruning', 'flipslice_twist_depth3', 'phase1_prun'),
+          ('twophase.pruning', 'corners_ud_edges_depth3', 'phase2_prun'),
+          ('twophase.pruning', 'cornslice_depth', 'phase2_cornsliceprun'),
+          ('twophase.coord', 'u_edges_plus_d_edges_to_ud_edges', 'phase2_edgemerge'))
+
+# size (bytes) of each table file
+table_sizes = {'move_twist':2 * defs.N_TWIST * defs.N_MOVE,
+               'move_flip':2 * defs.N_FLIP * defs.N_MOVE,
+               'move_slice_sorted':2 * defs.N_SLICE_SORTED * defs.N_MOVE,
+               'move_u_edges':2 * defs.N_SLICE_SORTED * defs.N_MOVE,
+               'move_d_edges':2 * defs.N_SLICE_SORTED * defs.N_MOVE,
+               'move_ud_edges':2 * defs.N_UD_EDGES * defs.N_MOVE,
+               'move_corners':2 * defs.N_CORNERS * defs.N_MOVE,
+               'conj_twist':2 * defs.N_TWIST * defs.N_SYM_D4h,
+               'conj_ud_edges':2 * defs.N_UD_EDGES * defs.N_SYM_D4h,
+               'fs_classidx':2 * defs.N_FLIP * defs.N_SLICE,
+               'fs_sym':defs.N_FLIP * defs.N_SLICE,
+               'fs_rep':4 * defs.N_FLIPSLICE_CLASS,
+               'co_classidx':2 * defs.N_CORNERS,
+               'co_sym':defs.N_CORNERS,
+               'co_rep':2 * defs.N_CORNERS_CLASS,
+               'phase1_prun':4 * (defs.N_FLIPSLICE_CLASS * defs.N_TWIST // 16 + 1),
+               'phase2_prun':4 * (defs.N_CORNERS_CLASS * defs.N_UD_EDGES // 16),
+               'phase2_cornsliceprun':defs.N_CORNERS * defs.N_PERM_4,
+               'phase2_edgemerge':2 * defs.N_U_EDGES_PHASE2 * defs.N_PERM_4}
+
+# table generation jobs: (twophase module, table files created together, table files they depend on)
+jobs = (('twophase.moves', ('move_twist',), ()),
+        ('twophase.moves', ('move_flip',), ()),
+        ('twophase.moves', ('move_slice_sorted',), ()),
+        ('twophase.moves', ('move_u_edges',), ()),
+        ('twophase.moves', ('move_d_edges',), ()),
+        ('twophase.moves', ('move_ud_edges',), ()),
+        ('twophase.moves', ('move_corners',), ()),
+        ('twophase.symmetries', ('conj_twist',), ()),
+        ('twophase.symmetries', ('conj_ud_edges',), ()),
+        ('twophase.symmetries', ('fs_classidx', 'fs_sym', 'fs_rep'), ()),
+        ('twophase.symmetries', ('co_classidx', 'co_sym', 'co_rep'), ()),
+        ('twophase.coord', ('phase2_edgemerge',), ()),
+        ('twophase.pruning', ('phase1_prun',), ('move_flip', 'move_slice_sorted', 'move_twist', 'conj_twist',
+                                                'fs_classidx', 'fs_sym', 'fs_rep')),
+        ('twophase.pruning', ('phase2_prun',), ('move_corners', 'move_ud_edges', 'conj_ud_edges',
+                                                'co_classidx', 'co_sym', 'co_rep')),
+        ('twophase.pruning', ('phase2_cornsliceprun',), ('move_corners', 'move_slice_sorted')))
+
+mapped = {}              # dict with the mapped table (memoryview) per table file name
+map_lock = threading.Lock()   # lock to map the tables once
+
+
+
+
+
+
+def file_checksum(fname):
+    """ Returns the sha256 (hex string) of a file."""
+
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):   # 1 MB blocks
+            h.update(block)
+    return h.hexdigest()
+
+
+
+
+
+
+def check_tables(folder=defs.FOLDER):
+    """ Validates the table files against the checksum index; the index is written when missing, or updated for the
+        table files changed since (size or modification time) that still have the indexed checksum.
+        A ValueError is raised in case a table file does not match its checksum."""
+
+    index_fname = os.path.join(folder, INDEX_FILE)
+    index = {}                                           # dict with size, time and checksum per table file name
+    if os.path.isfile(index_fname):                      # case the checksum index exists
+        with open(index_fname, 'r') as f:
+            index = json.load(f)
+
+    changed = False                                      # flag tracking changes to the index
+    for module, var, name in tables:                     # iteration over the tables
+        fname = os.path.join(folder, name)
+        st = os.stat(fname)
+        entry = index.get(name)
+        if entry is not None and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            continue                                     # case the table file has been already validated
+        checksum = file_checksum(fname)
+        if entry is not None and entry['sha256'] != checksum:   # case the table file differs from the indexed one
+            raise ValueError(f'solver table {fname} does not match its checksum, delete it to regenerate it')
+        index[name] = {'size':st.st_size, 'mtime_ns':st.st_mtime_ns, 'sha256':checksum}
+        changed = True
+
+    if changed:                                          # case the index has new or updated entries
+        with open(index_fname, 'w') as f:
+            json.dump(index, f, indent=0)
+
+
+
+
+
+
+def check_generated(workdir, names, folder=defs.FOLDER):
+    """ Validates the table files generated in workdir, before they are moved into the tables folder: the size must be
+        the expected one, and the checksum the indexed one (in case of table regenerated after being deleted).
+        A ValueError is raised in case of a not valid table file."""
+
+    index_fname = os.path.join(folder, INDEX_FILE)
+    index = {}                                           # dict with size, time and checksum per table file name
+    if os.path.isfile(index_fname):                      # case the checksum index exists
+        with open(index_fname, 'r') as f:
+            index = json.load(f)
+
+    for name in names:                                   # iteration over the generated tables
+        fname = os.path.join(workdir, name)
+        size = os.path.getsize(fname)
+        if size != table_sizes[name]:                    # case the table file size is not the expected one
+            raise ValueError(f'generated solver table {name} has {size} bytes instead of {table_sizes[name]}')
+        if name in index and file_checksum(fname) != index[name]['sha256']:   # case of checksum mismatch
+            raise ValueError(f'generated solver table {name} does not match its indexed checksum')
+
+
+
+
+
+
+def stale_workdir(path):
+    """ Returns True when a private folder of a table generation job (tmp_<pid>_*) is left by an interrupted job: the
+        job process is not running anymore (or, when the pid can't be checked, the folder is older than STALE_TIME)."""
+
+    try:
+        pid = int(os.path.basename(path).split('_')[1])  # process id of the job
+    except (IndexError, ValueError):                     # case of folder without the process id
+        return True
+    if os.name == 'nt':                                  # case of Windows, os.kill() can't check a process
+        return time.time() - os.path.getmtime(path) > STALE_TIME
+    try:
+        os.kill(pid, 0)                                  # signal 0 only checks the process existence
+    except ProcessLookupError:                           # case the job process is not running
+        return True
+    except PermissionError:                              # case of process running, by another user
+        return False
+    return False
+
+
+
+
+
+
+def remove_stale_workdirs(folder=defs.FOLDER):
+    """ Removes the private folders left in the tables folder by the interrupted table generation jobs."""
+
+    for entry in os.listdir(folder):                     # iteration over the tables folder content
+        path = os.path.join(folder, entry)
+        if entry.startswith('tmp_') and os.path.isdir(path) and stale_workdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+
+
+
+
+def missing_tables(folder=defs.FOLDER):
+    """Returns the list of the table files not present in the tables folder."""
+
+    return [name for name in table_sizes if not os.path.isfile(os.path.join(folder, name))]
+
+
+
+
+
+
+def generate_job(module, names, folder):
+    """ Table generation job (python solver_tables.py --job): the twophase module is imported from a private folder, where the
+        tables to be generated are missing, the existing ones are linked and the others are placeholders (zeros).
+        The generated table files are then checked, and moved into the tables folder. The private folder is removed
+        in any case; its name has the process id, to recognize the folders left by a killed job."""
+
+    workdir = tempfile.mkdtemp(prefix=f'tmp_{os.getpid()}_', dir=folder)   # private folder, on the tables file system
+    try:
+        os.mkdir(os.path.join(workdir, defs.FOLDER))
+        for name, size in table_sizes.items():               # iteration over the tables
+            if name in names:                                # case of a table generated by this job
+                continue
+            src, dst = os.path.join(folder, name), os.path.join(workdir, defs.FOLDER, name)
+            if os.path.isfile(src):                          # case the table exists
+                try:
+                    os.link(src, dst)
+                except OSError:                              # case hard links aren't supported
+                    shutil.copyfile(src, dst)
+            else:                                            # case the table is not (yet) needed
+                with open(dst, 'wb') as f:
+                    f.truncate(size)                         # placeholder with the table size (sparse file)
+        os.chdir(workdir)                                    # the twophase tables folder is relative to the cwd
+        importlib.import_module(module)                      # the twophase module generates the missing tables
+        check_generated(os.path.join(workdir, defs.FOLDER), names, folder)
+        for name in names:                                   # iteration over the generated tables
+            os.replace(os.path.join(workdir, defs.FOLDER, name), os.path.join(folder, name))
+    finally:
+        os.chdir(folder)                                     # the private folder can't be removed while it is the cwd
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+
+
+
+
+def run_job(module, names, folder):
+    """ Runs a table generation job in a fresh python process, with its output silenced."""
+
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--job', module, folder] + list(names),
+                   stdout=subprocess.DEVNULL, check=True)
+
+
+
+
+
+
+def generate_tables(folder=defs.FOLDER, workers=None):
+    """ Generates the missing table files in parallel processes: each job starts once the tables it depends on are
+        available, and the progress is printed as the jobs are completed."""
+
+    folder = os.path.abspath(folder)
+    os.makedirs(folder, exist_ok=True)
+    remove_stale_workdirs(folder)                            # private folders left by interrupted jobs
+    todo = [job for job in jobs if not all(os.path.isfile(os.path.join(folder, n)) for n in job[1])]
+    if not todo:                                             # case all the tables are present
+        return
+
+    print(f'generating {len(todo)} solver table jobs, in {folder}')
+    t_start = time.time()
+    running = {}                                             # dict with the job per future
+    done_count = 0                                           # amount of completed jobs
+    with cf.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while todo or running:
+            for job in list(todo):                           # iteration over the jobs to be started
+                module, names, deps = job
+                if all(os.path.isfile(os.path.join(folder, n)) for n in deps):   # case the job can be started
+                    running[pool.submit(run_job, module, names, folder)] = job
+                    todo.remove(job)
+            done, pending = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for future in done:                              # iteration over the completed jobs
+                job = running.pop(future)
+                future.result()                              # eventual errors of the job are raised here
+                done_count += 1
+                print(f'solver tables {", ".join(job[1])} done ({done_count} jobs, {time.time()-t_start:.0f} s)')
+
+
+
+
+
+
+def map_table(fname, typecode):
+    """ Maps read-only a table file, and returns it as a memoryview with the typecode of the twophase array."""
+
+    with open(fname, 'rb') as f:                         # the mapping stays valid after the file is closed
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode)
+
+
+
+
+
+
+class MappedArray:
+    """ Stand-in of an empty twophase array, while the twophase modules are imported: fromfile() maps the table file
+        rather than reading it. The twophase globals are then pointed to the mapped tables (see map_tables)."""
+
+    def __init__(self, typecode):
+        self.typecode = typecode
+        self.itemsize = array.array(typecode).itemsize
+        self.view = None                                 # mapped table, once fromfile() is called
+
+    def fromfile(self, f, n):
+        self.view = map_table(f.name, self.typecode)
+        if len(self.view) != n:                          # case the table file size is not the expected one
+            raise ValueError(f'solver table {f.name} has {len(self.view)} entries instead of {n}')
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, i):
+        return self.view[i]
+
+
+
+
+
+
+def mapping_array(typecode, *args):
+    """ array.array replacement for the twophase modules: arrays with initial values (tables being generated, and
+        small tables computed at import) are arrays, empty arrays (tables being loaded) are MappedArray."""
+
+    return array.array(typecode, *args) if args else MappedArray(typecode)
+
+
+mapping_module = types.ModuleType('array')           # array module of the twophase modules with tables, while importing
+mapping_module.__dict__.update(array.__dict__)
+mapping_module.array = mapping_array
+
+
+
+
+
+
+def mapping_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """ Import function of the twophase modules with tables: the array module is mapping_module, the other modules
+        are imported as usual."""
+
+    if name == 'array' and level == 0:                   # case of the array module
+        return mapping_module
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+
+
+
+
+def import_mapped(module):
+    """ Imports a twophase module with tables, the module being executed with mapping_import as import function: the
+        change is local to the module namespace, and once imported the module refers to the array module again."""
+
+    spec = importlib.util.find_spec(module)
+    mod = importlib.util.module_from_spec(spec)
+    mod.__builtins__ = dict(builtins.__dict__, __import__=mapping_import)   # builtins of the module namespace
+    sys.modules[module] = mod                            # as per a regular import, the module is registered first
+    try:
+        spec.loader.exec_module(mod)
+    except BaseException:                                # case the module can't be imported
+        del sys.modules[module]
+        raise
+    for var, value in list(vars(mod).items()):           # the module refers to the array module again
+        if value is mapping_module:
+            setattr(mod, var, array)
+    parent, _, child = module.rpartition('.')
+    setattr(sys.modules[parent], child, mod)             # as per a regular import, the module is a package attribute
+    return mod
+
+
+
+
+
+
+def map_tables(folder=defs.FOLDER):
+    """ Imports the twophase solver (generating the tables when missing), validates the table files, and points the
+        twophase module globals to the memory mapped tables. It runs once per process (forked processes inherit it).
+        The twophase modules with tables are imported via import_mapped, so the tables are mapped rather than read
+        (see MappedArray); when they have been imported before, the tables they read are replaced by the mapped ones."""
+
+    with map_lock:
+        if mapped:                                       # case the tables are already mapped
+            return
+        if missing_tables(folder):                       # case of first run, or tables deleted
+            generate_tables(folder)
+        check_tables(folder)
+
+        if not any(module in sys.modules for module, var, name in tables):   # case the tables are not loaded yet
+            for module in dict.fromkeys([module for module, var, name in tables]):   # as per the dependency order
+                import_mapped(module)
+        importlib.import_module('twophase.solver')       # the modules with tables are already imported
+
+        views = {}                                       # dict with the mapped table per table file name
+        for module, var, name in tables:                 # iteration over the tables
+            table = getattr(sys.modules[module], var)    # mapped table, or twophase array loaded from the table file
+            if isinstance(table, MappedArray):           # case of table mapped while importing
+                views[name] = table.view
+            else:                                        # case of twophase array, read before (i.e. twophase imported)
+                views[name] = map_table(os.path.join(folder, name), table.typecode)
+                if len(views[name]) != len(table):       # case the table file size is not the expected one
+                    raise ValueError(f'solver table {name} has {len(views[name])} entries instead of {len(table)}')
+        for module, var, name in tables:                 # twophase globals are pointed to the mapped tables
+            setattr(sys.modules[module], var, views[name])
+        mapped.update(views)
+
+
+
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == '--job':   # case of a table generation job
+        generate_job(sys.argv[2], sys.argv[4:], sys.argv[3])
+    else:                                                # case of tables generation, i.e. provisioning a new station
+        generate_tables()
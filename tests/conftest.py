@@ -0,0 +1,9 @@
+"""
+Tests setup: the repo modules are imported from the repo folder, the tests are run from any folder.
+Tests never import twophase.solver (it would generate the solver tables in the working folder).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,182 @@
+import threading
+import numpy as np
+import colors_recognition as cr
+
+
+class FakeCapture:
+    """ cv2.VideoCapture stand-in: numbered frames, one per read() call, up to amount."""
+
+    def __init__(self, amount):
+        self.amount = amount
+        self.count = 0
+        self.done = threading.Event()
+
+    def read(self):
+        if self.count >= self.amount:
+            self.done.set()
+            return False, None
+        self.count += 1
+        return True, np.full((4, 4, 3), self.count, dtype=np.uint8)
+
+
+def capture(monkeypatch, amount):
+    monkeypatch.setattr(cr, 'camera', FakeCapture(amount), raising=False)
+    cr.start_capture()
+    assert cr.camera.done.wait(5)
+    cr.stop_capture()
+
+
+def test_ring_buffer_keeps_the_latest_frames(monkeypatch):
+    capture(monkeypatch, 10)
+    assert len(cr.frames) == cr.FRAME_BUFFER
+    assert [n for t, n, frame in cr.frames] == list(range(10 - cr.FRAME_BUFFER, 10))
+    frame, timestamp = cr.latest_frame(timeout=0)
+    assert frame[0, 0, 0] == 10 and timestamp == cr.frames[-1][0]
+
+
+def test_latest_frame_is_a_copy(monkeypatch):
+    capture(monkeypatch, 3)
+    first, timestamp = cr.latest_frame(timeout=0)
+    first[:] = 255                                 # the analysis draws on the frame
+    again, timestamp_again = cr.latest_frame(timeout=0)   # no new frames, the same frame is returned again
+    assert timestamp_again == timestamp
+    assert again[0, 0, 0] == 3 and cr.frames[-1][2][0, 0, 0] == 3
+    assert again is not first and again is not cr.frames[-1][2]
+
+
+def test_no_frames(monkeypatch):
+    capture(monkeypatch, 0)
+    assert cr.latest_frame(timeout=0) == (None, None)
+
+
+def loop_average_color(image, x, y, edge):
+    """ Reference: the per-pixel loop average_color() had before the NumPy pass."""
+    blue = green = red = 0.0
+    for i in range(2*edge):
+        j = i - edge
+        for i in range(2*edge):
+            b, g, r = (int(c) for c in image[y+j, x-edge+i])
+            blue, green, red = blue + b*b, green + g*g, red + r*r
+    num = 4*edge*edge
+    return (int(np.sqrt(blue/num)), int(np.sqrt(green/num)), int(np.sqrt(red/num)))
+
+
+def test_average_colors_as_per_the_loop(monkeypatch):
+    monkeypatch.setattr(cr, 'debug', False, raising=False)
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    centers = [(30, 30), (80, 60), (130, 90), (3, 100)]   # the last square crosses the frame border
+    for edge in (5, 12, 20):
+        expected = [loop_average_color(image, x, y, edge) for x, y in centers]
+        assert cr.average_colors(image, centers, edge) == expected
+    monkeypatch.setattr(cr, 'edge', 7, raising=False)
+    assert cr.average_color(image, 80, 60) == loop_average_color(image, 80, 60, 7)
+
+
+# CIEDE2000 test data (G. Sharma, W. Wu, E. N. Dalal, 2005): L1, a1, b1, L2, a2, b2, distance
+sharma_pairs = (
+    (50.0000, 2.6772, -79.7751, 50.0000, 0.0000, -82.7485, 2.0425),
+    (50.0000, 3.1571, -77.2803, 50.0000, 0.0000, -82.7485, 2.8615),
+    (50.0000, 2.8361, -74.0200, 50.0000, 0.0000, -82.7485, 3.4412),
+    (50.0000, -1.3802, -84.2814, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -1.1848, -84.8006, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -0.9009, -85.5211, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, 0.0000, 0.0000, 50.0000, -1.0000, 2.0000, 2.3669),
+    (50.0000, -1.0000, 2.0000, 50.0000, 0.0000, 0.0000, 2.3669),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0009, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0010, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0011, 7.2195),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0012, 7.2195),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0009, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0010, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0011, -2.4900, 4.7461),
+    (50.0000, 2.5000, 0.0000, 50.0000, 0.0000, -2.5000, 4.3065),
+    (50.0000, 2.5000, 0.0000, 73.0000, 25.0000, -18.0000, 27.1492),
+    (50.0000, 2.5000, 0.0000, 61.0000, -5.0000, 29.0000, 22.8977),
+    (50.0000, 2.5000, 0.0000, 56.0000, -27.0000, -3.0000, 31.9030),
+    (50.0000, 2.5000, 0.0000, 58.0000, 24.0000, 15.0000, 19.4535),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.1736, 0.5854, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2972, 0.0000, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 1.8634, 0.5757, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2592, 0.3350, 1.0000),
+    (60.2574, -34.0099, 36.2677, 60.4626, -34.1751, 39.4387, 1.2644),
+    (63.0109, -31.0961, -5.8663, 62.8187, -29.7946, -4.0864, 1.2630),
+    (61.2901, 3.7196, -5.3901, 61.4292, 2.2480, -4.9620, 1.8731),
+    (35.0831, -44.1164, 3.7933, 35.0232, -40.0716, 1.5901, 1.8645),
+    (22.7233, 20.0904, -46.6940, 23.0331, 14.9730, -42.5619, 2.0373),
+    (36.4612, 47.8580, 18.3852, 36.2715, 50.5065, 21.2231, 1.4146),
+    (90.8027, -2.0831, 1.4410, 91.1528, -1.6435, 0.0447, 1.4441),
+    (90.9257, -0.5406, -0.9208, 88.6381, -0.8985, -0.7239, 1.5381),
+    (6.7747, -0.2908, -2.4247, 5.8714, -0.0985, -2.2286, 0.6377),
+    (2.0776, 0.0795, -1.1350, 0.9033, -0.0636, -0.5514, 0.9082))
+
+
+def test_CIEDE2000_reference_pairs():
+    pairs = np.array(sharma_pairs)
+    matrix = cr.CIEDE2000_matrix(pairs[:, :3], pairs[:, 3:6])
+    assert np.abs(np.diag(matrix) - pairs[:, 6]).max() < 1e-4
+    for L1, a1, b1, L2, a2, b2, distance in sharma_pairs:
+        assert abs(cr.CIEDE2000((L1, a1, b1), (L2, a2, b2)) - distance) < 1e-4
+
+
+def test_CIEDE2000_matrix_as_per_the_single_distances():
+    rng = np.random.default_rng(1)
+    BGR = rng.integers(0, 256, (54, 3))
+    Lab = cr.bgr2lab_array(BGR)
+    for (b, g, r), lab in zip(BGR, Lab):
+        assert np.allclose(lab, cr.rgb2lab((r, g, b)))
+    matrix = cr.CIEDE2000_matrix(Lab, Lab[4::9])
+    assert matrix.shape == (54, 6)
+    expected = [[cr.CIEDE2000(l1, l2) for l2 in Lab[4::9]] for l1 in Lab]
+    assert np.allclose(matrix, expected)
+
+
+cube_BGR = {'white': (200, 200, 200), 'red': (40, 30, 170), 'green': (60, 150, 30),
+            'yellow': (40, 200, 210), 'orange': (30, 110, 230), 'blue': (160, 70, 20)}
+
+
+def scrambled_facelets(noise, seed=0):
+    """ Synthetic detected colors: 9 facelets per color in random order, the centers with their face color."""
+    rng = np.random.default_rng(seed)
+    colors = list(cube_BGR)
+    truth = list(rng.permutation([c for c in colors for _ in range(8)]))
+    for face, color in enumerate(colors):
+        truth.insert(9*face + 4, color)
+    BGR = np.array([cube_BGR[c] for c in truth]) + rng.normal(0, noise, (54, 3))
+    return [tuple(int(v) for v in bgr) for bgr in BGR.clip(0, 255)], truth
+
+
+def test_cube_colors_matched_finds_the_colors(monkeypatch):
+    monkeypatch.setattr(cr, 'debug', False, raising=False)
+    BGR_detected, truth = scrambled_facelets(noise=8)
+    cube_status, HSV_detected, cube_color_sequence, margins = cr.cube_colors_matched(BGR_detected)
+    assert list(cube_status.values()) == truth
+    assert (margins > 0).all()
+
+
+def test_cube_colors_matched_is_a_min_cost_matching(monkeypatch):
+    monkeypatch.setattr(cr, 'debug', False, raising=False)
+    BGR_detected, truth = scrambled_facelets(noise=40, seed=3)
+    cube_status, HSV_detected, cube_color_sequence, margins = cr.cube_colors_matched(BGR_detected, iterations=1)
+    colors = list(cube_BGR)
+    assigned = np.array([colors.index(c) for c in cube_status.values()])
+    assert (np.bincount(assigned) == 9).all()                          # 9 facelets per color
+    assert (assigned[[4, 13, 22, 31, 40, 49]] == np.arange(6)).all()   # the centers keep their color
+
+    lab = cr.bgr2lab_array(np.array(BGR_detected, dtype=np.float64))
+    cost = cr.CIEDE2000_matrix(lab, lab[[4, 13, 22, 31, 40, 49]])      # the first matching is toward the centers
+    total = cost[np.arange(54), assigned].sum()
+    others = [i for i in range(54) if i not in (4, 13, 22, 31, 40, 49)]
+    for i in others:                                                   # no swap of two facelets lowers the cost
+        for j in others:
+            swapped = cost[i, assigned[j]] + cost[j, assigned[i]] - cost[i, assigned[i]] - cost[j, assigned[j]]
+            assert swapped > -1e-9
+
+    greedy, count = np.full(54, -1), np.zeros(6, dtype=np.int64)       # facelets assigned one at the time, closest first
+    greedy[[4, 13, 22, 31, 40, 49]] = np.arange(6)
+    count[:] = 1
+    for flat in np.argsort(cost, axis=None):
+        i, c = divmod(int(flat), 6)
+        if greedy[i] < 0 and count[c] < 9:
+            greedy[i], count[c] = c, count[c] + 1
+    assert total <= cost[np.arange(54), greedy].sum() + 1e-9
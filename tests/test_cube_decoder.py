@@ -0,0 +1,54 @@
+import random
+import numpy as np
+import pytest
+import robot_moves as cm
+import cube_simulator as sim
+import cube_validator as cv
+import cube_decoder as cdec
+import near_solved as ns
+
+
+def random_cube(rng, length=25):
+    state = sim.to_array([''.join([f * 9 for f in cm.faces])])
+    for _ in range(length):
+        state = state[:, ns.face_turn_perms[rng.randrange(18)]]
+    return sim.to_strings(state)[0]
+
+
+def distance_matrix(cubestring, rng=None, sigma=0):
+    """ 54 x 6 distances: 0 from the facelet color, 10 from the other ones, plus the eventual noise."""
+    distance = np.full((54, 6), 10.0)
+    distance[np.arange(54), [cm.faces.index(c) for c in cubestring]] = 0
+    if rng is not None:
+        distance += np.abs(np.array([[rng.gauss(0, sigma) for _ in range(6)] for _ in range(54)]))
+    return distance
+
+
+def test_clean_distances_are_decoded_exactly():
+    rng = random.Random(0)
+    for _ in range(30):
+        cubestring = random_cube(rng)
+        assert cdec.decode(distance_matrix(cubestring)) == (cubestring, 0.0)
+
+
+@pytest.mark.parametrize('sigma', (2, 5, 8))
+def test_decoded_cubes_are_coherent(sigma):
+    rng = random.Random(sigma)
+    for _ in range(30):
+        cubestring = random_cube(rng)
+        decoded, cost = cdec.decode(distance_matrix(cubestring, rng, sigma))
+        assert cv.check(decoded) == ''
+        assert cost >= 0
+
+
+def test_swapped_facelets_are_corrected():
+    rng = random.Random(1)
+    for _ in range(30):
+        cubestring = random_cube(rng)
+        distance = distance_matrix(cubestring)
+        i, j = rng.sample([k for k in range(54) if k % 9 != 4], 2)   # two facelets (not centers) read swapped
+        distance[[i, j]] = distance[[j, i]]
+        distance[[i, j]] *= 0.5                    # less confident readings
+        decoded, cost = cdec.decode(distance)
+        assert cv.check(decoded) == ''
+        assert cost <= 10.0
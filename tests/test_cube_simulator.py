@@ -0,0 +1,77 @@
+import random
+import threading
+import numpy as np
+import pytest
+import robot_moves as cm
+import cube_simulator as sim
+import near_solved as ns
+
+
+def random_moves(rng, amount):
+    return ''.join(rng.choice(('F1', 'F2', 'F3', 'S1', 'S3', 'R1', 'R3')) for _ in range(amount))
+
+
+def reference_permutation(moves):
+    """ Composition of the single moves permutations, without the cache."""
+    perm = np.arange(54)
+    for i in range(0, len(moves), 2):
+        ref = sim.perm_arrays['F1'] if moves[i] == 'F' else sim.perm_arrays[moves[i:i+2]]
+        for j in range(int(moves[i+1]) if moves[i] == 'F' else 1):
+            perm = perm[ref]
+    return perm
+
+
+def test_cached_permutations_are_read_only():
+    perm = sim.move_permutation('F1S1R1')
+    assert sim.move_permutation('F1S1R1') is perm
+    with pytest.raises(ValueError):
+        perm[0] = 1
+
+
+def test_concurrent_permutations(monkeypatch):
+    monkeypatch.setattr(sim, 'perm_cache', {})
+    monkeypatch.setattr(sim, 'max_cached', 64)     # the cache is emptied while the threads use it
+    rng = random.Random(0)
+    corpus = [random_moves(rng, rng.randrange(1, 30)) for _ in range(300)]
+    errors = []
+
+    def worker(seed):
+        r = random.Random(seed)
+        for _ in range(2000):
+            moves = r.choice(corpus)
+            if not np.array_equal(sim.move_permutation(moves), reference_permutation(moves)):
+                errors.append(moves)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+
+
+def test_verify_programs():
+    solved = ''.join([f * 9 for f in cm.faces])
+    rng = random.Random(1)
+    moves = [random_moves(rng, 20) for _ in range(20)]
+    states = sim.apply_batch(sim.to_array([solved] * 20), moves)
+    inverse = [''.join(m[i] + str(4 - int(m[i+1])) for i in range(len(m) - 2, -1, -2)) for m in moves]
+    assert sim.verify_programs(sim.to_strings(states), inverse).all()
+
+
+@pytest.mark.parametrize('orientation', range(24))
+def test_reoriented_solutions_map_back_to_the_original_frame(orientation):
+    solved = ''.join([f * 9 for f in cm.faces])
+    rng = random.Random(orientation)
+    solution = ''.join(rng.choice(cm.solver_moves) for _ in range(15))
+    scramble = ''.join(solution[i] + str(4 - int(solution[i+1])) for i in range(len(solution) - 2, -1, -2))
+    state = sim.to_array([solved])
+    for i in range(0, len(scramble), 2):          # face turns, the cube orientation doesn't change
+        state = state[:, ns.face_turn_perms[cm.solver_move_index[scramble[i:i+2]]]]
+    cubestring = sim.to_strings(state)[0]
+
+    faces_at = cm.orientations[orientation]       # the solution as found by the solver, for the reoriented cube
+    found = ''.join(cm.faces[faces_at.index(solution[i])] + solution[i+1] for i in range(0, len(solution), 2))
+    reoriented = sim.reoriented_cubestring(cubestring, orientation)
+    assert sim.verify_programs([reoriented], [cm.robot_required_moves(found, '')[1]])[0]
+    assert cm.original_frame(found, orientation) == solution
@@ -0,0 +1,71 @@
+import random
+import pytest
+import twophase.face as face
+import twophase.cubie as cubie
+import robot_moves as cm
+import cube_simulator as sim
+import near_solved as ns
+import cube_validator as cv
+
+
+solved = ''.join([f * 9 for f in cm.faces])
+
+
+def scrambled(seed, length=25):
+    rng = random.Random(seed)
+    state = sim.to_array([solved])
+    for _ in range(length):
+        state = state[:, ns.face_turn_perms[rng.randrange(18)]]
+    return sim.to_strings(state)[0]
+
+
+def swapped(cubestring, *pairs):
+    facelets = list(cubestring)
+    for a, b in pairs:
+        facelets[a], facelets[b] = facelets[b], facelets[a]
+    return ''.join(facelets)
+
+
+def twophase_valid(cubestring):
+    """ Valid as per twophase, and the cubies give back the same facelets (twophase doesn't check all the colors)."""
+    fc = face.FaceCube()
+    if fc.from_string(cubestring) is not True:
+        return False
+    cc = fc.to_cubie_cube()
+    return cc.verify() == cubie.CUBE_OK and cc.to_facelet_cube().to_string() == cubestring
+
+
+def test_valid_cubes():
+    assert cv.check(solved) == ''
+    assert cv.check([scrambled(seed) for seed in range(50)]) == [''] * 50
+
+
+corner, edge = cv.corner_facelets, cv.edge_facelets
+
+
+@pytest.mark.parametrize('cubestring, defect', (
+    (solved[:10] + 'X' + solved[11:], 'facelets not among URFDLB letters'),
+    (solved[:53], 'facelets not among URFDLB letters'),
+    (solved[:10] + 'U' + solved[11:], 'not 9 facelets per color'),
+    (swapped(solved, (4, 13)), 'wrong center facelets'),
+    (swapped(solved, (corner[0][0], edge[4][1])), 'invalid corner colors'),
+    (swapped(solved, (edge[0][0], edge[1][1])), 'invalid edge colors'),
+    (swapped(solved, (corner[0][0], corner[0][1]), (corner[0][0], corner[0][2])), 'corners twisted (orientation sum not multiple of 3)'),
+    (swapped(solved, (edge[0][0], edge[0][1])), 'edges flipped (orientation sum not even)'),
+    (swapped(solved, (edge[0][0], edge[1][0]), (edge[0][1], edge[1][1])), 'corners and edges permutation parity mismatch'),
+    ))
+def test_defects(cubestring, defect):
+    assert cv.check(cubestring) == defect
+    assert cv.check([solved, cubestring]) == ['', defect]
+
+
+def test_agrees_with_twophase():
+    rng = random.Random(0)
+    cubestrings = []
+    for seed in range(300):
+        cubestring = scrambled(seed)
+        pairs = [tuple(rng.sample([i for i in range(54) if i % 9 != 4], 2)) for _ in range(rng.randrange(3))]
+        cubestrings.append(swapped(cubestring, *pairs))
+    defects = cv.check(cubestrings)
+    assert [d == '' for d in defects] == [twophase_valid(c) for c in cubestrings]
+    assert 0 < defects.count('') < len(cubestrings)
@@ -0,0 +1,52 @@
+import random
+import pytest
+import robot_moves as cm
+import cube_simulator as sim
+import near_solved as ns
+
+
+def apply_moves(state, moves):
+    """ Returns the cube states (N x 54 array) after the solver moves (list of indexes)."""
+    for m in moves:
+        state = state[:, ns.face_turn_perms[m]]
+    return state
+
+
+def solved_state():
+    return sim.to_array([''.join([f * 9 for f in cm.faces])])
+
+
+@pytest.mark.parametrize('length', range(ns.MAX_DEPTH + 1))
+def test_encode_decode_round_trip(length):
+    rng = random.Random(length)
+    for _ in range(50):
+        solution = ''.join(cm.solver_moves[rng.randrange(18)] for _ in range(length))
+        assert ns.decode(ns.encode(solution)) == solution
+
+
+def test_too_long_solutions_are_rejected():
+    with pytest.raises(ValueError):
+        ns.encode('U1' * (ns.MAX_DEPTH + 1))
+    with pytest.raises(ValueError):
+        ns.build_index(ns.MAX_DEPTH + 1)
+
+
+def test_build_index_lookup_round_trip(tmp_path, monkeypatch):
+    depth = 3
+    ns.build_index(depth, str(tmp_path))
+    monkeypatch.setattr(ns, 'keys', None)
+    monkeypatch.setattr(ns, 'solutions', None)
+    ns.load(str(tmp_path))
+    assert ns.solutions.dtype == 'uint64'
+
+    rng = random.Random(0)
+    for length in range(depth + 1):
+        for _ in range(30):
+            state = apply_moves(solved_state(), [rng.randrange(18) for _ in range(length)])
+            solution = ns.lookup(sim.to_strings(state)[0])
+            assert solution is not None and len(solution) // 2 <= length
+            moves = [cm.solver_move_index[solution[i:i+2]] for i in range(0, len(solution), 2)]
+            assert sim.is_solved(apply_moves(state, moves))[0]
+
+    far = apply_moves(solved_state(), [0, 3, 6, 9, 12, 15, 1])   # 7 face turns, beyond the index depth
+    assert ns.lookup(sim.to_strings(far)[0]) is None
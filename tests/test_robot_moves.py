@@ -0,0 +1,131 @@
+import random
+import pytest
+import robot_moves as cm
+import cube_simulator as sim
+import near_solved as ns
+
+
+def scrambled(scramble):
+    """ Returns the cube status string after the solver moves of the scramble string, from the solved cube."""
+    state = sim.to_array([''.join([f * 9 for f in cm.faces])])
+    for i in range(0, len(scramble), 2):
+        state = state[:, ns.face_turn_perms[cm.solver_move_index[scramble[i:i+2]]]]
+    return sim.to_strings(state)[0]
+
+
+def inverse(solution):
+    return ''.join([solution[i] + str(4 - int(solution[i+1])) for i in range(len(solution) - 2, -1, -2)])
+
+
+def random_solutions(amount, length, seed):
+    rng = random.Random(seed)
+    return [''.join(cm.solver_moves[rng.randrange(18)] for _ in range(length)) for _ in range(amount)]
+
+
+def test_orientation_tables():
+    assert len(cm.orientations) == len(set(cm.orientations)) == 24
+    for o, orientation in enumerate(cm.orientations):
+        assert sorted(orientation) == sorted(cm.faces)
+        assert all(cm.faces.index(orientation[i]) % 3 == cm.faces.index(orientation[i+3]) % 3 for i in range(3))
+        assert cm.orientations[cm.flip_table[o]] == cm.orient_permute(orientation, cm.flip_perm)
+        assert cm.orientations[cm.spinCW_table[o]] == cm.orient_permute(orientation, cm.spinCW_perm)
+        assert cm.spinCCW_table[cm.spinCW_table[o]] == o
+        assert cm.bottom_face[o] == orientation[3]
+        assert cm.orient_apply(0, cm.orient_moves[o]) == o
+        for robot_seq, end in cm.robot_move_table[o]:
+            assert end == cm.orient_apply(o, robot_seq)
+
+
+def test_orientations_match_the_simulator():
+    solved = ''.join([f * 9 for f in cm.faces])
+    for o, orientation in enumerate(cm.orientations):
+        state = sim.to_strings(sim.apply_moves(sim.to_array([solved]), cm.orient_moves[o]))[0]
+        assert ''.join(state[9*f+4] for f in range(6)) == orientation
+
+
+@pytest.mark.parametrize('moves, optimized', (('S1S3', ''), ('R3R1', ''), ('F4', ''), ('F3F1R1', 'R1'),
+                                              ('R1S1S3R3', ''), ('F1S1S3F3', ''), ('F2R1S3', 'F2R1S3')))
+def test_peephole_rules(moves, optimized):
+    assert cm.optimize_moves(moves) == optimized
+
+
+def test_peephole_keeps_the_cube_and_saves_time():
+    rng = random.Random(5)
+    solved = sim.to_array([''.join([f * 9 for f in cm.faces])])
+    for _ in range(200):
+        moves = ''.join(rng.choice(('F1', 'F2', 'S1', 'S3', 'R1', 'R3')) for _ in range(rng.randrange(1, 30)))
+        optimized = cm.optimize_moves(moves)
+        assert (sim.apply_moves(solved, optimized) == sim.apply_moves(solved, moves)).all()
+        assert cm.robot_moves_time(optimized)[2] <= cm.robot_moves_time(moves)[2]
+
+
+@pytest.mark.parametrize('move', cm.solver_moves)
+def test_single_moves_are_solved(move):
+    cubestring = scrambled(inverse(move))
+    for planner in (True, False):
+        robot, moves, tot_moves = cm.robot_required_moves(move, '', planner)
+        assert sim.verify_programs([cubestring], [moves])[0]
+
+
+@pytest.mark.parametrize('length', (2, 8, 20))
+def test_planner_and_moves_dict_solve_the_same_cubes(length):
+    solutions = random_solutions(40, length, length)
+    cubestrings = [scrambled(inverse(s)) for s in solutions]
+    planned = [cm.robot_required_moves(s, '', True)[1] for s in solutions]
+    tabled = [cm.robot_required_moves(s, '', False)[1] for s in solutions]
+    assert sim.verify_programs(cubestrings, planned).all()
+    assert sim.verify_programs(cubestrings, tabled).all()
+
+
+def test_planner_is_not_slower_than_moves_dict():
+    for s in random_solutions(40, 20, 0):
+        planned = cm.robot_moves_time(cm.robot_required_moves(s, '', True)[1])[2]
+        tabled = cm.robot_moves_time(''.join(cm.table_moves(s)[0]))[2]
+        assert planned <= tabled
+
+
+@pytest.mark.parametrize('orientation', range(24))
+def test_start_orientations(orientation):
+    solutions = random_solutions(5, 12, orientation)
+    start = cm.orient_moves[orientation]          # robot moves bringing the cube to the start orientation
+    cubestrings = [scrambled(inverse(s)) for s in solutions]
+    for planner in (True, False):
+        moves = [start + cm.robot_required_moves(s, '', planner, orientation=orientation)[1] for s in solutions]
+        assert sim.verify_programs(cubestrings, moves).all()
+
+
+def test_default_translation_is_the_executed_moves_dict():
+    for s in random_solutions(20, 15, 2):
+        executed = cm.optimize_moves(''.join(cm.table_moves(s)[0]))
+        assert cm.robot_required_moves(s, '')[1] == executed
+    assert [r[1] for r in cm.translate_batch(random_solutions(5, 10, 3), workers=1)] == \
+           [cm.robot_required_moves(s, '')[1] for s in random_solutions(5, 10, 3)]
+
+
+def test_batch_translation_matches_single():
+    solutions = random_solutions(20, 15, 1)
+    batch = cm.translate_batch(solutions, planner=True, workers=1)
+    assert [r[1] for r in batch] == [cm.robot_required_moves(s, '', True)[1] for s in solutions]
+
+
+def test_timing_as_per_the_firmware_delays():
+    settings = {"TOP_COVER": {"TIME": {"FLIP_TO_CLOSE": 1, "FLIP_OPEN": 10}},
+                "CUBE_HOLDER": {"TIME": {"ROTATE": 100, "RELEASE": 1000}}}
+    assert cm.move_time('F1', 'open', settings) == (1, 'flip')
+    assert cm.move_time('F2', 'open', settings) == (12, 'flip')
+    assert cm.move_time('S1', 'flip', settings) == (110, 'open')
+    assert cm.move_time('S3', 'open', settings) == (100, 'open')
+    assert cm.move_time('R1', 'open', settings) == (1110, 'close')
+    assert cm.move_time('R3', 'close', settings) == (1100, 'close')
+    assert cm.robot_moves_time('F1S1R1', settings)[1] == {0: 1, 2: 111, 4: 1221}
+
+
+def test_rewrite_is_scored_on_the_executed_moves():
+    solutions = random_solutions(100, 20, 4)
+    rewritten = [cm.rewrite_solution(s) for s in solutions]
+    for s, (r, robot_time) in zip(solutions, rewritten):
+        assert robot_time == cm.executed_time(r)
+        assert robot_time <= cm.executed_time(s)
+    cubestrings = [scrambled(inverse(s)) for s in solutions]
+    executed = [cm.robot_required_moves(r, '')[1] for r, robot_time in rewritten]
+    assert sim.verify_programs(cubestrings, executed).all()
@@ -0,0 +1,91 @@
+import json
+import random
+from collections import OrderedDict
+import pytest
+import robot_moves as cm
+import cube_simulator as sim
+import near_solved as ns
+import solution_cache as sc
+
+
+def scrambled(scramble):
+    """ Returns the cube status string after the solver moves of the scramble string, from the solved cube."""
+    state = sim.to_array([''.join([f * 9 for f in cm.faces])])
+    for i in range(0, len(scramble), 2):
+        state = state[:, ns.face_turn_perms[cm.solver_move_index[scramble[i:i+2]]]]
+    return sim.to_strings(state)[0]
+
+
+def inverse(solution):
+    return ''.join([solution[i] + str(4 - int(solution[i+1])) for i in range(len(solution) - 2, -1, -2)])
+
+
+def solves(cubestring, solution):
+    state = sim.to_array([cubestring])
+    for i in range(0, len(solution), 2):
+        state = state[:, ns.face_turn_perms[cm.solver_move_index[solution[i:i+2]]]]
+    return sim.is_solved(state)[0]
+
+
+def transformed(cubestring, symmetry):
+    """ Returns the cube status string transformed by the symmetry, relabelled as per its center facelets."""
+    state = ''.join([cubestring[i] for i in sc.symmetry_perms[symmetry]])
+    relabel = {state[9*f+4]: cm.faces[f] for f in range(6)}
+    return ''.join([relabel[c] for c in state])
+
+
+@pytest.fixture
+def empty_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)                   # the cache file is in the working folder
+    monkeypatch.setattr(sc, 'cache', OrderedDict())
+    monkeypatch.setattr(sc, 'unsaved', 0)
+    return str(tmp_path / sc.CACHE_FILE)
+
+
+def random_solutions(amount, length, seed):
+    rng = random.Random(seed)
+    return [''.join(cm.solver_moves[rng.randrange(18)] for _ in range(length)) for _ in range(amount)]
+
+
+@pytest.mark.parametrize('symmetry', range(48))
+def test_symmetric_cubes_share_the_canonical_form(symmetry):
+    for solution in random_solutions(5, 12, symmetry):
+        cubestring = scrambled(inverse(solution))
+        key, s = sc.canonical(cubestring)
+        assert sc.canonical(transformed(cubestring, symmetry))[0] == key
+        assert transformed(cubestring, s) == key
+
+
+@pytest.mark.parametrize('symmetry', range(48))
+def test_mapped_solutions_solve_the_transformed_cube(symmetry):
+    for solution in random_solutions(5, 12, symmetry):
+        cubestring = scrambled(inverse(solution))
+        mapped = sc.map_solution(solution, symmetry, True)
+        assert solves(transformed(cubestring, symmetry), mapped)
+        assert sc.map_solution(mapped, symmetry, False) == solution
+
+
+def test_lookup_of_symmetric_cubes(empty_cache):
+    solution = random_solutions(1, 15, 0)[0]
+    cubestring = scrambled(inverse(solution))
+    sc.store(cubestring, solution)
+    for symmetry in range(48):
+        other = transformed(cubestring, symmetry)
+        assert solves(other, sc.lookup(other))
+    assert sc.lookup(cubestring, max_length=14) is None
+
+
+def test_saves_are_batched(empty_cache, monkeypatch):
+    monkeypatch.setattr(sc, 'save_every', 3)
+    solutions = random_solutions(4, 10, 1)
+    for solution in solutions[:2]:
+        sc.store(scrambled(inverse(solution)), solution)
+    with pytest.raises(FileNotFoundError):
+        open(empty_cache)
+    sc.store(scrambled(inverse(solutions[2])), solutions[2])
+    with open(empty_cache) as f:
+        assert len(json.load(f)) == 3
+    sc.store(scrambled(inverse(solutions[3])), solutions[3])
+    sc.flush()
+    with open(empty_cache) as f:
+        assert len(json.load(f)) == 4
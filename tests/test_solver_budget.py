@@ -0,0 +1,36 @@
+import json
+import solver_budget as sb
+
+
+budget = {"MIN_TIME": 0.5, "MAX_TIME": 8, "WINDOW": 1.0, "DECAY": 0.5, "LOG": True}
+
+
+def test_logging_is_on_by_default():
+    assert sb.default_budget["LOG"] is True
+
+
+def test_continues_while_the_saving_pays_the_solving():
+    history = [(0.2, 60000), (1.0, 56000), (1.8, 52000)]   # 4 s of robot time saved in the last window
+    assert sb.budget_stop(history, 2.0, budget) is None
+
+
+def test_stops_once_the_saving_doesnt_pay_the_solving():
+    history = [(0.2, 60000), (0.8, 59000), (1.5, 58500)]   # 0.5 s saved in the last window, 0.25 s expected
+    assert 'expected saving 250 ms' in sb.budget_stop(history, 2.0, budget)
+
+
+def test_continues_before_min_time_and_a_full_window():
+    assert sb.budget_stop([], 3.0, budget) is None                      # no solutions yet
+    assert sb.budget_stop([(0.1, 60000)], 0.4, budget) is None          # min time not reached
+    assert sb.budget_stop([(0.6, 60000)], 1.2, budget) is None          # first solution within the last window
+
+
+def test_stops_at_max_time():
+    assert sb.budget_stop([], 8.0, budget) == 'max time 8 s'
+
+
+def test_settings_file_completes_the_defaults(tmp_path):
+    fname = tmp_path / 'solver_budget.json'
+    fname.write_text(json.dumps({"MAX_TIME": 3}))
+    assert sb.load_budget_settings(str(fname)) == dict(sb.default_budget, MAX_TIME=3)
+    assert sb.load_budget_settings(str(tmp_path / 'missing.json')) == sb.default_budget
@@ -0,0 +1,102 @@
+import sys
+import threading
+import types
+from multiprocessing.connection import Listener
+import pytest
+import solver_server as ss
+
+
+def fake_solve_anytime(cubestring, report, max_length, timeout, robot_settings, orientations, cancel):
+    """ Solver stand-in: 'slow' cubes wait for the cancel event, the other ones are solved at once."""
+    if cubestring.startswith('slow'):
+        cancel.wait(float(cubestring[4:] or 5))
+        if cancel.is_set():
+            return
+    if cubestring.startswith('bad'):
+        report('Error: ' + cubestring, None, True)
+        return
+    report(cubestring + ' (0f)', 0, True)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """ In-process solver server, with the fake solver, and the client connected to it."""
+    monkeypatch.setitem(sys.modules, 'cube_solver', types.SimpleNamespace(solve_anytime=fake_solve_anytime))
+    monkeypatch.setattr(ss, 'KEY_FILE', str(tmp_path / 'key'))
+    listener = Listener(('localhost', 0), authkey=ss.auth_key())
+    threading.Thread(target=lambda: ss.handle_client(listener.accept()), daemon=True).start()
+    ss.connect(address=listener.address)
+    yield listener
+    with ss.client_lock:
+        ss.client_conn.close()
+        ss.client_conn = None
+    listener.close()
+
+
+def test_auth_key_is_private_and_stable(tmp_path):
+    fname = str(tmp_path / 'key')
+    key = ss.auth_key(fname)
+    assert len(key) == ss.KEY_LENGTH
+    assert ss.auth_key(fname) == key
+    if sys.platform != 'win32':
+        import os, stat
+        assert stat.S_IMODE(os.stat(fname).st_mode) == 0o600
+
+
+def test_warmup_connects_to_the_server(server):
+    assert ss.warmup(server.address, wait=1)
+    assert ss.solve('cube') == 'cube (0f)'
+
+
+def test_immediate_replies_are_not_lost(server):
+    for i in range(200):
+        assert ss.solve(f'cube{i}') == f'cube{i} (0f)'
+    assert not ss.replies
+
+
+def test_submit_returns_the_reply_queue(server):
+    req_id, q = ss.submit('cube')
+    assert q.get(timeout=5) == ('cube (0f)', 0, True)
+
+
+def test_cancel(server):
+    req_id, q = ss.submit('slow')
+    ss.cancel_request(req_id)
+    assert q.get(timeout=5) == (None, None, True)
+    assert ss.solve('cube') == 'cube (0f)'
+
+
+def test_solve_first_cancels_the_others(server):
+    index, solution = ss.solve_first(['bad', 'cube', 'slow'])
+    assert (index, solution) == (1, 'cube (0f)')
+    assert ss.solve('cube') == 'cube (0f)'
+
+
+def test_solve_first_prefers_the_earlier_candidates(server):
+    index, solution = ss.solve_first(['slow0.3', 'cube'])   # the preferred candidate is solved later
+    assert (index, solution) == (0, 'slow0.3 (0f)')
+    index, solution = ss.solve_first(['bad1', 'slow0.2', 'bad2'])
+    assert (index, solution) == (1, 'slow0.2 (0f)')
+
+
+def test_solve_first_without_solutions(server):
+    assert ss.solve_first(['bad1', 'bad2']) == (None, 'Error: bad2')
+
+
+def test_server_with_another_key_is_not_available(tmp_path, monkeypatch):
+    monkeypatch.setattr(ss, 'KEY_FILE', str(tmp_path / 'key'))
+    listener = Listener(('localhost', 0), authkey=b'another key')
+
+    def accept():
+        try:
+            listener.accept()
+        except ss.connection_errors:
+            pass
+
+    threading.Thread(target=accept, daemon=True).start()
+    with pytest.raises(ss.connection_errors):
+        ss.connect(address=listener.address)
+    assert ss.client_conn is None
+    threading.Thread(target=accept, daemon=True).start()
+    assert ss.warmup(listener.address, wait=1) is False   # the solver is not available, the warm-up ends anyhow
+    listener.close()
@@ -0,0 +1,96 @@
+import array
+import json
+import os
+import subprocess
+import sys
+import pytest
+import solver_tables as st
+
+
+def write_table(fname, typecode, values):
+    with open(fname, 'wb') as f:
+        array.array(typecode, values).tofile(f)
+
+
+@pytest.mark.parametrize('typecode', ('B', 'b', 'H', 'I'))
+def test_empty_arrays_map_the_table_file(tmp_path, typecode):
+    fname = str(tmp_path / 'table')
+    values = list(range(100))
+    write_table(fname, typecode, values)
+    table = st.mapping_array(typecode)
+    assert isinstance(table, st.MappedArray)
+    assert table.itemsize == array.array(typecode).itemsize
+    with open(fname, 'rb') as f:
+        table.fromfile(f, len(values))
+    assert list(table.view) == values
+    assert len(table) == len(values) and table[42] == 42
+
+
+def test_wrong_table_size_is_rejected(tmp_path):
+    fname = str(tmp_path / 'table')
+    write_table(fname, 'H', range(10))
+    with open(fname, 'rb') as f, pytest.raises(ValueError):
+        st.mapping_array('H').fromfile(f, 11)
+
+
+def test_arrays_with_values_are_arrays():
+    table = st.mapping_array('H', [1, 2, 3])
+    assert isinstance(table, array.array) and list(table) == [1, 2, 3]
+
+
+def test_tables_are_mapped_while_importing_without_changing_sys_modules(tmp_path, monkeypatch):
+    write_table(str(tmp_path / 'table'), 'H', range(10))
+    package = tmp_path / 'mapped_pkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'tables.py').write_text(
+        'import sys\n'
+        'import array as ar\n'
+        'array_module = sys.modules["array"]\n'
+        'table = ar.array("H")\n'
+        f'with open({str(tmp_path / "table")!r}, "rb") as fh:\n'
+        '    table.fromfile(fh, 10)\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import mapped_pkg
+    mod = st.import_mapped('mapped_pkg.tables')
+    assert sys.modules['mapped_pkg.tables'] is mod and mapped_pkg.tables is mod
+    assert mod.array_module is array and mod.ar is array
+    assert isinstance(mod.table, st.MappedArray) and list(mod.table.view) == list(range(10))
+    monkeypatch.delitem(sys.modules, 'mapped_pkg.tables')
+    monkeypatch.delitem(sys.modules, 'mapped_pkg')
+
+
+def test_generated_tables_are_checked(tmp_path):
+    workdir = tmp_path / 'work'
+    workdir.mkdir()
+    name = 'co_sym'
+    (workdir / name).write_bytes(bytes(st.table_sizes[name]))
+    st.check_generated(str(workdir), [name], str(tmp_path))
+    (workdir / name).write_bytes(bytes(st.table_sizes[name] - 1))
+    with pytest.raises(ValueError):
+        st.check_generated(str(workdir), [name], str(tmp_path))
+
+
+def test_generated_tables_must_match_the_index(tmp_path):
+    workdir = tmp_path / 'work'
+    workdir.mkdir()
+    name = 'co_sym'
+    (workdir / name).write_bytes(bytes(st.table_sizes[name]))
+    index = {name: {'size': st.table_sizes[name], 'mtime_ns': 0, 'sha256': '0' * 64}}
+    (tmp_path / st.INDEX_FILE).write_text(json.dumps(index))
+    with pytest.raises(ValueError):
+        st.check_generated(str(workdir), [name], str(tmp_path))
+
+
+def test_stale_workdirs_are_removed(tmp_path):
+    running = tmp_path / f'tmp_{os.getpid()}_a'
+    running.mkdir()
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    stale = tmp_path / f'tmp_{dead.pid}_b'
+    (stale / 'twophase').mkdir(parents=True)
+    table = tmp_path / 'co_sym'
+    table.write_bytes(b'')
+    st.remove_stale_workdirs(str(tmp_path))
+    assert running.is_dir() and table.is_file()
+    assert not stale.exists() or os.name == 'nt'